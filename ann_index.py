@@ -0,0 +1,187 @@
+import time
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+## Approximate nearest-neighbor search for the NumPy backend: an inverted-file (IVF)
+## index. Vectors are clustered with spherical k-means into nlist lists at build time,
+## and a query only scores the vectors in its nprobe closest lists. Rows refer to the
+## matrix of the owning NumpyVectorIndex, so no vector is stored twice.
+
+# Training points per list used by k-means; more gives better centroids, slower builds
+TRAIN_POINTS_PER_LIST = 64
+# Rows scored per matmul while assigning vectors to lists
+ASSIGN_BLOCK_SIZE = 65536
+
+
+def default_nlist(num_vectors: int) -> int:
+    """Rule-of-thumb number of lists: about 4 * sqrt(n)."""
+    return max(1, min(num_vectors, int(4 * np.sqrt(num_vectors))))
+
+
+class IVFIndex:
+    """Inverted-file index over the rows of an external, L2-normalized matrix."""
+
+    def __init__(self, nlist: int = 256, nprobe: int = 8, n_iter: int = 20, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        # List id of every row of the owning matrix
+        self.assignments = np.empty(0, dtype=np.int32)
+        # Rows grouped by list (CSR layout), rebuilt lazily after inserts and deletes
+        self._order = None
+        self._offsets = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), ASSIGN_BLOCK_SIZE):
+            block = vectors[start:start + ASSIGN_BLOCK_SIZE]
+            assignments[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignments
+
+    def train(self, vectors: np.ndarray):
+        """Fit centroids with spherical k-means on a sample of vectors."""
+        rng = np.random.default_rng(self.seed)
+        self.nlist = max(1, min(self.nlist, len(vectors)))
+        sample_size = min(len(vectors), self.nlist * TRAIN_POINTS_PER_LIST)
+        sample = np.asarray(vectors[rng.choice(len(vectors), sample_size, replace=False)], dtype=np.float32)
+        self.centroids = sample[rng.choice(sample_size, self.nlist, replace=False)].copy()
+
+        for _ in range(self.n_iter):
+            labels = self._assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=self.nlist)
+            # Re-seed empty lists with random sample points
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.centroids = (sums / norms).astype(np.float32)
+
+    def build(self, vectors: np.ndarray):
+        """Train on vectors and assign every one of them to a list."""
+        self.train(vectors)
+        self.assignments = self._assign(vectors)
+        self._order = None
+
+    def add(self, vectors: np.ndarray):
+        """Append new rows; centroids are kept, so recall degrades slowly as the corpus drifts."""
+        self.assignments = np.concatenate([self.assignments, self._assign(vectors)])
+        self._order = None
+
+    def update(self, rows: np.ndarray, vectors: np.ndarray):
+        """Reassign rows whose vectors were replaced in place."""
+        self.assignments[rows] = self._assign(vectors)
+        self._order = None
+
+    def keep(self, mask: np.ndarray):
+        """Drop rows where mask is False, mirroring a compaction of the owning matrix."""
+        self.assignments = self.assignments[mask]
+        self._order = None
+
+    def _lists(self):
+        if self._order is None:
+            self._order = np.argsort(self.assignments, kind="stable")
+            self._offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+            self._offsets[1:] = np.cumsum(np.bincount(self.assignments, minlength=self.nlist))
+        return self._order, self._offsets
+
+    def search(self, matrix: Optional[np.ndarray], queries: np.ndarray, top_k: int, nprobe: Optional[int] = None,
+               score_rows: Optional[Callable[[np.ndarray, np.ndarray], np.ndarray]] = None):
+        """Return (scores, rows) shaped (num_queries, top_k), padded with -inf / -1.
+
+        Candidates are scored against matrix, or with score_rows(query, rows) when given
+        (e.g. over quantized codes instead of the float32 rows).
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        order, offsets = self._lists()
+        scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        rows = np.full((len(queries), top_k), -1, dtype=np.int64)
+
+        centroid_scores = queries @ self.centroids.T
+        if nprobe < self.nlist:
+            probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.broadcast_to(np.arange(self.nlist), centroid_scores.shape)
+
+        for i, query in enumerate(queries):
+            candidates = np.concatenate([order[offsets[j]:offsets[j + 1]] for j in probes[i]])
+            if len(candidates) == 0:
+                continue
+            if score_rows is not None:
+                candidate_scores = score_rows(query, candidates)
+            else:
+                candidate_scores = matrix[candidates] @ query
+            k = min(top_k, len(candidates))
+            best = np.argpartition(-candidate_scores, k - 1)[:k] if k < len(candidates) else np.arange(k)
+            best = best[np.argsort(-candidate_scores[best])]
+            scores[i, :k] = candidate_scores[best]
+            rows[i, :k] = candidates[best]
+        return scores, rows
+
+    def save(self, path: str):
+        np.savez(path, centroids=self.centroids, assignments=self.assignments,
+                 params=np.array([self.nlist, self.nprobe, self.n_iter, self.seed]))
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        data = np.load(path)
+        nlist, nprobe, n_iter, seed = (int(value) for value in data["params"])
+        index = cls(nlist=nlist, nprobe=nprobe, n_iter=n_iter, seed=seed)
+        index.centroids = data["centroids"]
+        index.assignments = data["assignments"]
+        return index
+
+
+def measure_recall(index, queries: np.ndarray, top_k: int = 10, nprobes: Optional[List[int]] = None) -> List[Dict]:
+    """Compare the ANN path of a NumpyVectorIndex against exact search on the same corpus.
+
+    Returns one row per nprobe with recall@k and per-query latency, plus a row for
+    exact search, so an operating point can be picked with choose_nprobe.
+    """
+    if index.ann is None:
+        raise ValueError("Build the ANN index first with index.build_ann()")
+    if nprobes is None:
+        nprobes = sorted({1, 2, 4, 8, 16, 32, 64, index.ann.nlist} & set(range(1, index.ann.nlist + 1)))
+
+    def timed(search):
+        latencies = []
+        results = []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(search(query)[1][0])
+            latencies.append((time.perf_counter() - start) * 1000)
+        return results, np.array(latencies)
+
+    exact_rows, exact_latency = timed(lambda query: index.search(query, top_k, exact=True))
+    report = [{
+        "nprobe": None,
+        "recall": 1.0,
+        "mean_latency_ms": float(exact_latency.mean()),
+        "p95_latency_ms": float(np.percentile(exact_latency, 95)),
+    }]
+    for nprobe in nprobes:
+        ann_rows, latency = timed(lambda query: index.search(query, top_k, nprobe=nprobe))
+        hits = sum(len(set(a[a >= 0]) & set(e)) for a, e in zip(ann_rows, exact_rows))
+        report.append({
+            "nprobe": nprobe,
+            "recall": hits / max(1, sum(len(e) for e in exact_rows)),
+            "mean_latency_ms": float(latency.mean()),
+            "p95_latency_ms": float(np.percentile(latency, 95)),
+        })
+    return report
+
+
+def choose_nprobe(report: List[Dict], latency_slo_ms: float, min_recall: float = 0.9) -> Optional[int]:
+    """Smallest nprobe meeting min_recall within the p95 latency SLO, or None if none does."""
+    for row in report:
+        if row["nprobe"] is not None and row["recall"] >= min_recall and row["p95_latency_ms"] <= latency_slo_ms:
+            return row["nprobe"]
+    return None
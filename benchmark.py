@@ -0,0 +1,462 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from chunking import chunk_text, iter_chunks, iter_token_spans, whitespace_offsets
+from document_loader import preprocess_text
+from ingest_pipeline import run_ingestion
+from numpy_vectordb import (
+    NumpyVectorIndex, evaluate_projection, evaluate_quantization, search_numpy, search_numpy_many, upload_embeddings_to_numpy,
+)
+from hybrid_search import HYBRID_MODES, search_hybrid_many
+from pinecone_local import LocalPineconeIndex
+from projection import PROJECTIONS
+from quantization import QUANTIZERS
+from pinecone_vectordb import search_pinecone, search_pinecone_many, upload_embeddings_to_pinecone
+
+## Offline benchmark suite for the hot paths of the pipeline: chunking, text
+## preprocessing, ingestion and retrieval. It runs on a synthetic corpus with a
+## deterministic hashing embedder, so results are repeatable and measure this code
+## rather than the embedding model or the network.
+##
+##   python benchmark.py run --output before.json
+##   python benchmark.py run --output after.json
+##   python benchmark.py compare before.json after.json
+##
+## Chroma runs in-memory when chromadb is installed; Redis is only benchmarked with
+## --backends ...,redis since it needs a running server. numpy_<method> backends search
+## quantized codes with rescoring and also report memory reduction and recall;
+## numpy_pca<dim> and numpy_truncate<dim> search an index projected to dim dimensions and
+## report its size and recall next to the unprojected index. The numpy backend also times
+## BM25 and hybrid retrieval (hybrid_search.py) over the same chunks.
+
+DEFAULT_BACKENDS = ["numpy", "numpy_ann", "numpy_float16", "numpy_int8", "numpy_binary", "numpy_pca128",
+                    "pinecone_local", "chroma"]
+# Relative slowdown of a benchmark's median time that compare reports as a regression
+REGRESSION_THRESHOLD = 0.10
+
+# Words the synthetic lecture notes are drawn from; frequent terms first
+VOCABULARY = (
+    "the of and to a in is database data key value redis index vector query node "
+    "document collection store graph transaction consistency replication partition "
+    "cluster embedding similarity search mongodb neo4j relational sql schema table "
+    "row column join tree btree hash memory disk cache latency throughput write read "
+    "primary secondary shard availability cap theorem acid base eventual isolation "
+    "commit rollback lock concurrency json bson aggregation pipeline match group sort "
+    "cypher relationship property label traversal path shortest centrality pagerank "
+    "avl rotation balance insert delete height leaf root binary pointer page block "
+    "lecture example note slide figure chapter semester course student exam python"
+).split()
+
+
+def generate_corpus(
+    num_docs: int = 20,
+    pages_per_doc: int = 10,
+    words_per_page: int = 400,
+    seed: int = 0,
+) -> List[Tuple[str, str]]:
+    """Synthetic lecture notes as (source, page_text) pairs, grouped by source.
+
+    Words follow a Zipf-like distribution over VOCABULARY, with some punctuation and
+    line breaks so preprocess_text has work to do.
+    """
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, len(VOCABULARY) + 1)
+    weights /= weights.sum()
+    punctuation = np.array(["", "", "", "", ",", ".", ":", "()", "\n"])
+
+    pages = []
+    for doc in range(num_docs):
+        for _ in range(pages_per_doc):
+            words = np.array(VOCABULARY)[rng.choice(len(VOCABULARY), words_per_page, p=weights)]
+            marks = punctuation[rng.integers(0, len(punctuation), words_per_page)]
+            pages.append((f"lecture_{doc:03d}.pdf", " ".join(word + mark for word, mark in zip(words, marks))))
+    return pages
+
+
+def generate_queries(pages: List[Tuple[str, str]], num_queries: int = 100, words_per_query: int = 12,
+                     seed: int = 1) -> List[str]:
+    """Questions made of word runs taken from the corpus, so every query has a good match."""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for page in rng.integers(0, len(pages), num_queries):
+        words = pages[page][1].split()
+        start = int(rng.integers(0, max(1, len(words) - words_per_query)))
+        queries.append(" ".join(words[start:start + words_per_query]))
+    return queries
+
+
+class FakeEmbedder:
+    """Deterministic bag-of-words embedder: each word adds +-1 to a hashed dimension.
+
+    Similar texts get similar vectors, so retrieval results are meaningful, and it is
+    cheap enough that the pipeline around it dominates the measurements.
+    """
+
+    def __init__(self, embedding_dim: int = 384):
+        self.model_name = f"fake-hash-{embedding_dim}"
+        self.embedding_dim = embedding_dim
+        self._buckets: Dict[str, Tuple[int, float]] = {}
+
+    def _bucket(self, word: str) -> Tuple[int, float]:
+        bucket = self._buckets.get(word)
+        if bucket is None:
+            digest = zlib.crc32(word.encode("utf-8"))
+            bucket = self._buckets[word] = (digest % self.embedding_dim, 1.0 if digest & (1 << 31) else -1.0)
+        return bucket
+
+    def embed_chunks(self, chunks: List[str], **kwargs) -> np.ndarray:
+        embeddings = np.zeros((len(chunks), self.embedding_dim), dtype=np.float32)
+        for row, chunk in enumerate(chunks):
+            for word in chunk.lower().split():
+                column, sign = self._bucket(word)
+                embeddings[row, column] += sign
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms
+
+    def get_embedding_dimension(self) -> int:
+        return self.embedding_dim
+
+
+def measure(function: Callable[[], Any], repeat: int = 5, warmup: int = 1,
+            setup: Optional[Callable[[], None]] = None) -> Dict[str, float]:
+    """Time function repeat times (after warmup runs); setup runs untimed before each call."""
+    timings = []
+    for run in range(warmup + repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if run >= warmup:
+            timings.append(elapsed)
+    return {
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "mean_s": statistics.mean(timings),
+        "stdev_s": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "repeat": repeat,
+    }
+
+
+def _with_items(result: Dict[str, float], items: int, unit: str) -> Dict[str, Any]:
+    result["items"] = items
+    result["unit"] = unit
+    result[f"{unit}_per_sec"] = items / result["median_s"] if result["median_s"] else float("inf")
+    return result
+
+
+def _quietly(function: Callable[..., Any]) -> Callable[..., Any]:
+    """Drop the progress prints of upload helpers, which would dominate small batches."""
+    def wrapper(*args, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def _numpy_variant(name: str) -> Tuple[Optional[str], Optional[str], Optional[int]]:
+    """(quantization, projection method, projection dim) of a numpy_* backend name."""
+    variant = name[len("numpy_"):] if name.startswith("numpy_") else ""
+    if variant in QUANTIZERS:
+        return variant, None, None
+    for method in PROJECTIONS:
+        if variant.startswith(method) and variant[len(method):].isdigit():
+            return None, method, int(variant[len(method):])
+    return None, None, None
+
+
+def _backend(name: str, dimension: int):
+    """Return (create, upload_batch, finish, search, search_many, teardown) for a backend.
+
+    create() returns a fresh, empty index; upload_batch(index, embeddings, documents, ids)
+    takes the {"source", "offset", "text"} documents produced by run_ingestion, and
+    finish(index, count) waits until count vectors are searchable.
+    """
+    def no_wait(index, count):
+        pass
+
+    if name in ("numpy", "numpy_ann") or any(_numpy_variant(name)):
+        def upload_numpy(index, embeddings, documents, ids):
+            upload_embeddings_to_numpy(index, embeddings, [document["text"] for document in documents], ids)
+        return (lambda: NumpyVectorIndex(dimension), upload_numpy, no_wait,
+                search_numpy, search_numpy_many, lambda index: None)
+
+    if name == "pinecone_local":
+        return (lambda: LocalPineconeIndex(dimension), upload_embeddings_to_pinecone, no_wait,
+                search_pinecone, search_pinecone_many, lambda index: None)
+
+    if name == "chroma":
+        from chroma_vectordb import get_chroma_client, search_chroma, search_chroma_many, upload_embeddings_to_chroma
+        client = get_chroma_client(persist=False)
+        collection_name = "ds4300_benchmark"
+
+        def create_chroma():
+            with contextlib.suppress(Exception):
+                client.delete_collection(collection_name)
+            return client.create_collection(collection_name, metadata={"hnsw:space": "cosine"})
+
+        def upload_chroma(collection, embeddings, documents, ids):
+            upload_embeddings_to_chroma(collection, embeddings, [document["text"] for document in documents], ids)
+        return (create_chroma, upload_chroma, no_wait, search_chroma, search_chroma_many,
+                lambda collection: client.delete_collection(collection_name))
+
+    if name == "redis":
+        from redis_vectordb import (
+            INDEX_NAME, delete_index, initialize_redis_index, search_redis, search_redis_many,
+            upload_embeddings_to_redis,
+        )
+        index_name = f"{INDEX_NAME}_benchmark"
+        key_prefix = "benchmark:"
+
+        def create_redis():
+            # Drop leftovers of an interrupted run, then start from an empty index
+            client = initialize_redis_index(dimension, index_name=index_name, key_prefix=key_prefix)
+            delete_index(client, delete_documents=True, index_name=index_name)
+            return initialize_redis_index(dimension, index_name=index_name, key_prefix=key_prefix)
+
+        def upload_redis(client, embeddings, documents, ids):
+            upload_embeddings_to_redis(client, embeddings, documents, ids, key_prefix=key_prefix)
+
+        def wait_for_redis(client, count):
+            # Redis indexes hashes asynchronously after HSET returns
+            while int(client.ft(index_name).info()["num_docs"]) < count:
+                time.sleep(0.05)
+        return (
+            create_redis, upload_redis, wait_for_redis,
+            lambda client, query, top_k: search_redis(client, query, top_k, index_name),
+            lambda client, queries, top_k: search_redis_many(client, queries, top_k, index_name),
+            lambda client: delete_index(client, delete_documents=True, index_name=index_name),
+        )
+
+    raise ValueError(f"Unknown backend: {name}")
+
+
+def run_benchmarks(
+    num_docs: int = 20,
+    pages_per_doc: int = 10,
+    words_per_page: int = 400,
+    num_queries: int = 100,
+    chunk_size: int = 500,
+    overlap: int = 100,
+    top_k: int = 5,
+    embedding_dim: int = 384,
+    repeat: int = 5,
+    backends: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Run every benchmark and return {"meta": ..., "results": {name: timings}}."""
+    backends = DEFAULT_BACKENDS if backends is None else backends
+    pages = generate_corpus(num_docs, pages_per_doc, words_per_page)
+    queries = generate_queries(pages, num_queries)
+    embedder = FakeEmbedder(embedding_dim)
+    documents: Dict[str, List[str]] = {}
+    for source, text in pages:
+        documents.setdefault(source, []).append(text)
+    documents = {source: " ".join(texts) for source, texts in documents.items()}
+    total_words = sum(len(text.split()) for _, text in pages)
+    total_chunks = sum(len(chunk_text(text, chunk_size, overlap)) for text in documents.values())
+    results: Dict[str, Dict[str, Any]] = {}
+
+    def record(name: str, result: Dict[str, Any]):
+        results[name] = result
+        print(f"{name:<36} median {result['median_s'] * 1000:10.2f} ms"
+              f"   {result[result['unit'] + '_per_sec']:14,.0f} {result['unit']}/s")
+
+    # Text processing
+    record("chunk_text", _with_items(measure(
+        lambda: [chunk_text(text, chunk_size, overlap) for text in documents.values()], repeat), total_chunks, "chunks"))
+    record("iter_chunks", _with_items(measure(
+        lambda: sum(1 for _ in iter_chunks(pages, chunk_size, overlap)), repeat), total_chunks, "chunks"))
+    record("iter_token_spans", _with_items(measure(
+        lambda: sum(1 for _ in iter_token_spans(pages, whitespace_offsets, chunk_size, overlap)), repeat),
+        total_chunks, "chunks"))
+    record("preprocess_text", _with_items(measure(
+        lambda: [preprocess_text(text) for _, text in pages], repeat), total_words, "words"))
+    chunks = [chunk for _, _, chunk in iter_chunks(pages, chunk_size, overlap)]
+    record("fake_embed", _with_items(measure(lambda: embedder.embed_chunks(chunks), repeat), len(chunks), "chunks"))
+    query_embeddings = embedder.embed_chunks(queries)
+
+    for backend in backends:
+        try:
+            create, upload_batch, finish, search, search_many, teardown = _backend(backend, embedding_dim)
+            upload_batch = _quietly(upload_batch)
+            state = {"index": None}
+
+            def fresh_index():
+                if state["index"] is not None:
+                    teardown(state["index"])
+                state["index"] = create()
+
+            def ingest():
+                run_ingestion("", embedder, lambda e, d, i: upload_batch(state["index"], e, d, i),
+                              chunk_size, overlap, pages=pages)
+                finish(state["index"], total_chunks)
+
+            record(f"ingest.{backend}", _with_items(
+                measure(_quietly(ingest), repeat, setup=fresh_index), total_chunks, "chunks"))
+
+            index = state["index"]
+            quantization, projection, projection_dim = _numpy_variant(backend)
+            projection_report = None
+            if backend == "numpy_ann":
+                _quietly(index.build_ann)()
+            elif quantization is not None:
+                _quietly(index.quantize)(quantization)
+            elif projection is not None:
+                projection_report = evaluate_projection(index, query_embeddings, [projection_dim], top_k, projection)
+                _quietly(index.project)(projection, projection_dim)
+
+            record(f"retrieve.{backend}", _with_items(measure(
+                lambda: [search(index, query, top_k) for query in query_embeddings], repeat), num_queries, "queries"))
+            record(f"retrieve_many.{backend}", _with_items(measure(
+                lambda: search_many(index, query_embeddings, top_k), repeat), num_queries, "queries"))
+            if backend == "numpy":
+                # Lexical and hybrid retrieval over the same chunks
+                _quietly(index.build_lexical)()
+                for mode in HYBRID_MODES:
+                    record(f"retrieve_many.hybrid_{mode}", _with_items(measure(
+                        lambda: search_hybrid_many(index, query_embeddings, top_k, queries, mode), repeat),
+                        num_queries, "queries"))
+            if projection_report is not None:
+                baseline, report = projection_report
+                results[f"retrieve.{backend}"].update(
+                    dim=report["dim"], index_mb=report["index_mb"], recall=report["recall"],
+                    full_dim=baseline["dim"], full_index_mb=baseline["index_mb"])
+                print(f"{'':<36} {baseline['dim']} -> {report['dim']} dims, {report['index_mb']:.2f} MB "
+                      f"(from {baseline['index_mb']:.2f} MB), recall@{top_k} {report['recall']:.3f}")
+            if quantization is not None:
+                report = _quietly(evaluate_quantization)(index, query_embeddings, top_k, [quantization])[0]
+                results[f"retrieve.{backend}"].update(report)
+                print(f"{'':<36} {report['scan_reduction']:.1f}x less scanned, {report['stored_mb']:.2f} MB stored "
+                      f"(float32 {report['float32_mb']:.2f} MB), recall@{top_k} "
+                      f"{report['recall_rescored']:.3f} rescored / {report['recall_coarse']:.3f} coarse")
+            teardown(index)
+        except ImportError as e:
+            print(f"Skipping {backend}: {e}")
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": f"{platform.system()} {platform.machine()} {platform.processor()}".strip(),
+            "params": {
+                "num_docs": num_docs, "pages_per_doc": pages_per_doc, "words_per_page": words_per_page,
+                "num_queries": num_queries, "chunk_size": chunk_size, "overlap": overlap, "top_k": top_k,
+                "embedding_dim": embedding_dim, "repeat": repeat, "backends": backends,
+            },
+        },
+        "results": results,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any],
+                    threshold: float = REGRESSION_THRESHOLD) -> List[Dict[str, Any]]:
+    """Compare median times benchmark by benchmark; flags slowdowns above threshold."""
+    if baseline["meta"]["params"] != current["meta"]["params"]:
+        print("Warning: the two runs used different parameters; ratios are not comparable")
+    if baseline["meta"].get("machine") != current["meta"].get("machine"):
+        print("Warning: the two runs come from different machines")
+
+    rows = []
+    for name in sorted(set(baseline["results"]) | set(current["results"])):
+        before = baseline["results"].get(name)
+        after = current["results"].get(name)
+        row = {"benchmark": name, "baseline_s": None, "current_s": None, "change": None, "status": "missing"}
+        if before is not None and after is not None:
+            change = after["median_s"] / before["median_s"] - 1.0
+            # A change within the noise of the slower run is not a regression
+            noise = max(before.get("stdev_s", 0.0), after.get("stdev_s", 0.0)) / before["median_s"]
+            if change > max(threshold, noise):
+                status = "REGRESSION"
+            elif change < -max(threshold, noise):
+                status = "improved"
+            else:
+                status = "ok"
+            row.update(baseline_s=before["median_s"], current_s=after["median_s"], change=change, status=status)
+        rows.append(row)
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]], baseline: Dict[str, Any], current: Dict[str, Any]):
+    print(f"baseline {baseline['meta'].get('commit')}  vs  current {current['meta'].get('commit')}")
+    print(f"{'benchmark':<36} {'baseline ms':>12} {'current ms':>12} {'change':>9}  status")
+    for row in rows:
+        if row["change"] is None:
+            print(f"{row['benchmark']:<36} {'':>12} {'':>12} {'':>9}  {row['status']}")
+        else:
+            print(f"{row['benchmark']:<36} {row['baseline_s'] * 1000:12.2f} {row['current_s'] * 1000:12.2f} "
+                  f"{row['change']:+9.1%}  {row['status']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for chunking, preprocessing, ingestion and retrieval")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks and write JSON results")
+    run_parser.add_argument("--output", help="file to write the JSON results to (default: stdout)")
+    run_parser.add_argument("--docs", type=int, default=20)
+    run_parser.add_argument("--pages", type=int, default=10, help="pages per document")
+    run_parser.add_argument("--words", type=int, default=400, help="words per page")
+    run_parser.add_argument("--queries", type=int, default=100)
+    run_parser.add_argument("--chunk-size", type=int, default=500)
+    run_parser.add_argument("--overlap", type=int, default=100)
+    run_parser.add_argument("--top-k", type=int, default=5)
+    run_parser.add_argument("--dim", type=int, default=384, help="fake embedding dimension")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--backends", default=",".join(DEFAULT_BACKENDS),
+                            help="comma separated, from numpy,numpy_ann,pinecone_local,chroma,redis")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two result files and flag regressions")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                                help="relative slowdown reported as a regression (default 0.10)")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        report = run_benchmarks(
+            num_docs=args.docs, pages_per_doc=args.pages, words_per_page=args.words,
+            num_queries=args.queries, chunk_size=args.chunk_size, overlap=args.overlap,
+            top_k=args.top_k, embedding_dim=args.dim, repeat=args.repeat,
+            backends=[backend for backend in args.backends.split(",") if backend],
+        )
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f"Results written to {args.output}")
+        else:
+            print(json.dumps(report, indent=2))
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    rows = compare_results(baseline, current, args.threshold)
+    print_comparison(rows, baseline, current)
+    # Non-zero exit so the comparison can gate a CI job
+    sys.exit(1 if any(row["status"] == "REGRESSION" for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import re
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+## In-process lexical index with BM25 scoring, for queries that hinge on exact terms
+## ("AOF", "B+ tree") which dense vectors blur. Each term's postings are two growable
+## typed arrays (document numbers and term frequencies, 6 bytes per posting) that NumPy
+## reads without copying, so a query costs one vectorized update per query term.
+## Documents are upserted and deleted incrementally: replaced or deleted documents are
+## tombstoned and dropped from the postings once they make up a large share.
+
+# BM25 parameters: term-frequency saturation and document-length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Share of tombstoned documents that triggers a compaction of the postings
+COMPACT_RATIO = 0.25
+
+# Words, numbers and terms with trailing pluses ("b+", "c++")
+_TOKEN = re.compile(r"[a-z0-9]+\+*")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """Inverted index over chunk texts, addressed by chunk ID."""
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._terms: Dict[str, int] = {}
+        # Per term id: document numbers and term frequencies of its postings
+        self._docs: List[array] = []
+        self._freqs: List[array] = []
+        # Per document number: chunk ID, length in tokens and whether it is still live
+        self.doc_ids: List[Optional[str]] = []
+        self._lengths = array("I")
+        self._numbers: Dict[str, int] = {}
+        self._total_length = 0
+        self._dead = 0
+        # Length normalization term of every document, recomputed after writes
+        self._norms: Optional[np.ndarray] = None
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def _live_mask(self) -> np.ndarray:
+        return np.array([doc_id is not None for doc_id in self.doc_ids], dtype=bool)
+
+    def add(self, texts: Iterable[str], ids: Iterable[str]):
+        """Upsert documents; a known ID replaces that document's text."""
+        for text, doc_id in zip(texts, ids):
+            self._remove(doc_id)
+            number = len(self.doc_ids)
+            tokens = tokenize(text)
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                term = self._terms.get(token)
+                if term is None:
+                    term = self._terms[token] = len(self._docs)
+                    self._docs.append(array("i"))
+                    self._freqs.append(array("H"))
+                self._docs[term].append(number)
+                self._freqs[term].append(min(count, 0xFFFF))
+            self.doc_ids.append(doc_id)
+            self._lengths.append(len(tokens))
+            self._numbers[doc_id] = number
+            self._total_length += len(tokens)
+        self._norms = None
+        self._maybe_compact()
+
+    def delete(self, ids: Iterable[str]):
+        for doc_id in ids:
+            self._remove(doc_id)
+        self._maybe_compact()
+
+    def _remove(self, doc_id: str):
+        number = self._numbers.pop(doc_id, None)
+        if number is None:
+            return
+        # Postings stay until the next compaction; search skips tombstoned documents
+        self.doc_ids[number] = None
+        self._total_length -= self._lengths[number]
+        self._dead += 1
+        self._norms = None
+
+    def _maybe_compact(self):
+        if self._dead and self._dead >= COMPACT_RATIO * len(self.doc_ids):
+            self.compact()
+
+    def compact(self):
+        """Drop tombstoned documents from the postings and renumber the live ones."""
+        live = self._live_mask()
+        renumber = np.cumsum(live, dtype=np.int64) - 1
+        terms, docs, freqs = {}, [], []
+        for token, term in self._terms.items():
+            term_docs = np.frombuffer(self._docs[term], dtype=np.int32)
+            keep = live[term_docs]
+            if not keep.any():
+                continue
+            terms[token] = len(docs)
+            docs.append(array("i", renumber[term_docs[keep]].astype(np.int32).tobytes()))
+            freqs.append(array("H", np.frombuffer(self._freqs[term], dtype=np.uint16)[keep].tobytes()))
+        self._terms, self._docs, self._freqs = terms, docs, freqs
+        self.doc_ids = [doc_id for doc_id in self.doc_ids if doc_id is not None]
+        self._lengths = array("I", np.frombuffer(self._lengths, dtype=np.uint32)[live].tobytes())
+        self._numbers = {doc_id: number for number, doc_id in enumerate(self.doc_ids)}
+        self._dead = 0
+        self._norms = None
+
+    def clear(self):
+        self.__init__(self.k1, self.b)
+
+    def scores(self, query_text: str) -> np.ndarray:
+        """BM25 score of every document number for the query (0 for tombstoned documents)."""
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        live_count = len(self._numbers)
+        if live_count == 0:
+            return scores
+        norms = self._norms
+        if norms is None:
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32).astype(np.float32)
+            norms = self._norms = self.k1 * (1 - self.b + self.b * lengths / (self._total_length / live_count))
+        for token in set(tokenize(query_text)):
+            term = self._terms.get(token)
+            if term is None:
+                continue
+            docs = np.frombuffer(self._docs[term], dtype=np.int32)
+            freqs = np.frombuffer(self._freqs[term], dtype=np.uint16).astype(np.float32)
+            # Tombstoned postings inflate document frequency slightly until compaction
+            idf = np.log(1 + (live_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            # A document appears once per term's postings, so fancy-index += is safe
+            scores[docs] += idf * freqs * (self.k1 + 1) / (freqs + norms[docs])
+        if self._dead:
+            scores[~self._live_mask()] = 0.0
+        return scores
+
+    def search(self, query_text: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """(chunk ID, score) of the top_k documents sharing a term with the query, best first."""
+        scores = self.scores(query_text)
+        matches = np.flatnonzero(scores > 0)
+        if len(matches) > top_k:
+            matches = matches[np.argpartition(-scores[matches], top_k - 1)[:top_k]]
+        matches = matches[np.argsort(-scores[matches], kind="stable")]
+        return [(self.doc_ids[number], float(scores[number])) for number in matches]
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the postings and per-document arrays."""
+        postings = sum(docs.itemsize * len(docs) + freqs.itemsize * len(freqs)
+                       for docs, freqs in zip(self._docs, self._freqs))
+        return postings + self._lengths.itemsize * len(self._lengths)
+
+    def save(self, path: str):
+        """Write a compacted copy of the index as one .npz file (postings in CSR layout)."""
+        if self._dead:
+            self.compact()
+        tokens = sorted(self._terms, key=self._terms.get)
+        offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(docs) for docs in self._docs])
+        np.savez(
+            path,
+            params=np.array([self.k1, self.b]),
+            tokens=np.array(tokens, dtype=str),
+            offsets=offsets,
+            docs=np.frombuffer(b"".join(docs.tobytes() for docs in self._docs), dtype=np.int32),
+            freqs=np.frombuffer(b"".join(freqs.tobytes() for freqs in self._freqs), dtype=np.uint16),
+            doc_ids=np.array(self.doc_ids, dtype=str),
+            lengths=np.frombuffer(self._lengths, dtype=np.uint32),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as data:
+            k1, b = (float(value) for value in data["params"])
+            index = cls(k1, b)
+            offsets, docs, freqs = data["offsets"], data["docs"], data["freqs"]
+            for term, token in enumerate(data["tokens"].tolist()):
+                index._terms[token] = term
+                index._docs.append(array("i", docs[offsets[term]:offsets[term + 1]].tobytes()))
+                index._freqs.append(array("H", freqs[offsets[term]:offsets[term + 1]].tobytes()))
+            index.doc_ids = data["doc_ids"].tolist()
+            index._lengths = array("I", data["lengths"].tobytes())
+        index._numbers = {doc_id: number for number, doc_id in enumerate(index.doc_ids)}
+        index._total_length = int(np.frombuffer(index._lengths, dtype=np.uint32).sum())
+        return index
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked ID lists: each list adds 1 / (k + rank) to the IDs it ranks."""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])
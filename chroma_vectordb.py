@@ -1,87 +1,180 @@
 import os
 # import time
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 import chromadb
-from embed import MxbaiEmbedder
+from embed import MXBAI, get_embedder
 from uuid import uuid4
+from index_manifest import reset_manifest
 
 
 # Load environment variables
 load_dotenv()
 
 # Global variables
-CHROMA_PERSIST_DIR = "./chroma"
+CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "./chroma")
+# Persist the collection on disk so it survives across runs (set CHROMA_PERSIST=0 for in-memory)
+CHROMA_PERSIST = os.getenv("CHROMA_PERSIST", "1") == "1"
 COLLECTION_NAME = "ds4300"
+# Embedding model used for this collection
+EMBEDDING_MODEL = MXBAI
+# Name of the manifest tracking which files this collection holds
+MANIFEST_NAME = f"chroma_{COLLECTION_NAME}"
+# HNSW settings, only applied when the collection is created
+HNSW_SPACE = "cosine"
+HNSW_CONSTRUCTION_EF = 100
+HNSW_M = 16
+HNSW_SEARCH_EF = 10
+# Similarity reported for a Chroma distance in each HNSW space: cosine and ip distances
+# are 1 - similarity, l2 is the squared distance, which is 2 - 2 * cosine for unit vectors
+_SCORE_FROM_DISTANCE = {
+    "cosine": lambda distance: 1.0 - distance,
+    "ip": lambda distance: 1.0 - distance,
+    "l2": lambda distance: 1.0 - distance / 2.0,
+}
 
+# One client per mode, shared by every call in the process
+_clients = {}
+# Whether this chromadb version accepts NumPy arrays for embeddings
+_accepts_numpy = True
 
 
-def initialize_chroma():
-    """Initialize Chroma collection."""
-    # Get or create collection
+
+def get_chroma_client(persist: bool = CHROMA_PERSIST):
+    """Return the shared persistent (on-disk) or ephemeral (in-memory) Chroma client."""
+    if persist not in _clients:
+        _clients[persist] = chromadb.PersistentClient(path=CHROMA_PERSIST_DIR) if persist else chromadb.Client()
+    return _clients[persist]
+
+def initialize_chroma(
+    persist: bool = CHROMA_PERSIST,
+    hnsw_space: str = HNSW_SPACE,
+    hnsw_construction_ef: int = HNSW_CONSTRUCTION_EF,
+    hnsw_m: int = HNSW_M,
+    hnsw_search_ef: int = HNSW_SEARCH_EF,
+):
+    """Initialize Chroma collection.
+    
+    With persist=True the collection lives in CHROMA_PERSIST_DIR and is reused across
+    runs. HNSW settings only take effect when the collection is first created.
+    """
+    if hnsw_space not in _SCORE_FROM_DISTANCE:
+        raise ValueError(f"Unknown HNSW space {hnsw_space!r}; expected one of {sorted(_SCORE_FROM_DISTANCE)}")
     # Initialize Chroma client
-    client = chromadb.Client()
-    try:
-        # Try to get existing collection
-        collection = client.get_collection(COLLECTION_NAME)
-        print(f"Using existing collection: {COLLECTION_NAME}")
-    except:
-        # Create new collection if it doesn't exist
-        collection = client.create_collection(
-            name=COLLECTION_NAME,
-            # Use cosine similarity
-            metadata={"hnsw:space": "cosine"}  
-        )
-        print(f"Created new collection: {COLLECTION_NAME}")
+    client = get_chroma_client(persist)
+    # Get or create collection
+    collection = client.get_or_create_collection(
+        name=COLLECTION_NAME,
+        metadata={
+            "hnsw:space": hnsw_space,
+            "hnsw:construction_ef": hnsw_construction_ef,
+            "hnsw:M": hnsw_m,
+            "hnsw:search_ef": hnsw_search_ef,
+        }
+    )
+    print(f"Using collection {COLLECTION_NAME} with {collection.count()} vectors"
+          f" ({'persistent at ' + CHROMA_PERSIST_DIR if persist else 'in-memory'})")
 
     return collection
 
+def delete_chroma_collection(collection=None, persist: bool = CHROMA_PERSIST):
+    """Delete the Chroma collection so the next initialize_chroma starts empty."""
+    client = get_chroma_client(persist)
+    try:
+        client.delete_collection(COLLECTION_NAME)
+        print(f"Deleted collection: {COLLECTION_NAME}")
+        reset_manifest(MANIFEST_NAME)
+    except Exception as e:
+        print(f"Error deleting collection {COLLECTION_NAME}: {e}")
+
+def _max_batch_size(collection) -> int:
+    """Largest add/upsert the client accepts in one call."""
+    client = getattr(collection, "_client", None)
+    if hasattr(client, "get_max_batch_size"):
+        return client.get_max_batch_size()
+    return getattr(client, "max_batch_size", 5461)
+
 def upload_embeddings_to_chroma(
     collection,
-    embeddings: List[np.ndarray], 
-    documents: List[str]
+    embeddings: np.ndarray, 
+    documents: List[str],
+    ids: Optional[List[str]] = None
 ):
-    
+    """Upload embeddings to Chroma collection."""
+    global _accepts_numpy
     try:
-        """Upload embeddings to Chroma collection."""
         total_vectors = len(embeddings)
         print(f"Uploading {total_vectors} vectors to Chroma...")
         
         # Prepare data for Chroma
-        ids = [f"doc_{uuid4()}" for i in range(total_vectors)]
-        emb_lists = [emb.tolist() for emb in embeddings]
+        if ids is None:
+            ids = [f"doc_{uuid4()}" for i in range(total_vectors)]
+        embeddings = np.asarray(embeddings, dtype=np.float32)
         
-        # Add to collection
-        collection.add(
-            ids=ids,
-            embeddings=emb_lists,
-            documents=documents
-        )
-        print("Added to collection successfully")
+        # Slices of the matrix are views, so no per-vector list conversion is needed
+        batch_size = _max_batch_size(collection)
+        for start in range(0, total_vectors, batch_size):
+            end = start + batch_size
+            batch = embeddings[start:end]
+            if _accepts_numpy:
+                try:
+                    # Upsert so re-uploading a chunk with a stable ID replaces it
+                    collection.upsert(ids=ids[start:end], embeddings=batch, documents=documents[start:end])
+                    continue
+                except (TypeError, ValueError):
+                    # Older chromadb versions only validate lists of lists
+                    _accepts_numpy = False
+            collection.upsert(ids=ids[start:end], embeddings=batch.tolist(), documents=documents[start:end])
         
         print(f"Successfully uploaded {total_vectors} vectors to Chroma.")
     except Exception as e:
         print(f"Error uploading to Chroma: {e}")
+        raise
     
-def query_chroma(collection, query_text: str, top_k: int = 1):
-    """Query the Chroma collection and return the most relevant context."""
-    # Embed the user query
-    embedder = MxbaiEmbedder()
-    query_embedding = embedder.embed_chunks([query_text])[0]
-    
+def delete_from_chroma(collection, ids: List[str]):
+    """Delete chunks from the Chroma collection by ID."""
+    if ids:
+        collection.delete(ids=ids)
+
+def search_chroma_many(collection, query_embeddings: np.ndarray, top_k: int = 1) -> List[List[Dict[str, Any]]]:
+    """Search many already embedded queries in one request; one hit list per query, in order."""
     # Execute search
     query_results = collection.query(
-        query_embeddings=[query_embedding.tolist()],  # Convert numpy array to list
+        query_embeddings=np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1).tolist(),
         n_results=top_k,
         include=["documents", "distances"]
     )
     
+    if not query_results.get("ids"):
+        return [[] for _ in range(len(query_embeddings))]
+    # Report similarities like the other backends, in the space the collection was created
+    # with (Chroma's default is l2)
+    to_score = _SCORE_FROM_DISTANCE[(collection.metadata or {}).get("hnsw:space", "l2")]
+    return [
+        [
+            {"id": chunk_id, "text": text, "score": to_score(distance)}
+            for chunk_id, text, distance in zip(ids, documents, distances)
+        ]
+        for ids, documents, distances in zip(
+            query_results["ids"], query_results["documents"], query_results["distances"]
+        )
+    ]
+
+def search_chroma(collection, query_embedding: np.ndarray, top_k: int = 1) -> List[Dict[str, Any]]:
+    """Search with an already embedded query; returns [{"id", "text", "score"}], best first."""
+    return search_chroma_many(collection, [query_embedding], top_k)[0]
+
+def query_chroma(collection, query_text: str, top_k: int = 1):
+    """Query the Chroma collection and return the most relevant context."""
+    # Embed the user query
+    embedder = get_embedder(EMBEDDING_MODEL)
+    query_embedding = embedder.embed_query(query_text)
+    
     # Extract relevant documents
-    if "documents" in query_results and len(query_results["documents"]) > 0:
-        contexts = query_results["documents"][0]  # First query result
-        context_str = "\n\n".join(contexts)
-        return context_str
+    hits = search_chroma(collection, query_embedding, top_k)
+    if hits:
+        return "\n\n".join(hit["text"] for hit in hits)
     
     return "No relevant documents found."
 
@@ -90,7 +183,7 @@ def main():
     # Initialize Chroma
     collection = initialize_chroma()
     
-    embedder = MxbaiEmbedder()
+    embedder = get_embedder(EMBEDDING_MODEL)
     sample_embeddings = embedder.embed_chunks(["Sample text 1", "Sample text 2", "Sample text 3"])
     sample_documents = ["Sample document 1", "Sample document 2", "Sample document 3"]
     
@@ -1,7 +1,14 @@
+import re
+from typing import NamedTuple
+import numpy as np
 
 # Chunk given a text into smaller pieces with specified size and overlap. Return the array of the chunks.
 def chunk_text(text, chunk_size, overlap_size=0):
     
+    # The window has to advance, otherwise the loop below never ends
+    if overlap_size >= chunk_size:
+        raise ValueError(f"overlap_size ({overlap_size}) must be smaller than chunk_size ({chunk_size})")
+    
     # Split the text into tokens word by word
     tokens = text.split()
     
@@ -29,6 +36,155 @@ def chunk_text(text, chunk_size, overlap_size=0):
     
     return chunks
 
+# Stream chunks out of (source, page_text) pairs without joining whole documents first.
+# Pages of one source must arrive consecutively. Yields (source, offset, chunk) where offset
+# is the index of the chunk's first word within its source. Windows match chunk_text run
+# on the concatenated pages, except that short documents come back whitespace-normalized.
+def iter_chunks(pages, chunk_size, overlap_size=0):
+    if overlap_size >= chunk_size:
+        raise ValueError(f"overlap_size ({overlap_size}) must be smaller than chunk_size ({chunk_size})")
+    step = chunk_size - overlap_size
+    
+    source = None
+    # Words of the current source that later chunks still need, starting at word index buffer_start
+    buffer = []
+    buffer_start = 0
+    next_start = 0
+    total = 0
+    
+    def flush():
+        # Emit whatever is left once the source is complete
+        if total == 0:
+            return
+        if total <= chunk_size:
+            yield source, 0, ' '.join(buffer)
+            return
+        start = next_start
+        while start < total:
+            yield source, start, ' '.join(buffer[start - buffer_start:start - buffer_start + chunk_size])
+            start += step
+    
+    for page_source, page_text in pages:
+        if page_source != source:
+            yield from flush()
+            source = page_source
+            buffer, buffer_start, next_start, total = [], 0, 0, 0
+        
+        words = page_text.split()
+        buffer.extend(words)
+        total += len(words)
+        
+        # Emit every window that is now complete, then drop words no later window needs
+        if total > chunk_size:
+            while next_start + chunk_size <= total:
+                yield source, next_start, ' '.join(buffer[next_start - buffer_start:next_start - buffer_start + chunk_size])
+                next_start += step
+            del buffer[:next_start - buffer_start]
+            buffer_start = next_start
+    
+    yield from flush()
+
+# Separator placed between consecutive pages of a source when computing character offsets
+PAGE_SEPARATOR = "\n"
+
+# A chunk as a character range of its source's text (its pages joined with PAGE_SEPARATOR),
+# plus the index of its first token and how many tokens it holds
+class ChunkSpan(NamedTuple):
+    source: str
+    start: int
+    end: int
+    token_start: int
+    num_tokens: int
+
+# Character offsets of the whitespace-separated words of text, shaped (num_words, 2).
+# Chunking with it matches iter_chunks; pass embed.get_token_offsets(model) for real tokens.
+def whitespace_offsets(text):
+    return np.array([match.span() for match in re.finditer(r"\S+", text)], dtype=np.int64).reshape(-1, 2)
+
+def _iter_token_windows(pages, token_offsets, chunk_size, overlap_size, with_text):
+    if overlap_size < 0 or overlap_size >= chunk_size:
+        raise ValueError(f"overlap_size ({overlap_size}) must be in [0, chunk_size) (chunk_size={chunk_size})")
+    step = chunk_size - overlap_size
+    
+    source = None
+    # Text and token offsets of the current source that later chunks still need. text starts
+    # at character text_start of the source and offsets at token index offsets_start.
+    text, text_start = "", 0
+    offsets, offsets_start = np.empty((0, 2), dtype=np.int64), 0
+    source_length = 0
+    next_start = 0
+    total = 0
+    first_page = True
+    
+    def window(first, last):
+        # Span (and text, if requested) of tokens first..last inclusive
+        start = int(offsets[first - offsets_start, 0])
+        end = int(offsets[last - offsets_start, 1])
+        span = ChunkSpan(source, start, end, first, last - first + 1)
+        return span, (text[start - text_start:end - text_start] if with_text else None)
+    
+    def flush():
+        if total == 0:
+            return
+        if total <= chunk_size:
+            yield window(0, total - 1)
+            return
+        start = next_start
+        while start < total:
+            yield window(start, min(start + chunk_size, total) - 1)
+            start += step
+    
+    for page_source, page_text in pages:
+        if page_source != source:
+            yield from flush()
+            source = page_source
+            text, text_start = "", 0
+            offsets, offsets_start = np.empty((0, 2), dtype=np.int64), 0
+            source_length, next_start, total = 0, 0, 0
+            first_page = True
+        if not first_page:
+            source_length += len(PAGE_SEPARATOR)
+            if with_text:
+                text += PAGE_SEPARATOR
+        first_page = False
+        
+        page_offsets = token_offsets(page_text) + source_length
+        source_length += len(page_text)
+        if with_text:
+            text += page_text
+        offsets = np.concatenate([offsets, page_offsets]) if len(offsets) else page_offsets
+        total += len(page_offsets)
+        
+        # Emit every window that is now complete, then drop what no later window needs
+        if total > chunk_size:
+            while next_start + chunk_size <= total:
+                yield window(next_start, next_start + chunk_size - 1)
+                next_start += step
+            keep_from = min(next_start, total) - offsets_start
+            if with_text:
+                cut = int(offsets[keep_from, 0]) if keep_from < len(offsets) else source_length
+                text = text[cut - text_start:]
+                text_start = cut
+            offsets = offsets[keep_from:]
+            offsets_start += keep_from
+    
+    yield from flush()
+
+# Stream token-based chunk spans out of (source, page_text) pairs, pages of a source in order.
+# token_offsets(text) returns the (start, end) character offsets of text's tokens, e.g.
+# embed.get_token_offsets(model), so chunk_size and overlap_size count the model's tokens.
+# Windows follow chunk_text (a short document is one chunk). Only the token offsets still
+# needed are kept, and no chunk strings are built.
+def iter_token_spans(pages, token_offsets, chunk_size, overlap_size=0):
+    for span, _ in _iter_token_windows(pages, token_offsets, chunk_size, overlap_size, with_text=False):
+        yield span
+
+# Same windows as iter_token_spans, yielded as (source, token_start, chunk_text) like
+# iter_chunks; each chunk is sliced straight from the page text instead of re-joined.
+def iter_token_chunks(pages, token_offsets, chunk_size, overlap_size=0):
+    for span, chunk in _iter_token_windows(pages, token_offsets, chunk_size, overlap_size, with_text=True):
+        yield span.source, span.token_start, chunk
+
 # Test 
 if __name__ == "__main__":
     sample_text = "Uhhh this is some sample string that has been parsed from our pdf repeated over and over" * 50
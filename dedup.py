@@ -0,0 +1,135 @@
+import hashlib
+import os
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+## Duplicate chunk elimination between chunking and embedding. Slide decks repeat
+## headers, title slides and recap sections across PDFs; embedding and storing every
+## copy wastes embedding calls and index space. Exact copies are caught by a hash of the
+## normalized text, near-copies by MinHash signatures over word shingles bucketed with
+## LSH, so each chunk is only compared against a handful of candidates.
+
+# Estimated Jaccard similarity above which two chunks count as near-duplicates
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+# MinHash permutations; more gives a sharper threshold at a higher cost per chunk
+DEDUP_NUM_PERM = 64
+# Words per shingle
+DEDUP_SHINGLE_SIZE = 5
+
+# Mersenne prime for the universal hash family; keeps (a * x + b) within uint64
+_PRIME = (1 << 31) - 1
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """(bands, rows) with bands * rows == num_perm whose S-curve crosses 0.5 nearest threshold."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        crossing = (1.0 / bands) ** (1.0 / rows)
+        if best is None or abs(crossing - threshold) < best[0]:
+            best = (abs(crossing - threshold), bands, rows)
+    return best[1], best[2]
+
+
+class ChunkDeduplicator:
+    """Decides, chunk by chunk, whether a chunk repeats one seen earlier in the run.
+
+    add() returns None for a new chunk (which should be embedded and stored) or the ID
+    of the earlier chunk it duplicates. Thread-safe.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEDUP_THRESHOLD,
+        num_perm: int = DEDUP_NUM_PERM,
+        shingle_size: int = DEDUP_SHINGLE_SIZE,
+        near_duplicates: bool = True,
+        seed: int = 0,
+    ):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.near_duplicates = near_duplicates
+        self.bands, self.rows = _lsh_params(threshold, num_perm)
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)[:, None]
+
+        self._exact: Dict[bytes, str] = {}
+        # One dict per band: band hash -> IDs of kept chunks in that bucket
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+        self.chunks_seen = 0
+        self.exact_duplicates = 0
+        self.near_duplicates_found = 0
+        # Duplicate chunk ID -> ID of the chunk kept in its place
+        self.duplicate_of: Dict[str, str] = {}
+
+    def signature(self, text: str) -> np.ndarray:
+        words = text.split()
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        return ((self._a * hashes + self._b) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def add(self, chunk_id: str, text: str) -> Optional[str]:
+        normalized = normalize_text(text)
+        digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+        signature = self.signature(normalized) if self.near_duplicates else None
+
+        with self._lock:
+            self.chunks_seen += 1
+            original = self._exact.get(digest)
+            if original == chunk_id:
+                return None
+            if original is not None:
+                self.exact_duplicates += 1
+                self.duplicate_of[chunk_id] = original
+                return original
+            self._exact[digest] = chunk_id
+            if signature is None:
+                return None
+
+            band_keys = [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+            candidates = set()
+            for band, key in enumerate(band_keys):
+                candidates.update(self._buckets[band].get(key, ()))
+            best, best_similarity = None, self.threshold
+            for candidate in sorted(candidates):
+                similarity = float(np.mean(self._signatures[candidate] == signature))
+                if similarity >= best_similarity and (best is None or similarity > best_similarity):
+                    best, best_similarity = candidate, similarity
+            if best is not None:
+                self.near_duplicates_found += 1
+                self.duplicate_of[chunk_id] = best
+                # Later exact copies of this text map straight to the kept chunk
+                self._exact[digest] = best
+                return best
+
+            self._signatures[chunk_id] = signature
+            for band, key in enumerate(band_keys):
+                self._buckets[band].setdefault(key, []).append(chunk_id)
+            return None
+
+    def report(self) -> Dict[str, int]:
+        duplicates = self.exact_duplicates + self.near_duplicates_found
+        return {
+            "chunks_seen": self.chunks_seen,
+            "chunks_kept": self.chunks_seen - duplicates,
+            "exact_duplicates": self.exact_duplicates,
+            "near_duplicates": self.near_duplicates_found,
+            # Every dropped chunk is one embedding input and one stored vector less
+            "embeddings_saved": duplicates,
+            "vectors_saved": duplicates,
+        }
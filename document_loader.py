@@ -1,33 +1,130 @@
+import multiprocessing
 import os
 import re
 import time
-from typing import Dict, List
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
 from langchain_community.document_loaders import PyPDFLoader
 
 # Script used to load all documents from a given directory, and extract text from the given pdfs.
 
+# Seconds between checks on the files the worker processes are parsing
+POLL_INTERVAL = 0.05
+
+# lazily yields the pages of a single PDF as they are parsed
+def _iter_pdf(file_path: str) -> Iterator:
+    return PyPDFLoader(file_path).lazy_load()
+
+# loads a single PDF into its list of pages (top level so worker processes can pickle it)
+def _load_pdf(file_path: str) -> List:
+    return list(_iter_pdf(file_path))
+
+def iter_loaded_pdfs(
+    directory_path: str,
+    filenames: List[str],
+    max_workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Iterator[Tuple[str, Optional[List], Optional[str]]]:
+    """Parse PDFs in a pool of processes and yield (filename, pages, error) in filenames order.
+
+    No more files are submitted than there are workers, so each file starts as soon as
+    it is submitted and timeout counts from then. A file that runs past its timeout is
+    reported as an error. Its worker is killed by restarting the pool, and the other
+    files that were in flight are resubmitted. At most 2 * max_workers parsed files wait
+    for an earlier file to finish.
+    """
+    workers = max(1, max_workers or os.cpu_count() or 1)
+    pending = deque(filenames)
+    # filename -> (async result, deadline) of files being parsed, and (pages, error) of
+    # parsed files that have not been yielded yet
+    in_flight = {}
+    finished = {}
+    pool = multiprocessing.Pool(processes=workers)
+
+    def submit(filename):
+        result = pool.apply_async(_load_pdf, (os.path.join(directory_path, filename),))
+        in_flight[filename] = (result, time.monotonic() + timeout if timeout is not None else None)
+
+    try:
+        for filename in filenames:
+            while filename not in finished:
+                # Files are submitted in order, so this one is always in flight by now
+                while pending and len(in_flight) < workers and len(in_flight) + len(finished) < 2 * workers:
+                    submit(pending.popleft())
+                in_flight[filename][0].wait(POLL_INTERVAL)
+                now = time.monotonic()
+                timed_out = False
+                for name, (result, deadline) in list(in_flight.items()):
+                    if result.ready():
+                        del in_flight[name]
+                        try:
+                            finished[name] = (result.get(), None)
+                        except Exception as e:
+                            finished[name] = (None, str(e))
+                    elif deadline is not None and now > deadline:
+                        del in_flight[name]
+                        finished[name] = (None, f"Timed out after {timeout} seconds")
+                        timed_out = True
+                if timed_out:
+                    # A single pool worker can't be killed, so replace the pool and start over
+                    # with the files the other workers had not finished
+                    pool.terminate()
+                    pool.join()
+                    pool = multiprocessing.Pool(processes=workers)
+                    for name in list(in_flight):
+                        submit(name)
+            pages, error = finished.pop(filename)
+            yield filename, pages, error
+    finally:
+        # terminate rather than close so hung workers do not block shutdown
+        pool.terminate()
+        pool.join()
+
 # loads PDF documents from specified directory
-def load_documents(directory_path: str) -> Dict[str, List]:
+def load_documents(
+    directory_path: str,
+    parallel: bool = False,
+    max_workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+    errors: Optional[Dict[str, str]] = None,
+) -> Dict[str, List]:
+    """Load every file in directory_path, keyed by filename in sorted order.
+
+    With parallel=True the PDFs are parsed by a pool of max_workers processes
+    (defaults to the CPU count). timeout is the number of seconds a worker may spend
+    on one file; a file that times out is recorded as an error and its worker is
+    terminated (see iter_loaded_pdfs). Per-file errors are written into the errors dict
+    when one is given instead of being printed.
+    """
     documents = {}
+    if errors is None:
+        errors = {}
     print(f"Loading documents from {directory_path}...")
 
-    # processes all PDF files in directory
-    for filename in os.listdir(directory_path):
-        file_path = os.path.join(directory_path, filename)
+    # Sorted so the result order does not depend on the filesystem or on worker timing
+    filenames = [
+        filename for filename in sorted(os.listdir(directory_path))
+        if os.path.isfile(os.path.join(directory_path, filename))
+    ]
 
-        if os.path.isfile(file_path):
+    if not parallel or len(filenames) <= 1:
+        # processes all PDF files in directory
+        for filename in filenames:
             try:
-                # print(f"Processing {filename}...")
-                loader = PyPDFLoader(file_path)
-                pages = loader.load()
-
                 # store the pages
-                documents[filename] = pages
-                # print(f"Successfully loaded {filename} ({len(pages)} pages)")
+                documents[filename] = _load_pdf(os.path.join(directory_path, filename))
             except Exception as e:
-                print(f"Error processing {filename}: {e}")
+                errors[filename] = str(e)
+    else:
+        for filename, pages, error in iter_loaded_pdfs(directory_path, filenames, max_workers, timeout):
+            if error is None:
+                documents[filename] = pages
+            else:
+                errors[filename] = error
 
     print(f"Loaded {len(documents)} PDF documents")
+    if errors:
+        print(f"Failed to load {len(errors)} files: {', '.join(errors)}")
     return documents
         
 # process text to one word per line and clean unwanted characters
@@ -1,31 +1,85 @@
 from sentence_transformers import SentenceTransformer
 import numpy as np
-from typing import List
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
 import ollama
+from transformers import AutoTokenizer
+from embedding_cache import EmbeddingCache, get_embedding_cache
 
-class SentenceTransformerEmbedder:
+# Model names used as keys in the embedder registry
+SENTENCE_TRANSFORMER = "sentence-transformers/all-mpnet-base-v2"
+NOMIC = "nomic-embed-text"
+MXBAI = "mxbai-embed-large"
+
+_USE_DEFAULT_CACHE = object()
+
+
+class CachedEmbedder:
+    """Base class that consults the persistent embedding cache before embedding.
+
+    Subclasses set model_name and implement _embed_uncached; only chunks whose
+    text has never been embedded with this model are sent to the model.
+    """
+
+    model_name = None
+    embedding_dim = None
+    cache: Optional[EmbeddingCache] = None
+
+    def _embed_uncached(self, chunks: List[str], **kwargs) -> np.ndarray:
+        raise NotImplementedError
+
+    # Embed a list of text chunks into one (len(chunks), embedding_dim) float32 matrix
+    def embed_chunks(self, chunks: List[str], **kwargs) -> np.ndarray:
+        if self.cache is None or not chunks:
+            return self._embed_uncached(chunks, **kwargs)
+
+        embeddings, missing = self.cache.lookup(self.model_name, chunks, self.embedding_dim)
+        if missing:
+            missing_chunks = [chunks[i] for i in missing]
+            fresh = self._embed_uncached(missing_chunks, **kwargs)
+            embeddings[missing] = fresh
+            self.cache.store(self.model_name, missing_chunks, fresh)
+        return embeddings
+
+    # Embed search queries, bypassing the cache: queries rarely repeat, and storing them
+    # would take the cache lock, grow its log and evict the vectors of real chunks
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        return self._embed_uncached(list(queries))
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return self.embed_queries([query])[0]
+
+    # Function to get the embedding dimension
+    def get_embedding_dimension(self) -> int:
+        return self.embedding_dim
+
+
+class SentenceTransformerEmbedder(CachedEmbedder):
     """A simple class that embeds text using the sentence-transformers/all-mpnet-base-v2 model"""
+
+    model_name = SENTENCE_TRANSFORMER
     
-    def __init__(self):
+    def __init__(self, cache=_USE_DEFAULT_CACHE):
         """Initialize the embedder with the all-mpnet-base-v2 model"""
         print("Loading all-mpnet-base-v2 embedding model...")
-        self.model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
+        self.model = SentenceTransformer(SENTENCE_TRANSFORMER)
         self.embedding_dim = self.model.get_sentence_embedding_dimension()
+        self.cache = get_embedding_cache() if cache is _USE_DEFAULT_CACHE else cache
         print(f"Model loaded successfully with embedding dimension: {self.embedding_dim}")
         
-    # Embed a list of text chunks
-    def embed_chunks(self, chunks: List[str]) -> List[np.ndarray]:
+    def _embed_uncached(self, chunks: List[str], batch_size: Optional[int] = None) -> np.ndarray:
         
         # Empty case
         if not chunks:
-            return []
+            return np.empty((0, self.embedding_dim), dtype=np.float32)
         # Use the model to encode the chunks
-        embeddings = self.model.encode(chunks)
-        return embeddings
-    
-    # Function to get the embedding dimension
-    def get_embedding_dimension(self) -> int:
-        return self.embedding_dim
+        if batch_size:
+            embeddings = self.model.encode(chunks, batch_size=batch_size)
+        else:
+            embeddings = self.model.encode(chunks)
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
 
 # Simple test function
 def test_embedder():
@@ -53,63 +107,211 @@ if __name__ == "__main__":
     test_embedder()
 
 
-class NomicEmbedder:
-    """A simple class that embeds text using the nomic-embed-text model"""
-    
-    def __init__(self):
-        """Initialize the embedder with the nomic-embed-text model"""
-        print("Loading nomic-embed-text embedding model...")
+# Defaults for batched Ollama embedding. Each request carries up to
+# OLLAMA_BATCH_SIZE chunks and at most OLLAMA_MAX_WORKERS requests are in flight.
+OLLAMA_BATCH_SIZE = 32
+OLLAMA_MAX_WORKERS = 4
+
+
+class OllamaEmbedder(CachedEmbedder):
+    """Base class for embedders served by a local Ollama model.
+
+    Chunks are sent in batches through Ollama's multi-input embed API and the
+    batches are spread over a bounded thread pool, so ingestion is no longer
+    one HTTP round-trip per chunk.
+    """
+
+    model_name = None
+
+    def __init__(
+        self,
+        embedding_dim: Optional[int] = None,
+        batch_size: int = OLLAMA_BATCH_SIZE,
+        max_workers: int = OLLAMA_MAX_WORKERS,
+        cache=_USE_DEFAULT_CACHE,
+    ):
+        """Initialize the embedder for self.model_name.
+
+        If the embedding dimension is already known (e.g. cached by the registry),
+        the sample-text probe round-trip to Ollama is skipped.
+        """
+        print(f"Loading {self.model_name} embedding model...")
         self.model = ollama
-        # Get embedding dimension by testing with a sample text
-        sample_response = self.model.embeddings(model='nomic-embed-text', prompt="Sample text")
-        sample_embedding = np.array(sample_response['embedding'])
-        self.embedding_dim = len(sample_embedding)
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.cache = get_embedding_cache() if cache is _USE_DEFAULT_CACHE else cache
+        # Throughput of the most recent embed_chunks call, in chunks/sec
+        self.last_chunks_per_sec = 0.0
+        if embedding_dim is None:
+            # Get embedding dimension by testing with a sample text
+            sample_response = self.model.embed(model=self.model_name, input="Sample text")
+            embedding_dim = len(sample_response['embeddings'][0])
+        self.embedding_dim = embedding_dim
         print(f"Model loaded successfully with embedding dimension: {self.embedding_dim}")
-    # Embed a list of text chunks
-    def embed_chunks(self, chunks: List[str]) -> List[np.ndarray]:
+
+    def _embed_batch(self, batch: List[str]) -> np.ndarray:
+        response = self.model.embed(model=self.model_name, input=batch)
+        return np.asarray(response['embeddings'], dtype=np.float32)
+
+    def _embed_uncached(self, chunks: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        batch_size = batch_size or self.batch_size
+        embeddings = np.empty((len(chunks), self.embedding_dim), dtype=np.float32)
         # Empty case
         if not chunks:
-            return []
-        # Use the model to encode the chunks chunk by chunk
-        embeddings = []
-        for chunk in chunks:
-            response = self.model.embeddings(model='nomic-embed-text', prompt=chunk)
-            embedding = np.array(response['embedding'])
-            embeddings.append(embedding)
+            return embeddings
+
+        start_time = time.perf_counter()
+        starts = range(0, len(chunks), batch_size)
+        if len(starts) == 1 or self.max_workers <= 1:
+            for start in starts:
+                embeddings[start:start + batch_size] = self._embed_batch(chunks[start:start + batch_size])
+        else:
+            # The pool size bounds the number of requests in flight against the Ollama server
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {
+                    executor.submit(self._embed_batch, chunks[start:start + batch_size]): start
+                    for start in starts
+                }
+                for future in as_completed(futures):
+                    start = futures[future]
+                    embeddings[start:start + batch_size] = future.result()
+
+        elapsed = time.perf_counter() - start_time
+        self.last_chunks_per_sec = len(chunks) / elapsed if elapsed > 0 else float("inf")
+        if len(chunks) > 1:
+            print(f"Embedded {len(chunks)} chunks with {self.model_name} "
+                  f"(batch_size={batch_size}, workers={self.max_workers}): "
+                  f"{self.last_chunks_per_sec:.1f} chunks/sec")
         return embeddings
-    
-    # Function to get the embedding dimension
-    def get_embedding_dimension(self) -> int:
-        return self.embedding_dim
 
 
-class MxbaiEmbedder:
+class NomicEmbedder(OllamaEmbedder):
+    """A simple class that embeds text using the nomic-embed-text model"""
+
+    model_name = NOMIC
+
+
+class MxbaiEmbedder(OllamaEmbedder):
     """A simple class that embeds text using the mxbai-embed-large model"""
-    
-    def __init__(self):
-        """Initialize the embedder with the mxbai-embed-large model"""
-        print("Loading mxbai-embed-large embedding model...")
-        self.model = ollama
-        # Get embedding dimension by testing with a sample text
-        sample_response = self.model.embeddings(model='mxbai-embed-large', prompt="Sample text")
-        sample_embedding = np.array(sample_response['embedding'])
-        self.embedding_dim = len(sample_embedding)
-        print(f"Model loaded successfully with embedding dimension: {self.embedding_dim}")
-    # Embed a list of text chunks
-    def embed_chunks(self, chunks: List[str]) -> List[np.ndarray]:
-        # Empty case
-        if not chunks:
-            return []
-        # Use the model to encode the chunks chunk by chunk
-        embeddings = []
-        for chunk in chunks:
-            response = self.model.embeddings(model='mxbai-embed-large', prompt=chunk)
-            embedding = np.array(response['embedding'])
-            embeddings.append(embedding)
-        return embeddings
-    
-    # Function to get the embedding dimension
-    def get_embedding_dimension(self) -> int:
-        return self.embedding_dim
+
+    model_name = MXBAI
+
+
+# Process-wide embedder registry. Loading a SentenceTransformer model or probing an
+# Ollama model is expensive, so every query path and upload script shares one warm
+# instance per model name instead of constructing a fresh embedder per call.
+EMBEDDER_CLASSES = {
+    SENTENCE_TRANSFORMER: SentenceTransformerEmbedder,
+    NOMIC: NomicEmbedder,
+    MXBAI: MxbaiEmbedder,
+}
+
+_embedders: Dict[str, object] = {}
+# Probed dimensions survive eviction so a reload never needs another probe
+_embedding_dims: Dict[str, int] = {}
+_registry_lock = threading.Lock()
+_model_locks: Dict[str, threading.Lock] = {}
+
+
+def _get_model_lock(model_name: str) -> threading.Lock:
+    with _registry_lock:
+        if model_name not in _model_locks:
+            _model_locks[model_name] = threading.Lock()
+        return _model_locks[model_name]
+
+
+def get_embedder(model_name: str):
+    """Return the shared embedder for model_name, creating it on first use."""
+    if model_name not in EMBEDDER_CLASSES:
+        raise ValueError(f"Unknown embedding model: {model_name}")
+
+    embedder = _embedders.get(model_name)
+    if embedder is not None:
+        return embedder
+
+    # Only one thread loads a given model; other models can load concurrently
+    with _get_model_lock(model_name):
+        embedder = _embedders.get(model_name)
+        if embedder is None:
+            embedder_class = EMBEDDER_CLASSES[model_name]
+            if model_name in _embedding_dims and issubclass(embedder_class, OllamaEmbedder):
+                embedder = embedder_class(embedding_dim=_embedding_dims[model_name])
+            else:
+                embedder = embedder_class()
+            _embedding_dims[model_name] = embedder.get_embedding_dimension()
+            _embedders[model_name] = embedder
+    return embedder
+
+
+def get_embedding_dimension(model_name: str) -> int:
+    """Return the embedding dimension for model_name, loading the model only if it was never probed."""
+    if model_name not in _embedding_dims:
+        get_embedder(model_name)
+    return _embedding_dims[model_name]
+
+
+def warm_up_embedders(model_names: List[str]) -> None:
+    """Load the given models ahead of time so the first query does not pay for it."""
+    for model_name in model_names:
+        get_embedder(model_name)
+
+
+def evict_embedder(model_name: Optional[str] = None) -> None:
+    """Drop a cached embedder (or all of them) to free memory. Dimensions stay cached."""
+    with _registry_lock:
+        if model_name is None:
+            _embedders.clear()
+        else:
+            _embedders.pop(model_name, None)
+
+
+# Hugging Face tokenizer matching each embedding model, and the most tokens (including
+# the special tokens the model adds) it embeds before truncating
+TOKENIZER_NAMES = {
+    SENTENCE_TRANSFORMER: "sentence-transformers/all-mpnet-base-v2",
+    NOMIC: "nomic-ai/nomic-embed-text-v1.5",
+    MXBAI: "mixedbread-ai/mxbai-embed-large-v1",
+}
+# Models trained with Matryoshka representation learning, whose embeddings can be
+# truncated to a prefix of their dimensions
+MATRYOSHKA_MODELS = {NOMIC, MXBAI}
+MODEL_MAX_TOKENS = {
+    SENTENCE_TRANSFORMER: 384,
+    NOMIC: 8192,
+    MXBAI: 512,
+}
+# [CLS] and [SEP] added around every chunk by all three models
+SPECIAL_TOKENS_PER_CHUNK = 2
+
+_tokenizers: Dict[str, object] = {}
+
+
+def get_tokenizer(model_name: str):
+    """Return the shared fast tokenizer of model_name's embedding model."""
+    if model_name not in TOKENIZER_NAMES:
+        raise ValueError(f"No tokenizer known for embedding model: {model_name}")
+
+    tokenizer = _tokenizers.get(model_name)
+    if tokenizer is None:
+        with _get_model_lock(f"tokenizer:{model_name}"):
+            tokenizer = _tokenizers.get(model_name)
+            if tokenizer is None:
+                tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAMES[model_name], use_fast=True)
+                _tokenizers[model_name] = tokenizer
+    return tokenizer
+
+
+def get_token_offsets(model_name: str):
+    """Return a function mapping text to the (start, end) character offsets of its tokens."""
+    tokenizer = get_tokenizer(model_name)
+
+    def token_offsets(text: str) -> np.ndarray:
+        encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                             return_attention_mask=False, return_token_type_ids=False, verbose=False)
+        return np.asarray(encoding["offset_mapping"], dtype=np.int64).reshape(-1, 2)
+    return token_offsets
 
 
+def max_chunk_tokens(model_name: str) -> int:
+    """Longest chunk, in content tokens, that model_name embeds without truncation."""
+    return MODEL_MAX_TOKENS[model_name] - SPECIAL_TOKENS_PER_CHUNK
@@ -0,0 +1,332 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no file locks, so only one process should use a cache directory at a time
+    fcntl = None
+
+## Persistent, content-addressed cache of chunk embeddings shared by every embedder.
+## Vectors for each model live in one raw float32 file that is memory-mapped, and a
+## small JSON index maps the hash of each chunk text to its row in that file. Rows
+## written since the index was last rewritten are appended to a log next to it, so a
+## store costs O(batch) instead of a rewrite of the whole index; the log is replayed on
+## load and folded back into the index once it grows as large as the index itself.
+## Processes sharing a cache directory take a file lock around every lookup and store,
+## and first catch up on what the others appended to the log or compacted.
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "./.embedding_cache")
+# Size cap for the vectors of a single model, in bytes
+EMBEDDING_CACHE_MAX_BYTES = int(float(os.getenv("EMBEDDING_CACHE_MAX_MB", "512")) * 1024 * 1024)
+# Rows to allocate when a model's vector file is first created
+INITIAL_CAPACITY = 1024
+# Log entries always allowed before the index is rewritten, however small it is
+MIN_LOG_ENTRIES = 4096
+
+
+def hash_text(text: str) -> str:
+    """Content hash used as the cache key for a chunk."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class _ModelStore:
+    """Vectors of one embedding model, with LRU eviction once max_rows is reached."""
+
+    def __init__(self, directory: str, embedding_dim: int, max_rows: int):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.index_path = os.path.join(directory, "index.json")
+        self.log_path = os.path.join(directory, "index.log")
+        self.lock_path = os.path.join(directory, "lock")
+        self.embedding_dim = embedding_dim
+        self.max_rows = max(1, max_rows)
+        # hash -> row, ordered from least to most recently used
+        self.rows: "OrderedDict[str, int]" = OrderedDict()
+        self.free_rows: List[int] = []
+        self.capacity = 0
+        self.vectors = None
+        # Entries in the log, i.e. puts since the index was last rewritten
+        self.log_entries = 0
+        # Bytes of the log already applied, and the index file they apply to
+        self._log_offset = 0
+        self._index_stat = None
+        self._log = None
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(self.lock_path, "a")
+        with self._file_lock():
+            self._load()
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def locked(self):
+        """Hold the store against other processes, up to date with what they wrote."""
+        with self._file_lock():
+            self._sync()
+            try:
+                yield
+            finally:
+                self._log.flush()
+                self._log_offset = os.fstat(self._log.fileno()).st_size
+
+    def _stat_index(self):
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _sync(self):
+        if self._stat_index() != self._index_stat:
+            # Another process rewrote the index (compaction or clear); start over from it
+            self.rows = OrderedDict()
+            self.free_rows = []
+            self.capacity = 0
+            self.vectors = None
+            self.log_entries = 0
+            self._load()
+            return
+        capacity = os.path.getsize(self.vectors_path) // (self.embedding_dim * 4)
+        grown = capacity > self.capacity
+        if grown:
+            self.vectors = None
+            self.capacity = capacity
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+",
+                                     shape=(self.capacity, self.embedding_dim))
+        if self._replay_log() or grown:
+            self._reset_free_rows()
+
+    def _reset_free_rows(self):
+        used = set(self.rows.values())
+        self.free_rows = [row for row in range(self.capacity - 1, -1, -1) if row not in used]
+
+    def _load(self):
+        self._log_offset = 0
+        if os.path.exists(self.index_path) and os.path.exists(self.vectors_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index["embedding_dim"] == self.embedding_dim:
+                # The vector file may have grown after the index was written
+                self.capacity = max(index["capacity"],
+                                    os.path.getsize(self.vectors_path) // (self.embedding_dim * 4))
+                self.rows = OrderedDict(zip(index["keys"], index["rows"]))
+                self._index_stat = self._stat_index()
+                self._replay_log()
+                self._reset_free_rows()
+                self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+",
+                                         shape=(self.capacity, self.embedding_dim))
+                if self._log is None:
+                    self._log = open(self.log_path, "a", encoding="utf-8")
+                return
+            # The model's dimension changed; the old vectors are useless
+            print(f"Embedding cache at {self.directory} has a different dimension, resetting it")
+        self._resize(min(INITIAL_CAPACITY, self.max_rows))
+        # Written right away so other processes find an index to go with the log
+        self.flush()
+
+    def _replay_log(self) -> int:
+        """Apply log entries past the ones already applied; returns how many there were."""
+        if not os.path.exists(self.log_path):
+            return 0
+        keys_by_row = {row: key for key, row in self.rows.items()}
+        replayed = 0
+        line = b"\n"
+        with open(self.log_path, "rb") as f:
+            f.seek(self._log_offset)
+            for line in f:
+                fields = line.decode("utf-8", errors="replace").split()
+                # A line cut short by a crash; its vector may not have been written either
+                if not line.endswith(b"\n") or len(fields) != 2 or not fields[1].isdigit() or int(fields[1]) >= self.capacity:
+                    continue
+                key, row = fields[0], int(fields[1])
+                # The row was reused, so whatever it held before is gone
+                evicted = keys_by_row.get(row)
+                if evicted is not None and evicted != key:
+                    del self.rows[evicted]
+                if self.rows.get(key, row) != row:
+                    del keys_by_row[self.rows[key]]
+                self.rows[key] = row
+                self.rows.move_to_end(key)
+                keys_by_row[row] = key
+                self.log_entries += 1
+                replayed += 1
+            self._log_offset = f.tell()
+        if not line.endswith(b"\n"):
+            # Drop the torn line so the next entry isn't glued to it
+            self._log_offset -= len(line)
+            with open(self.log_path, "ab") as f:
+                f.truncate(self._log_offset)
+        return replayed
+
+    def _resize(self, capacity: int):
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.vectors = None
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(capacity * self.embedding_dim * 4)
+        self.free_rows = list(range(capacity - 1, self.capacity - 1, -1)) + self.free_rows
+        self.capacity = capacity
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+",
+                                 shape=(self.capacity, self.embedding_dim))
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        row = self.rows.get(key)
+        if row is None:
+            return None
+        self.rows.move_to_end(key)
+        return self.vectors[row]
+
+    def put(self, key: str, vector: np.ndarray):
+        row = self.rows.get(key)
+        if row is None:
+            if not self.free_rows and self.capacity < self.max_rows:
+                self._resize(min(self.capacity * 2, self.max_rows))
+            if self.free_rows:
+                row = self.free_rows.pop()
+            else:
+                # Evict the least recently used vector and reuse its row
+                _, row = self.rows.popitem(last=False)
+        self.rows[key] = row
+        self.rows.move_to_end(key)
+        self.vectors[row] = vector
+        # Logged after the vector is written, so a logged row always holds its vector
+        self._log.write(f"{key} {row}\n")
+        self.log_entries += 1
+
+    def needs_compaction(self) -> bool:
+        return self.log_entries > max(MIN_LOG_ENTRIES, len(self.rows))
+
+    def clear(self):
+        self.rows.clear()
+        self.free_rows = list(range(self.capacity - 1, -1, -1))
+        self.flush()
+
+    def flush(self):
+        """Write the vectors and the whole LRU index to disk, and empty the log."""
+        self.vectors.flush()
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "embedding_dim": self.embedding_dim,
+                "capacity": self.capacity,
+                "keys": list(self.rows.keys()),
+                "rows": list(self.rows.values()),
+            }, f)
+        os.replace(tmp_path, self.index_path)
+        self._index_stat = self._stat_index()
+        if self._log is not None:
+            self._log.close()
+        open(self.log_path, "w").close()
+        # Append mode, so writes land after whatever other processes appended since
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        self.log_entries = 0
+        self._log_offset = 0
+
+
+class EmbeddingCache:
+    """On-disk embedding cache keyed by (model name, hash of chunk text)."""
+
+    def __init__(self, cache_dir: str = EMBEDDING_CACHE_DIR, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._stores: Dict[str, _ModelStore] = {}
+        self._lock = threading.Lock()
+
+    def _get_store(self, model_name: str, embedding_dim: int) -> _ModelStore:
+        store = self._stores.get(model_name)
+        if store is None:
+            directory = os.path.join(self.cache_dir, model_name.replace("/", "__"))
+            store = _ModelStore(directory, embedding_dim, self.max_bytes // (embedding_dim * 4))
+            self._stores[model_name] = store
+        return store
+
+    def lookup(self, model_name: str, chunks: List[str], embedding_dim: int) -> Tuple[np.ndarray, List[int]]:
+        """Return a (len(chunks), embedding_dim) matrix filled for every cached chunk,
+        and the positions of the chunks that still need to be embedded."""
+        embeddings = np.empty((len(chunks), embedding_dim), dtype=np.float32)
+        missing = []
+        with self._lock:
+            store = self._get_store(model_name, embedding_dim)
+            with store.locked():
+                for i, chunk in enumerate(chunks):
+                    vector = store.get(hash_text(chunk))
+                    if vector is None:
+                        missing.append(i)
+                    else:
+                        embeddings[i] = vector
+            self.hits += len(chunks) - len(missing)
+            self.misses += len(missing)
+        return embeddings, missing
+
+    def store(self, model_name: str, chunks: List[str], embeddings: np.ndarray):
+        """Add freshly computed embeddings for chunks and persist them."""
+        if len(chunks) == 0:
+            return
+        with self._lock:
+            store = self._get_store(model_name, embeddings.shape[1])
+            with store.locked():
+                for chunk, vector in zip(chunks, embeddings):
+                    store.put(hash_text(chunk), vector)
+                # The log is enough to recover these rows; rewrite the index only once in a while
+                if store.needs_compaction():
+                    store.flush()
+
+    def clear(self, model_name: Optional[str] = None):
+        """Forget cached vectors for one model, or for all models opened by this cache."""
+        with self._lock:
+            for name, store in self._stores.items():
+                if model_name is None or name == model_name:
+                    with store.locked():
+                        store.clear()
+
+    def flush(self):
+        with self._lock:
+            for store in self._stores.values():
+                with store.locked():
+                    store.flush()
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters since the cache was opened."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "cached_vectors": sum(len(store.rows) for store in self._stores.values()),
+        }
+
+
+_default_cache: Optional[EmbeddingCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Return the process-wide embedding cache, or None if disabled with EMBEDDING_CACHE_DISABLED=1."""
+    global _default_cache
+    if os.getenv("EMBEDDING_CACHE_DISABLED") == "1":
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+            # LRU order from cache hits is only persisted on flush
+            atexit.register(_default_cache.flush)
+    return _default_cache
@@ -1,15 +1,24 @@
 from dataclasses import dataclass, field
-from typing import List, Dict, Any, Optional
-from pinecone_vectordb import clear_pinecone_index, initialize_pinecone
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple
+from pinecone_vectordb import clear_pinecone_index
+from redis_vectordb import delete_index
+from chroma_vectordb import delete_chroma_collection
+from numpy_vectordb import clear_numpy_index
 from upload_to_chroma import perform_upload_chroma
 from upload_to_redis import perform_upload_redis
 from upload_to_pinecone import perform_upload_pinecone
+from upload_to_numpy import perform_upload_numpy
 from query_question import query_question
-from llm_models.llama import LLM
+from llm_models.llama import LLM, GENERATION_ERROR_PREFIX
+from response_cache import template_id
+from tracing import Tracer, span
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import time
 import sys
 import os
 import csv
+import json
 from datetime import datetime
 import psutil
 
@@ -18,16 +27,44 @@ questions = [
     "What is the purpose of logical replication (row based) in databases, and how is it different from statement-based replication?",
 ]
 
+# Attribute allocations to call sites with tracemalloc as well (slow; for investigations)
+TRACE_ALLOCATIONS = os.getenv("EXPERIMENT_TRACE_ALLOCATIONS", "0") == "1"
+
+# Scheduler limits. Databases can be swept in parallel (builds of one database stay
+# sequential since they share its index), each database runs up to its limit of
+# variants at once, and the local Ollama server gets at most MAX_CONCURRENT_GENERATIONS.
+# RSS is sampled per process, so with more than one database at a time a run's
+# peak_rss_mb and memory_usage include the other database's build; keep it at 1 when
+# those numbers matter.
+MAX_PARALLEL_DATABASES = int(os.getenv("EXPERIMENT_MAX_PARALLEL_DATABASES", "1"))
+MAX_CONCURRENT_GENERATIONS = int(os.getenv("EXPERIMENT_MAX_CONCURRENT_GENERATIONS", "2"))
+BACKEND_QUERY_LIMITS = {
+    "chroma": 4,
+    "redis": 4,
+    "pinecone": 4,
+    "numpy": 4,
+}
+
 db_embedding_map = {
     "chroma": "mxbai-embed-large",
     "redis": "nomic-embed-large",
-    "pinecone": "sentence-transformer"
+    "pinecone": "sentence-transformer",
+    "numpy": "sentence-transformer"
 }
     
 db_upload_map = {
     "chroma": perform_upload_chroma,
     "redis": perform_upload_redis,
-    "pinecone": perform_upload_pinecone
+    "pinecone": perform_upload_pinecone,
+    "numpy": perform_upload_numpy
+}
+
+# How to empty each backend before the next chunking config is uploaded
+db_teardown_map = {
+    "chroma": delete_chroma_collection,
+    "redis": lambda client: delete_index(client, delete_documents=True),
+    "pinecone": clear_pinecone_index,
+    "numpy": clear_numpy_index,
 }
 
 
@@ -41,98 +78,229 @@ class PipelineRun:
     chunk_size: int
     overlap: int
     question: str
+    prompt_id: str = ""  # template_id of the prompt, part of the resume key
     
     # Timing metrics
+    # embedding_time and upload_time belong to the index build this run queried. When
+    # index_reused is True the build was shared with an earlier run and its cost was not
+    # paid again; index_shared_by is the number of runs sharing that build.
     embedding_time: float = 0.0
     upload_time: float = 0.0
     query_time: float = 0.0
+    # Generation metrics from the LLM's streaming API (part of query_time)
+    time_to_first_token: Optional[float] = None
+    tokens_per_sec: float = 0.0
+    index_reused: bool = False
+    index_shared_by: int = 1
+    # Per-stage times (seconds) from the tracing spans of the build and of this query
+    load_time: float = 0.0
+    extract_time: float = 0.0
+    chunk_time: float = 0.0
+    retrieve_time: float = 0.0
+    prompt_build_time: float = 0.0
+    generate_time: float = 0.0
     
     # Results
     num_chunks: int = 0
     answer: str = ""
-    memory_usage: float = 0.0  # Memory usage in MB
+    # Process-wide, so only per run when databases are swept one at a time (MAX_PARALLEL_DATABASES=1)
+    memory_usage: float = 0.0  # Peak RSS above the RSS before the build, in MB
+    peak_rss_mb: float = 0.0  # Highest RSS sampled during the build and this query
+    trace: Dict[str, Any] = field(default_factory=dict)  # Span summaries: {"build": ..., "query": ...}
     score: Optional[float] = None  # For manual qualitative evaluation later
+
+
+@dataclass
+# One index build and the query variants that run against it
+class IndexBuild:
+    database: str
+    chunk_size: int
+    overlap: int
+    # (llm_model, prompt, question) combinations that query this index
+    variants: List[Tuple[LLM, str, str]] = field(default_factory=list)
     
+    # Filled in by build_index
+    index: Any = None
+    statistics: Dict[str, Any] = field(default_factory=dict)
+    mem_before: float = 0.0
+    build_peak_rss: float = 0.0
+    build_trace: Dict[str, Any] = field(default_factory=dict)
+
+
+def plan_sweep(databases, chunk_sizes, overlaps, llm_models, prompts, questions) -> List[IndexBuild]:
+    """Group the cartesian sweep by the only parameters the index depends on.
+    
+    The index is a function of (database, chunk_size, overlap), so each of those is built
+    once and every (llm, prompt, question) variant fans out from it.
+    """
+    builds = []
+    for db in databases:
+        for chunk_size in chunk_sizes:
+            for overlap in overlaps:
+                build = IndexBuild(database=db, chunk_size=chunk_size, overlap=overlap)
+                for llm in llm_models:
+                    for prompt in prompts:
+                        for question in questions:
+                            build.variants.append((llm, prompt, question))
+                builds.append(build)
+    return builds
+
+
+def build_index(path: str, build: IndexBuild) -> IndexBuild:
+    """Load, chunk, embed and upload the corpus for one build"""
+    process = psutil.Process(os.getpid())
+    build.mem_before = process.memory_info().rss / (1024 * 1024)
+    
+    # Embed the dataset and retrieve statistics; spans record per-stage time and peak RSS
+    with Tracer(trace_allocations=TRACE_ALLOCATIONS) as tracer:
+        build.index, build.statistics = db_upload_map[build.database](path, build.chunk_size, build.overlap)
+    
+    build.build_peak_rss = tracer.peak_rss_mb
+    build.build_trace = tracer.summary()
+    return build
+
+
+def teardown_index(build: IndexBuild):
+    """Empty the backend once no remaining variant needs this chunking config"""
+    if build.index is not None:
+        db_teardown_map[build.database](build.index)
+    build.index = None
+    
+
+class _LimitedLLM:
+    """Passes generations to an LLM while holding a shared semaphore.
+    
+    Waiting for the semaphore is traced as its own generate_wait span, so it doesn't
+    count towards the generate span it is nested in.
+    """
+    def __init__(self, llm: LLM, limiter: threading.Semaphore):
+        self.llm = llm
+        self.model_name = llm.model_name
+        self.limiter = limiter
+    
+    @property
+    def last_metrics(self):
+        return self.llm.last_metrics
+    
+    def generate_response(self, prompt):
+        with span("generate_wait"):
+            self.limiter.acquire()
+        try:
+            return self.llm.generate_response(prompt)
+        finally:
+            self.limiter.release()
+
 
 def run_pipeline_variant(
-    path: str,
+    build: IndexBuild,
     question: str,
     llm_model: LLM,
-    database: str,
-    chunk_size: int,
-    overlap: int,
     prompt: str,
+    index_reused: bool = False,
+    generation_limiter: Optional[threading.Semaphore] = None,
     ) -> PipelineRun:
-    """Run a specific variant of the pipeline and collect statistics"""
+    """Run a specific variant of the pipeline against an already built index and collect statistics"""
     
     
     result = PipelineRun(
-        embedding_model=db_embedding_map[database],
-        database=database,
+        embedding_model=db_embedding_map[build.database],
+        database=build.database,
         llm_model=llm_model,
-        chunk_size=chunk_size,
-        overlap=overlap,
+        chunk_size=build.chunk_size,
+        overlap=build.overlap,
         question=question,
+        prompt_id=template_id(prompt),
+        index_reused=index_reused,
+        index_shared_by=len(build.variants),
     )
     
-    # Retrieve the appropriate upload function based on the database
-    db_upload_func = db_upload_map[database]
-    
-    # Measure memory usage before execution
-    process = psutil.Process(os.getpid()) 
-    mem_before = process.memory_info().rss / (1024 * 1024)
-    
-    # Embed the dataset and retrieve statistics
-    index, statistics = db_upload_func(path, chunk_size, overlap)
-    
-    # Measure memory usage after embedding
-    mem_after_embedding = process.memory_info().rss / (1024 * 1024)
-    
+    # Store the build statistics in the result object
+    result.embedding_time = build.statistics["embed_time"]
+    result.upload_time = build.statistics["upload_time"]
+    result.num_chunks = build.statistics["indexed_chunks"]
+    result.load_time = build.build_trace.get("load", {}).get("time", 0.0)
+    result.extract_time = build.build_trace.get("extract", {}).get("time", 0.0)
+    result.chunk_time = build.build_trace.get("chunk", {}).get("time", 0.0)
     
-    # Store the statistics in the result object
-    result.embedding_time = statistics["embed_time"]
-    result.upload_time = statistics["upload_time"]
-    result.num_chunks = statistics["chunk_count"]
+    with Tracer(trace_allocations=TRACE_ALLOCATIONS) as tracer:
+        query_start_time = time.perf_counter()
+        llm = _LimitedLLM(llm_model, generation_limiter) if generation_limiter is not None else llm_model
+        answer = query_question(build.database, build.index, question, llm, prompt)
+        query_time = time.perf_counter() - query_start_time
     
-    # Measure memory usage before query
-    mem_before_query = process.memory_info().rss / (1024 * 1024)
+    # Ollama errors come back as the answer; they must not be recorded as a finished run
+    if answer.startswith(GENERATION_ERROR_PREFIX):
+        raise RuntimeError(answer)
     
-    query_start_time = time.time()
-    answer = query_question(database, index, question, llm_model, prompt)
-    query_time = time.time() - query_start_time
-    
-    # Measure memory usage after query
-    mem_after_query = process.memory_info().rss / (1024 * 1024)
-    
-    result.query_time = query_time
+    # Time spent queued behind other variants' generations is not part of this query
+    result.query_time = query_time - tracer.stage_time("generate_wait")
+    result.retrieve_time = tracer.stage_time("retrieve")
+    result.prompt_build_time = tracer.stage_time("prompt_build")
+    result.generate_time = tracer.stage_time("generate")
+    result.trace = {"build": build.build_trace, "query": tracer.summary()}
     result.answer = answer
+    metrics = llm_model.last_metrics
+    if metrics is not None:
+        result.time_to_first_token = metrics.time_to_first_token
+        result.tokens_per_sec = metrics.tokens_per_sec
     
-    # Calculate peak memory usage during the run
-    result.memory_usage = max(mem_after_embedding, mem_after_query) - mem_before
+    # Peak memory during the build and this query, as sampled by the tracers
+    result.peak_rss_mb = max(build.build_peak_rss, tracer.peak_rss_mb)
+    result.memory_usage = result.peak_rss_mb - build.mem_before
     
     print(result)
     
     return result
 
-# Example of running experiments
-results: List[PipelineRun] = []
-
-
-if len(sys.argv) < 2:
-    print("Please provide a directory path containing PDF documents")
-    print("Usage: python experiment.py <directory_path>")
-    quit()
 
-directory_path = sys.argv[1]
-
-if not os.path.isdir(directory_path):
-    print(f"Error: {directory_path} is not a valid directory")
-    quit()
+def run_build(
+    path: str,
+    build: IndexBuild,
+    on_result: Optional[Callable[[PipelineRun], None]] = None,
+    max_workers: int = 1,
+    generation_limiter: Optional[threading.Semaphore] = None,
+) -> List[PipelineRun]:
+    """Build one index, run every variant against it, then tear it down.
+    
+    Up to max_workers variants run at once; on_result is called with each run as soon
+    as it finishes.
+    """
+    runs = []
+    try:
+        build_index(path, build)
+    except Exception as e:
+        print(f"Error building {build.database} index with chunk_size={build.chunk_size}, overlap={build.overlap}: {e}")
+        return runs
+    
+    if build.index is None:
+        print(f"No index was built for {build.database}, chunk_size={build.chunk_size}, overlap={build.overlap}")
+        return runs
+    
+    def run_variant(i, llm, prompt, question):
+        try:
+            run = run_pipeline_variant(build, question, llm, prompt, index_reused=i > 0,
+                                       generation_limiter=generation_limiter)
+        except Exception as e:
+            print(f"Error running experiment with {build.database}, {llm.model_name}, chunk_size={build.chunk_size}, overlap={build.overlap}: {e}")
+            return
+        runs.append(run)
+        if on_result is not None:
+            on_result(run)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(run_variant, i, llm, prompt, question)
+                       for i, (llm, prompt, question) in enumerate(build.variants)]
+            for future in futures:
+                future.result()
+    finally:
+        teardown_index(build)
+    return runs
 
 # Configuration variants to test
 llama = LLM("llama3.2")
 mistral = LLM("mistral")
-databases = ["chroma", "redis", "pinecone"]
+databases = ["chroma", "redis", "pinecone", "numpy"]
 llm_models = [llama, mistral]
 prompts = [
     """Synthesize the information across these documents to provide a comprehensive answer. 
@@ -149,92 +317,199 @@ prompts = [
 chunk_sizes = [200, 500]
 overlaps = [0, 100]
 
+# CSV columns, in order; prompt_id identifies the prompt template for resuming sweeps
+RESULT_FIELDS = [
+    "embedding_model", "database", "llm_model", "chunk_size", "overlap", 
+    "question", "prompt_id", "embedding_time", "upload_time", "query_time", 
+    "time_to_first_token", "tokens_per_sec",
+    "index_reused", "index_shared_by",
+    "load_time", "extract_time", "chunk_time",
+    "retrieve_time", "prompt_build_time", "generate_time",
+    "num_chunks", "answer", "memory_usage", "peak_rss_mb", "score", "trace",
+]
+
+def _result_row(result: PipelineRun) -> Dict[str, Any]:
+    """Convert a PipelineRun to a CSV row"""
+    return {
+        "embedding_model": result.embedding_model,
+        "database": result.database,
+        "llm_model": result.llm_model.model_name if hasattr(result.llm_model, 'model_name') else str(result.llm_model),
+        "chunk_size": result.chunk_size,
+        "overlap": result.overlap,
+        "question": result.question,
+        "prompt_id": result.prompt_id,
+        "embedding_time": result.embedding_time,
+        "upload_time": result.upload_time,
+        "query_time": result.query_time,
+        "time_to_first_token": result.time_to_first_token if result.time_to_first_token is not None else "",
+        "tokens_per_sec": result.tokens_per_sec,
+        "index_reused": result.index_reused,
+        "index_shared_by": result.index_shared_by,
+        "load_time": result.load_time,
+        "extract_time": result.extract_time,
+        "chunk_time": result.chunk_time,
+        "retrieve_time": result.retrieve_time,
+        "prompt_build_time": result.prompt_build_time,
+        "generate_time": result.generate_time,
+        "num_chunks": result.num_chunks,
+        "answer": result.answer,
+        "memory_usage": result.memory_usage if result.memory_usage is not None else "",
+        "peak_rss_mb": result.peak_rss_mb,
+        "score": result.score if result.score is not None else "",
+        "trace": json.dumps(result.trace),
+    }
+
 # Write results out into CSV
 def write_results_to_csv(results, csv_path, append=False):
     """Write results to CSV file, either creating a new file or appending to existing one"""
-    # Define CSV headers based on PipelineRun fields
-    headers = [
-        "embedding_model", "database", "llm_model", "chunk_size", "overlap", 
-        "question", "embedding_time", "upload_time", "query_time", 
-        "num_chunks", "answer", "memory_usage", "score", 
-    ]
-    
     # Open file in append mode if append=True and file exists, otherwise write mode
     mode = 'a' if append and os.path.exists(csv_path) else 'w'
     
     # Write results to CSV
     with open(csv_path, mode, newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=headers)
+        writer = csv.DictWriter(csvfile, fieldnames=RESULT_FIELDS)
         
         # Write header only if we're creating a new file
         if mode == 'w':
             writer.writeheader()
         
         for result in results:
-            # Convert the result to a dictionary
-            result_dict = {
-                "embedding_model": result.embedding_model,
-                "database": result.database,
-                "llm_model": result.llm_model.model_name if hasattr(result.llm_model, 'model_name') else str(result.llm_model),
-                "chunk_size": result.chunk_size,
-                "overlap": result.overlap,
-                "question": result.question,
-                "embedding_time": result.embedding_time,
-                "upload_time": result.upload_time,
-                "query_time": result.query_time,
-                "num_chunks": result.num_chunks,
-                "answer": result.answer,
-                "memory_usage": result.memory_usage if result.memory_usage is not None else "",
-                "score": result.score if result.score is not None else ""
-            }
-            writer.writerow(result_dict)
+            writer.writerow(_result_row(result))
     
     print(f"Results written to {csv_path}")
 
-csv_path = "./experiment_results.csv"
 
-# Run experiments with different configurations
-for db in databases:
-    db_results = []
-    for llm in llm_models:
-        for chunk_size in chunk_sizes:
-            for overlap in overlaps:
-                for prompt in prompts:
-                    for question in questions:
-                        try:
-                            # Record memory usage before the run
-                            
-                            run = run_pipeline_variant(
-                                path=directory_path,
-                                question=question,
-                                llm_model=llm,
-                                database=db,
-                                chunk_size=chunk_size,
-                                overlap=overlap,
-                                prompt=prompt
-                            )
-                            
-                            db_results.append(run)
-                        except Exception as e:
-                            print(f"Error running experiment with {db}, {llm.model_name}, chunk_size={chunk_size}, overlap={overlap}: {e}")
-                            continue
-                    # Delete pinecone index after each overlap switch
-                    if db == "pinecone":
-                        index = initialize_pinecone()
-                        clear_pinecone_index(index)
-                # Delete pinecone index after each chunk size switch
-                if db == "pinecone":
-                    index = initialize_pinecone()
-                    clear_pinecone_index(index)
-    # Write results for this database to CSV
-    print(f"Writing results for database: {db}")
-    # For the first database, create a new file; for others, append
-    append_mode = db != databases[0]
-    write_results_to_csv(db_results, csv_path, append=append_mode)
-    
-    print(f"Completed experiments for database: {db}")
+class ResultLog:
+    """Append-only CSV of finished runs, safe to share between threads.
     
+    Every run is flushed and fsync'd as soon as it is appended, so an interrupted
+    sweep loses at most the runs that were still in flight.
+    """
+    def __init__(self, csv_path: str):
+        self.csv_path = csv_path
+        self._lock = threading.Lock()
+        
+        # Results written with other columns can't be appended to; keep them aside
+        if os.path.exists(csv_path) and os.path.getsize(csv_path) > 0:
+            with open(csv_path, newline='', encoding='utf-8') as csvfile:
+                header = next(csv.reader(csvfile), [])
+            if header != RESULT_FIELDS:
+                moved_path = f"{os.path.splitext(csv_path)[0]}_{datetime.now():%Y%m%d_%H%M%S}.csv"
+                os.replace(csv_path, moved_path)
+                print(f"{csv_path} has different columns; moved it to {moved_path}")
     
+    def append(self, result: PipelineRun):
+        with self._lock:
+            new_file = not os.path.exists(self.csv_path) or os.path.getsize(self.csv_path) == 0
+            with open(self.csv_path, 'a', newline='', encoding='utf-8') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=RESULT_FIELDS)
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(_result_row(result))
+                csvfile.flush()
+                os.fsync(csvfile.fileno())
+
+
+def run_key(database: str, llm_model_name: str, chunk_size: int, overlap: int, prompt_id: str, question: str) -> Tuple:
+    """Identity of one sweep variant, used to skip runs that already finished"""
+    return (database, llm_model_name, int(chunk_size), int(overlap), prompt_id, question)
 
 
+def load_completed_keys(csv_path: str) -> Set[Tuple]:
+    """Keys of the runs already recorded in csv_path.
+    
+    Rows without a prompt_id, and rows whose answer is a generation error, are ignored so
+    those runs are repeated.
+    """
+    completed = set()
+    if not os.path.exists(csv_path):
+        return completed
+    with open(csv_path, newline='', encoding='utf-8') as csvfile:
+        for row in csv.DictReader(csvfile):
+            try:
+                if row.get("prompt_id") and not (row.get("answer") or "").startswith(GENERATION_ERROR_PREFIX):
+                    completed.add(run_key(row["database"], row["llm_model"], row["chunk_size"],
+                                          row["overlap"], row["prompt_id"], row["question"]))
+            except (KeyError, TypeError, ValueError):
+                # A row cut short by a crash; the run will simply be repeated
+                continue
+    return completed
+
+
+def skip_completed(builds: List[IndexBuild], completed: Set[Tuple]) -> List[IndexBuild]:
+    """Drop finished variants, and builds with nothing left to run."""
+    remaining = []
+    for build in builds:
+        build.variants = [
+            (llm, prompt, question) for llm, prompt, question in build.variants
+            if run_key(build.database, llm.model_name, build.chunk_size, build.overlap,
+                       template_id(prompt), question) not in completed
+        ]
+        if build.variants:
+            remaining.append(build)
+    return remaining
+
+
+def run_sweep(
+    path: str,
+    builds: List[IndexBuild],
+    on_result: Callable[[PipelineRun], None],
+    max_parallel_databases: int = MAX_PARALLEL_DATABASES,
+    max_concurrent_generations: int = MAX_CONCURRENT_GENERATIONS,
+    backend_query_limits: Optional[Dict[str, int]] = None,
+):
+    """Run builds concurrently within the scheduler limits, reporting every run to on_result.
+    
+    Peak RSS is per process, so it only belongs to one run with max_parallel_databases=1
+    (the default). Concurrent generations share the Ollama server, so use
+    max_concurrent_generations=1 when generation speed matters more than sweep time.
+    """
+    backend_query_limits = backend_query_limits or BACKEND_QUERY_LIMITS
+    generation_limiter = threading.Semaphore(max_concurrent_generations)
+    builds_by_database: Dict[str, List[IndexBuild]] = {}
+    for build in builds:
+        builds_by_database.setdefault(build.database, []).append(build)
+    
+    def run_database(db):
+        for build in builds_by_database[db]:
+            run_build(path, build, on_result, backend_query_limits.get(db, 1), generation_limiter)
+        print(f"Completed experiments for database: {db}")
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_parallel_databases)) as executor:
+        for future in [executor.submit(run_database, db) for db in builds_by_database]:
+            future.result()
+
+csv_path = "./experiment_results.csv"
+
+def main():
+    if len(sys.argv) < 2:
+        print("Please provide a directory path containing PDF documents")
+        print("Usage: python experiment.py <directory_path> [--restart]")
+        return
+
+    directory_path = sys.argv[1]
+
+    if not os.path.isdir(directory_path):
+        print(f"Error: {directory_path} is not a valid directory")
+        return
+
+    # Start over instead of resuming from the runs already in the results file
+    if "--restart" in sys.argv[2:] and os.path.exists(csv_path):
+        os.remove(csv_path)
+
+    # Each (database, chunk_size, overlap) index is built once and shared by its variants
+    builds = plan_sweep(databases, chunk_sizes, overlaps, llm_models, prompts, questions)
+    
+    # Resume: skip variants already recorded by an earlier, interrupted sweep
+    completed = load_completed_keys(csv_path)
+    builds = skip_completed(builds, completed)
+    remaining = sum(len(build.variants) for build in builds)
+    print(f"{len(completed)} runs already completed, {remaining} to go in {len(builds)} index builds")
+    
+    # Run experiments with different configurations; each run is appended as it finishes
+    results = ResultLog(csv_path)
+    run_sweep(directory_path, builds, results.append)
+    print(f"Results written to {csv_path}")
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import os
+from typing import Dict, List, Optional
+import numpy as np
+from bm25_index import reciprocal_rank_fusion
+from embed import get_embedder
+# Searches the NumPy index, so it shares its embedding model and manifest
+from numpy_vectordb import EMBEDDING_MODEL, MANIFEST_NAME, NumpyVectorIndex, search_numpy_many
+
+## Hybrid retrieval over the NumPy index and the BM25 index kept next to it. Both hold
+## the same chunks under the same IDs, so their rankings can be combined:
+##
+##   rrf     full vector search and BM25, fused with reciprocal rank fusion
+##   rerank  BM25 picks the candidates and exact cosine similarity orders them, so a
+##           query scores a few dozen vectors instead of the whole matrix
+##   bm25    lexical only
+
+HYBRID_MODE = os.getenv("HYBRID_MODE", "rrf")
+# Results taken from each ranking before fusion, or BM25 candidates that get rescored
+HYBRID_CANDIDATES = 50
+# Rank offset of reciprocal rank fusion; larger values flatten the head of each ranking
+RRF_K = 60
+
+HYBRID_MODES = ("rrf", "rerank", "bm25")
+
+
+def _hit(index: NumpyVectorIndex, chunk_id: str, row: int, score: float) -> Dict:
+    return {"id": chunk_id, "text": index.texts[row], "score": float(score)}
+
+
+def search_hybrid_many(
+    index: NumpyVectorIndex,
+    query_embeddings: np.ndarray,
+    top_k: int = 1,
+    query_texts: Optional[List[str]] = None,
+    mode: str = HYBRID_MODE,
+    candidates: int = HYBRID_CANDIDATES,
+) -> List[List[Dict]]:
+    """Hybrid search for many queries; one [{"id", "text", "score"}] list per query, best first.
+
+    Without query_texts this is plain vector search. Scores are fused RRF scores, cosine
+    similarities or BM25 scores depending on the mode.
+    """
+    if query_texts is None:
+        return search_numpy_many(index, query_embeddings, top_k)
+    if mode not in HYBRID_MODES:
+        raise ValueError(f"Unknown hybrid mode: {mode} (expected one of {', '.join(HYBRID_MODES)})")
+    if index.lexical is None:
+        raise ValueError("The NumPy index has no BM25 index; re-run upload_to_numpy.py with NUMPY_BM25=1")
+
+    vector_hits = None
+    if mode == "rrf":
+        # One matmul for every query's vector ranking
+        vector_hits = search_numpy_many(index, query_embeddings, max(top_k, candidates))
+
+    results = []
+    for position, (query_text, query_embedding) in enumerate(zip(query_texts, query_embeddings)):
+        lexical = index.lexical.search(query_text, max(top_k, candidates))
+        if mode == "bm25":
+            ranked = lexical[:top_k]
+            rows = index.rows_of([chunk_id for chunk_id, _ in ranked])
+            results.append([_hit(index, chunk_id, row, score) for (chunk_id, score), row in zip(ranked, rows)])
+        elif mode == "rrf":
+            fused = reciprocal_rank_fusion(
+                [[chunk_id for chunk_id, _ in lexical], [hit["id"] for hit in vector_hits[position]]], RRF_K,
+            )[:top_k]
+            rows = index.rows_of([chunk_id for chunk_id, _ in fused])
+            results.append([_hit(index, chunk_id, row, score) for (chunk_id, score), row in zip(fused, rows)])
+        else:
+            ids = [chunk_id for chunk_id, _ in lexical]
+            rows = index.rows_of(ids)
+            scores = index.similarities(query_embedding, rows) if len(rows) else np.empty(0, dtype=np.float32)
+            order = np.argsort(-scores, kind="stable")[:top_k]
+            hits = [_hit(index, ids[i], rows[i], scores[i]) for i in order]
+            if len(hits) < top_k:
+                # Too few term matches to fill top_k; make up the rest from vector search
+                seen = {hit["id"] for hit in hits}
+                extra = search_numpy_many(index, np.asarray(query_embedding)[None, :], top_k + len(hits))[0]
+                hits.extend(hit for hit in extra if hit["id"] not in seen)
+                hits = hits[:top_k]
+            results.append(hits)
+    return results
+
+
+def search_hybrid(index: NumpyVectorIndex, query_embedding: np.ndarray, top_k: int = 1,
+                  query_text: Optional[str] = None, mode: str = HYBRID_MODE) -> List[Dict]:
+    """Hybrid search for one query; see search_hybrid_many."""
+    query_texts = None if query_text is None else [query_text]
+    return search_hybrid_many(index, np.asarray(query_embedding).reshape(1, -1), top_k, query_texts, mode)[0]
+
+
+def query_hybrid(index: NumpyVectorIndex, query_text: str, top_k: int = 1, mode: str = HYBRID_MODE):
+    """Query the NumPy and BM25 indexes together and return the most relevant context."""
+    if mode == "bm25":
+        # Lexical search never looks at the embedding
+        query_embedding = np.zeros(1, dtype=np.float32)
+    else:
+        # Embed the user query
+        query_embedding = get_embedder(EMBEDDING_MODEL).embed_query(query_text)
+
+    hits = search_hybrid(index, query_embedding, top_k, query_text, mode)
+    return "\n\n".join(hit["text"] for hit in hits)
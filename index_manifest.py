@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+## Manifest of what each vector index currently holds, so re-uploading a folder only
+## re-chunks, re-embeds and upserts the PDFs that are new or changed, and deletes the
+## chunks of PDFs that changed or disappeared.
+
+MANIFEST_DIR = os.getenv("INDEX_MANIFEST_DIR", "./.index_manifests")
+
+
+def chunk_id(source: str, chunk_size: int, overlap: int, offset, unit: str = "words") -> str:
+    """Deterministic ID for the chunk starting at offset in source under a chunking config."""
+    # Word-based IDs keep their original form so existing indexes stay valid
+    key = f"{source}|{chunk_size}|{overlap}|{offset}" if unit == "words" else f"{source}|{chunk_size}|{overlap}|{unit}|{offset}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return f"doc_{digest[:24]}"
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class IndexPlan:
+    """Which files need work to bring an index up to date with a directory"""
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    # Content hash of every file currently in the directory
+    hashes: Dict[str, str] = field(default_factory=dict)
+
+
+class IndexManifest:
+    """Per-index record of each source file's hash, chunking config and chunk IDs"""
+
+    def __init__(self, name: str, manifest_dir: str = MANIFEST_DIR):
+        self.path = os.path.join(manifest_dir, f"{name}.json")
+        # filename -> {"hash", "chunk_size", "overlap", "unit", "chunk_ids"}
+        self.files: Dict[str, Dict] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.files = json.load(f)
+
+    def plan(self, directory_path: str, chunk_size: int, overlap: int, unit: str = "words",
+             hashes: Optional[Dict[str, str]] = None) -> IndexPlan:
+        """hashes, if given, are content hashes already computed for this directory."""
+        plan = IndexPlan()
+        for filename in sorted(os.listdir(directory_path)):
+            path = os.path.join(directory_path, filename)
+            if not os.path.isfile(path):
+                continue
+            plan.hashes[filename] = hashes[filename] if hashes and filename in hashes else file_hash(path)
+            entry = self.files.get(filename)
+            if (entry is not None
+                    and entry["hash"] == plan.hashes[filename]
+                    and entry["chunk_size"] == chunk_size
+                    and entry["overlap"] == overlap
+                    and entry.get("unit", "words") == unit):
+                plan.unchanged.append(filename)
+            else:
+                plan.changed.append(filename)
+        plan.removed = [filename for filename in self.files if filename not in plan.hashes]
+
+        # A deduplicated file lists chunk IDs of the file its duplicates were kept under.
+        # Those IDs get new text (or disappear) when that file changes, so the files
+        # referencing them are re-chunked too and pick up their own copies again.
+        rewritten = {chunk for filename in plan.changed + plan.removed for chunk in self.chunk_ids(filename)}
+        if rewritten:
+            for filename in list(plan.unchanged):
+                if not rewritten.isdisjoint(self.files[filename]["chunk_ids"]):
+                    plan.unchanged.remove(filename)
+                    plan.changed.append(filename)
+        return plan
+
+    def chunk_ids(self, filename: str) -> List[str]:
+        entry = self.files.get(filename)
+        return entry["chunk_ids"] if entry else []
+
+    def record(self, filename: str, content_hash: str, chunk_size: int, overlap: int, chunk_ids: List[str],
+               unit: str = "words"):
+        self.files[filename] = {
+            "hash": content_hash,
+            "chunk_size": chunk_size,
+            "overlap": overlap,
+            "unit": unit,
+            "chunk_ids": chunk_ids,
+        }
+
+    def forget(self, filename: str):
+        self.files.pop(filename, None)
+
+    def chunk_count(self) -> int:
+        # Files can share deduplicated chunks, so count distinct IDs
+        return len({chunk for entry in self.files.values() for chunk in entry["chunk_ids"]})
+
+    def sources(self, chunk_id: str) -> List[str]:
+        """Every file whose text contains the chunk (more than one when it was deduplicated)."""
+        return [filename for filename, entry in self.files.items() if chunk_id in entry["chunk_ids"]]
+
+    def reset(self):
+        """Forget everything, e.g. after the index itself was wiped."""
+        self.files = {}
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.files, f)
+        os.replace(tmp_path, self.path)
+
+
+def reset_manifest(name: str, manifest_dir: Optional[str] = None):
+    """Clear the manifest of an index that has just been emptied."""
+    IndexManifest(name, manifest_dir or MANIFEST_DIR).reset()
+
+
+def index_version(name: str, manifest_dir: Optional[str] = None) -> str:
+    """Token that changes whenever the index's manifest is rewritten (re-upload, wipe).
+
+    Lets in-memory caches of query results notice that the index was rebuilt, even by
+    another process.
+    """
+    path = os.path.join(manifest_dir or MANIFEST_DIR, f"{name}.json")
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return "none"
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
@@ -0,0 +1,496 @@
+import itertools
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from document_loader import _iter_pdf, iter_loaded_pdfs
+from chunking import iter_chunks, iter_token_chunks
+from embed import get_token_offsets, max_chunk_tokens
+from dedup import ChunkDeduplicator
+from index_manifest import IndexManifest, IndexPlan, chunk_id
+from tracing import current_tracer
+
+## Streaming ingestion pipeline: load -> chunk -> embed -> upload.
+## Each stage runs in its own thread and hands batches to the next through a bounded
+## queue, so embedding and uploading overlap and at most ~queue_size batches per stage
+## are held in memory regardless of how large the corpus is. PDFs are parsed ahead by a
+## pool of worker processes, which adds up to 2 * INGEST_LOAD_WORKERS parsed files
+## waiting to be chunked. Several stores can be fed
+## from one pass (run_multi_ingestion): files are loaded and chunked once, embedded once
+## per embedding model, and uploaded to every store concurrently.
+
+# Chunks per embedding/upload batch
+INGEST_BATCH_SIZE = 64
+# Batches allowed to wait between two stages before the producer blocks
+INGEST_QUEUE_SIZE = 4
+# What chunk_size and overlap count: "words" (whitespace split, as chunk_text does) or
+# "tokens" of the embedding model's own tokenizer, so chunks fit its context window
+CHUNK_UNIT = os.getenv("CHUNK_UNIT", "words")
+# Drop exact and near-duplicate chunks before they are embedded (see dedup.py)
+INGEST_DEDUP = os.getenv("INGEST_DEDUP", "1") == "1"
+# Processes parsing PDFs ahead of the chunker; 1 parses them lazily in the pipeline itself
+INGEST_LOAD_WORKERS = int(os.getenv("INGEST_LOAD_WORKERS", str(os.cpu_count() or 1)))
+# Seconds a worker may spend on one PDF before it is skipped (0 waits forever)
+INGEST_LOAD_TIMEOUT = float(os.getenv("INGEST_LOAD_TIMEOUT", "0")) or None
+
+_DONE = object()
+
+
+def iter_pdf_pages(
+    directory_path: str,
+    filenames: Optional[List[str]] = None,
+    errors: Optional[Dict[str, str]] = None,
+    tracer=None,
+    load_workers: int = INGEST_LOAD_WORKERS,
+    timeout: Optional[float] = INGEST_LOAD_TIMEOUT,
+) -> Iterator[Tuple[str, str]]:
+    """Yield (filename, page_text) for every page of every PDF, file by file in order.
+
+    With more than one load worker, files are parsed ahead in a process pool (see
+    document_loader.iter_loaded_pdfs), and waiting for the next file is traced as "load";
+    extraction happens in the workers, so there are no "extract" spans. With one worker,
+    pages are parsed lazily in this thread and timeout does not apply: opening a file and
+    parsing up to its first page is traced as "load", and each following page as "extract".
+    """
+    tracer = tracer or current_tracer()
+    if filenames is None:
+        filenames = [
+            filename for filename in sorted(os.listdir(directory_path))
+            if os.path.isfile(os.path.join(directory_path, filename))
+        ]
+
+    def failed(filename, error):
+        if errors is not None:
+            errors[filename] = error
+        else:
+            print(f"Error processing {filename}: {error}")
+
+    if load_workers > 1 and len(filenames) > 1:
+        loaded = iter_loaded_pdfs(directory_path, filenames, load_workers, timeout)
+        try:
+            while True:
+                with tracer.span("load"):
+                    item = next(loaded, None)
+                if item is None:
+                    return
+                filename, pages, error = item
+                if error is not None:
+                    failed(filename, error)
+                    continue
+                for page in pages:
+                    yield filename, page.page_content
+        finally:
+            # Stops the worker processes if the consumer gives up early
+            loaded.close()
+
+    for filename in filenames:
+        try:
+            with tracer.span("load"):
+                pages = _iter_pdf(os.path.join(directory_path, filename))
+                page = next(pages, None)
+            while page is not None:
+                yield filename, page.page_content
+                with tracer.span("extract"):
+                    page = next(pages, None)
+        except Exception as e:
+            failed(filename, str(e))
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put that gives up once another stage has failed."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+@dataclass
+class IngestTarget:
+    """One store fed by run_multi_ingestion: its embedder and how to write to it"""
+    name: str
+    embedder: Any
+    # upload_batch(embeddings, documents, ids), see run_ingestion
+    upload_batch: Callable[[Any, List[Dict[str, Any]], List[str]], None]
+    # Only needed for incremental ingestion
+    delete_ids: Optional[Callable[[List[str]], None]] = None
+    manifest: Optional[IndexManifest] = None
+    # The store's client or index, handed back to the caller untouched
+    index: Any = None
+
+
+def _empty_statistics() -> Dict[str, Any]:
+    return {"embed_time": 0.0, "upload_time": 0.0, "upload_done_time": 0.0, "chunk_count": 0,
+            "wall_time": 0.0, "ids_by_source": {}, "load_errors": {}}
+
+
+def run_multi_ingestion(
+    directory_path: str,
+    targets: List[IngestTarget],
+    chunk_size: int,
+    overlap: int,
+    batch_size: int = INGEST_BATCH_SIZE,
+    queue_size: int = INGEST_QUEUE_SIZE,
+    filenames: Optional[Dict[str, List[str]]] = None,
+    pages: Optional[Iterable[Tuple[str, str]]] = None,
+    chunk_unit: str = CHUNK_UNIT,
+    dedup: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """Ingest PDFs into several stores while loading and chunking every file only once.
+
+    Chunks are embedded once per distinct embedding model (targets sharing a model share
+    the embeddings) and every target gets its own upload thread, so the stores are
+    written concurrently. filenames maps a target name to the files it needs; targets
+    missing from it get every file. Each target is deduplicated separately.
+
+    Returns {"targets": {name: statistics as in run_ingestion}, "embed_time_by_model",
+    "wall_time", "load_errors"}. A target's "upload_done_time" is when its last batch
+    was written, counted from the start of the run.
+    """
+    names = [target.name for target in targets]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate target names: {names}")
+    if chunk_unit not in ("words", "tokens"):
+        raise ValueError(f"Unknown chunk unit: {chunk_unit}")
+    use_dedup = INGEST_DEDUP if dedup is None else dedup
+    wanted = {name: set(files) for name, files in (filenames or {}).items() if name in names}
+    if len(wanted) == len(targets):
+        load_files = sorted(set().union(*wanted.values()))
+    else:
+        load_files = None
+
+    # Targets grouped by embedding model, and models grouped by chunker: word windows
+    # are the same for every model, token windows depend on the model's tokenizer
+    models: Dict[str, Dict[str, Any]] = {}
+    for target in targets:
+        model = models.setdefault(target.embedder.model_name, {"embedder": target.embedder, "targets": []})
+        model["targets"].append(target)
+    chunkers: Dict[Optional[str], Tuple[Callable, List[str]]] = {}
+    for model_name in models:
+        if chunk_unit == "tokens":
+            token_offsets = get_token_offsets(model_name)
+            window_size = min(chunk_size, max_chunk_tokens(model_name))
+            if window_size < chunk_size:
+                print(f"chunk_size {chunk_size} exceeds what {model_name} embeds; using {window_size} tokens")
+            if overlap >= window_size:
+                raise ValueError(f"overlap ({overlap}) must be smaller than the chunk size ({window_size} tokens)")
+            chunkers[model_name] = (
+                lambda page_stream, offsets=token_offsets, size=window_size:
+                    iter_token_chunks(page_stream, offsets, size, overlap),
+                [model_name],
+            )
+        else:
+            chunkers.setdefault(None, (lambda page_stream: iter_chunks(page_stream, chunk_size, overlap), []))[1].append(model_name)
+
+    # Worker threads don't inherit the caller's tracer, so hand it over explicitly
+    tracer = current_tracer()
+    chunk_queues = {model_name: queue.Queue(maxsize=queue_size) for model_name in models}
+    upload_queues = {name: queue.Queue(maxsize=queue_size) for name in names}
+    stop = threading.Event()
+    failures = []
+    load_errors: Dict[str, str] = {}
+    embed_time_by_model = {model_name: 0.0 for model_name in models}
+    statistics = {name: _empty_statistics() for name in names}
+    deduplicators = {name: ChunkDeduplicator() for name in names} if use_dedup else {}
+    # IDs of kept chunks that stand in for a source's duplicate chunks, per target
+    duplicate_ids_by_source: Dict[str, Dict[str, List[str]]] = {name: {} for name in names}
+
+    def produce():
+        # Load each file once and chunk it once per chunker; batches carry, per chunk,
+        # the targets of that model that still need it after deduplication
+        try:
+            batches = {model_name: [] for model_name in models}
+            page_stream = pages if pages is not None else iter_pdf_pages(directory_path, load_files, load_errors, tracer)
+            for source, source_pages in itertools.groupby(page_stream, key=itemgetter(0)):
+                if len(chunkers) > 1:
+                    # Every chunker reads the pages, so hold this one file's pages in memory
+                    source_pages = list(source_pages)
+                for make_chunks, model_names in chunkers.values():
+                    receivers = {
+                        model_name: [target.name for target in models[model_name]["targets"]
+                                     if target.name not in wanted or source in wanted[target.name]]
+                        for model_name in model_names
+                    }
+                    if not any(receivers.values()):
+                        continue
+                    chunks = make_chunks(source_pages)
+                    while True:
+                        # Page loading happens inside this span but is traced (and timed) separately
+                        with tracer.span("chunk"):
+                            item = next(chunks, None)
+                        if item is None:
+                            break
+                        _, offset, chunk = item
+                        document = {"source": source, "offset": offset, "text": chunk}
+                        document_id = chunk_id(source, chunk_size, overlap, offset, chunk_unit)
+                        for model_name, target_names in receivers.items():
+                            kept = []
+                            for name in target_names:
+                                if name in deduplicators:
+                                    with tracer.span("dedup"):
+                                        original_id = deduplicators[name].add(document_id, chunk)
+                                    if original_id is not None:
+                                        duplicate_ids_by_source[name].setdefault(source, []).append(original_id)
+                                        continue
+                                kept.append(name)
+                            if not kept:
+                                continue
+                            batch = batches[model_name]
+                            batch.append((document, document_id, kept))
+                            if len(batch) == batch_size:
+                                if not _put(chunk_queues[model_name], batch, stop):
+                                    return
+                                batches[model_name] = []
+            for model_name, batch in batches.items():
+                if batch and not _put(chunk_queues[model_name], batch, stop):
+                    return
+        except Exception as e:
+            failures.append(e)
+            stop.set()
+        finally:
+            for chunk_queue in chunk_queues.values():
+                _put(chunk_queue, _DONE, stop)
+
+    def embed(model_name):
+        embedder = models[model_name]["embedder"]
+        target_names = [target.name for target in models[model_name]["targets"]]
+        try:
+            while True:
+                batch = _get(chunk_queues[model_name], stop)
+                if batch is _DONE:
+                    return
+                start = time.perf_counter()
+                with tracer.span("embed"):
+                    embeddings = embedder.embed_chunks([document["text"] for document, _, _ in batch])
+                embed_time_by_model[model_name] += time.perf_counter() - start
+                for name in target_names:
+                    rows = [row for row, (_, _, kept) in enumerate(batch) if name in kept]
+                    if not rows:
+                        continue
+                    selected = embeddings if len(rows) == len(batch) else np.asarray(embeddings)[rows]
+                    item = ([batch[row][0] for row in rows], selected, [batch[row][1] for row in rows])
+                    if not _put(upload_queues[name], item, stop):
+                        return
+        except Exception as e:
+            failures.append(e)
+            stop.set()
+        finally:
+            for name in target_names:
+                _put(upload_queues[name], _DONE, stop)
+
+    def upload(target):
+        target_statistics = statistics[target.name]
+        ids_by_source = target_statistics["ids_by_source"]
+        try:
+            while True:
+                item = _get(upload_queues[target.name], stop)
+                if item is _DONE:
+                    return
+                documents, embeddings, ids = item
+                start = time.perf_counter()
+                with tracer.span("upload"):
+                    target.upload_batch(embeddings, documents, ids)
+                target_statistics["upload_time"] += time.perf_counter() - start
+                target_statistics["upload_done_time"] = time.perf_counter() - wall_start
+                target_statistics["chunk_count"] += len(ids)
+                for document, document_id in zip(documents, ids):
+                    ids_by_source.setdefault(document["source"], []).append(document_id)
+        except Exception as e:
+            failures.append(e)
+            stop.set()
+
+    wall_start = time.perf_counter()
+    workers = [threading.Thread(target=produce, name="ingest-chunk", daemon=True)]
+    workers += [threading.Thread(target=embed, args=(model_name,), name=f"ingest-embed-{model_name}", daemon=True)
+                for model_name in models]
+    workers += [threading.Thread(target=upload, args=(target,), name=f"ingest-upload-{target.name}", daemon=True)
+                for target in targets]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except BaseException:
+        stop.set()
+        for worker in workers:
+            worker.join()
+        raise
+
+    if failures:
+        raise failures[0]
+    if load_errors:
+        print(f"Failed to load {len(load_errors)} files: {', '.join(load_errors)}")
+
+    wall_time = time.perf_counter() - wall_start
+    for target in targets:
+        target_statistics = statistics[target.name]
+        ids_by_source = target_statistics["ids_by_source"]
+        for source, original_ids in duplicate_ids_by_source[target.name].items():
+            # A source keeps referencing the chunks that stand in for its duplicates
+            ids = ids_by_source.setdefault(source, [])
+            ids.extend(original_id for original_id in dict.fromkeys(original_ids) if original_id not in ids)
+        # Targets sharing a model share its embedding time
+        target_statistics["embed_time"] = embed_time_by_model[target.embedder.model_name]
+        target_statistics["wall_time"] = wall_time
+        target_statistics["load_errors"] = load_errors
+        # With several targets, report when each one's uploads finished
+        prefix = f"[{target.name}] " if len(targets) > 1 else ""
+        finished = target_statistics["upload_done_time"] if len(targets) > 1 else wall_time
+        print(f"{prefix}Ingested {target_statistics['chunk_count']} chunks in {finished:.2f}s "
+              f"(embed {target_statistics['embed_time']:.2f}s, upload {target_statistics['upload_time']:.2f}s)")
+        if target.name in deduplicators:
+            target_statistics["dedup"] = deduplicators[target.name].report()
+            print(f"{prefix}Deduplication: {target_statistics['dedup']}")
+    if len(targets) > 1:
+        print(f"Ingested into {len(targets)} stores in {wall_time:.2f}s")
+    return {
+        "targets": statistics,
+        "embed_time_by_model": embed_time_by_model,
+        "wall_time": wall_time,
+        "load_errors": load_errors,
+    }
+
+
+def run_ingestion(
+    directory_path: str,
+    embedder,
+    upload_batch: Callable[[Any, List[Dict[str, Any]], List[str]], None],
+    chunk_size: int,
+    overlap: int,
+    batch_size: int = INGEST_BATCH_SIZE,
+    queue_size: int = INGEST_QUEUE_SIZE,
+    filenames: Optional[List[str]] = None,
+    pages: Optional[Iterable[Tuple[str, str]]] = None,
+    chunk_unit: str = CHUNK_UNIT,
+    dedup: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """Stream every PDF in directory_path through chunking, embedding and upload.
+
+    upload_batch(embeddings, documents, ids) is called on an upload thread with one
+    embedded batch at a time; documents are {"source", "offset", "text"} dicts and ids
+    are stable chunk IDs derived from (source, chunk config, offset). Returns statistics
+    with time spent inside the embed and upload stages, the number of chunks, the
+    overall wall-clock time and the chunk IDs written for each source.
+
+    pages, if given, replaces the PDFs with already extracted (source, page_text) pairs,
+    e.g. a synthetic corpus for benchmarks; directory_path is then ignored.
+
+    With chunk_unit="tokens", chunks are windows of the embedder's tokenizer tokens and
+    chunk_size is capped at what the model embeds without truncation.
+
+    With dedup (default INGEST_DEDUP), chunks repeating an earlier chunk of this run are
+    neither embedded nor uploaded; their source lists the kept chunk's ID instead, and
+    statistics["dedup"] reports what was saved.
+    """
+    target = IngestTarget("index", embedder, upload_batch)
+    result = run_multi_ingestion(
+        directory_path, [target], chunk_size, overlap, batch_size=batch_size, queue_size=queue_size,
+        filenames=None if filenames is None else {target.name: filenames},
+        pages=pages, chunk_unit=chunk_unit, dedup=dedup,
+    )
+    return result["targets"][target.name]
+
+
+def _apply_plan(target: IngestTarget, plan: IndexPlan, statistics: Dict[str, Any], chunk_size: int, overlap: int,
+                chunk_unit: str):
+    """Record what was ingested for a target, delete its stale chunks and save its manifest."""
+    manifest = target.manifest
+    stale_ids = []
+    for filename in plan.changed:
+        if filename in statistics["load_errors"]:
+            # Keep whatever was indexed before rather than dropping a file we failed to read
+            continue
+        new_ids = statistics["ids_by_source"].get(filename, [])
+        new_id_set = set(new_ids)
+        stale_ids.extend(old_id for old_id in manifest.chunk_ids(filename) if old_id not in new_id_set)
+        manifest.record(filename, plan.hashes[filename], chunk_size, overlap, new_ids, chunk_unit)
+    for filename in plan.removed:
+        stale_ids.extend(manifest.chunk_ids(filename))
+        manifest.forget(filename)
+
+    # Deduplicated chunks can be shared between files; keep those another file still uses
+    referenced = {chunk for entry in manifest.files.values() for chunk in entry["chunk_ids"]}
+    stale_ids = [stale_id for stale_id in dict.fromkeys(stale_ids) if stale_id not in referenced]
+    if stale_ids:
+        target.delete_ids(stale_ids)
+        print(f"Deleted {len(stale_ids)} stale chunks from {target.name}")
+    manifest.save()
+
+    statistics["files_changed"] = len(plan.changed)
+    statistics["files_removed"] = len(plan.removed)
+    statistics["files_unchanged"] = len(plan.unchanged)
+    statistics["stale_chunks_deleted"] = len(stale_ids)
+    statistics["indexed_chunks"] = manifest.chunk_count()
+
+
+def run_multi_incremental_ingestion(
+    directory_path: str,
+    targets: List[IngestTarget],
+    chunk_size: int,
+    overlap: int,
+    **kwargs,
+) -> Dict[str, Any]:
+    """run_multi_ingestion limited to what each target's manifest says is new or changed.
+
+    A file is loaded and chunked once even when several targets need it. Stale chunks
+    are deleted from each target and every manifest is saved afterwards.
+    """
+    chunk_unit = kwargs.get("chunk_unit", CHUNK_UNIT)
+    plans: Dict[str, IndexPlan] = {}
+    hashes = None
+    for target in targets:
+        # Every manifest compares against the same file hashes, so hash the directory once
+        plans[target.name] = plan = target.manifest.plan(directory_path, chunk_size, overlap, chunk_unit, hashes)
+        hashes = plan.hashes
+        prefix = f"[{target.name}] " if len(targets) > 1 else ""
+        print(f"{prefix}Incremental ingestion: {len(plan.changed)} new or changed, "
+              f"{len(plan.removed)} removed, {len(plan.unchanged)} unchanged files")
+
+    pending = [target for target in targets if plans[target.name].changed]
+    if pending:
+        result = run_multi_ingestion(
+            directory_path, pending, chunk_size, overlap,
+            filenames={target.name: plans[target.name].changed for target in pending}, **kwargs,
+        )
+    else:
+        result = {"targets": {}, "embed_time_by_model": {}, "wall_time": 0.0, "load_errors": {}}
+    for target in targets:
+        statistics = result["targets"].setdefault(target.name, _empty_statistics())
+        _apply_plan(target, plans[target.name], statistics, chunk_size, overlap, chunk_unit)
+    return result
+
+
+def run_incremental_ingestion(
+    directory_path: str,
+    embedder,
+    upload_batch: Callable[[Any, List[Dict[str, Any]], List[str]], None],
+    delete_ids: Callable[[List[str]], None],
+    manifest: IndexManifest,
+    chunk_size: int,
+    overlap: int,
+    **kwargs,
+) -> Dict[str, Any]:
+    """Only ingest files that are new or changed since the manifest was written.
+
+    Chunks of changed files are upserted under their stable IDs, and chunks that no
+    longer exist (removed files, or offsets a changed file no longer produces) are
+    removed with delete_ids. The manifest is saved afterwards.
+    """
+    name = os.path.splitext(os.path.basename(manifest.path))[0]
+    target = IngestTarget(name, embedder, upload_batch, delete_ids, manifest)
+    return run_multi_incremental_ingestion(directory_path, [target], chunk_size, overlap, **kwargs)["targets"][target.name]
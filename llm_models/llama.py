@@ -1,17 +1,64 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterator, Optional
 import ollama
 
 llama = "llama3.2"
 mistral = "mistral"
 
+# Start of the text generate_response returns instead of raising when generation fails
+GENERATION_ERROR_PREFIX = "Error generating response"
+
+# Timing of a single generation
+@dataclass
+class GenerationMetrics:
+    time_to_first_token: Optional[float] = None  # seconds until the first token arrived
+    total_time: float = 0.0
+    token_count: int = 0
+    tokens_per_sec: float = 0.0
+
 # Class to generate responses using the given LLM model via Ollama
 class LLM:
     def __init__(self, model_name):
         self.model_name = model_name
-    
+        # Metrics are kept per thread so concurrent callers don't overwrite each other's
+        self._local = threading.local()
+
+    # Metrics of the most recent generation made by the calling thread
+    @property
+    def last_metrics(self) -> Optional[GenerationMetrics]:
+        return getattr(self._local, "metrics", None)
+
+    # Yield the response for the given prompt token by token as Ollama produces it
+    def stream_response(self, prompt) -> Iterator[str]:
+        metrics = GenerationMetrics()
+        self._local.metrics = metrics
+        start_time = time.perf_counter()
+        eval_count = eval_duration = None
+
+        for chunk in ollama.chat(model=self.model_name, messages=[{"role": "user", "content": prompt}], stream=True):
+            token = chunk["message"]["content"]
+            if token:
+                if metrics.time_to_first_token is None:
+                    metrics.time_to_first_token = time.perf_counter() - start_time
+                metrics.token_count += 1
+                yield token
+            if chunk.get("done"):
+                # Ollama reports the exact number of generated tokens and the time spent on them
+                eval_count = chunk.get("eval_count")
+                eval_duration = chunk.get("eval_duration")
+
+        metrics.total_time = time.perf_counter() - start_time
+        if eval_count and eval_duration:
+            metrics.token_count = eval_count
+            metrics.tokens_per_sec = eval_count / (eval_duration / 1e9)
+        elif metrics.time_to_first_token is not None and metrics.total_time > metrics.time_to_first_token:
+            metrics.tokens_per_sec = metrics.token_count / (metrics.total_time - metrics.time_to_first_token)
+
     # Generate response for the given prompt and return the response output
     def generate_response(self, prompt):
         try:
-            response = ollama.chat(model=self.model_name, messages=[{"role": "user", "content": prompt}])
-            return response["message"]["content"]
+            return "".join(self.stream_response(prompt))
         except Exception as e:
-            return f"Error generating response: {e}"
+            return f"{GENERATION_ERROR_PREFIX}: {e}"
@@ -0,0 +1,584 @@
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from embed import SENTENCE_TRANSFORMER, get_embedder
+from index_manifest import reset_manifest
+from ann_index import IVFIndex, default_nlist
+from bm25_index import BM25Index
+from quantization import QUANTIZERS, load_quantizer, make_quantizer, save_quantizer
+from projection import describe_projection, load_projection, make_projection, save_projection
+
+## In-process vector backend: every embedding lives in one contiguous, L2-normalized
+## float32 matrix next to a parallel store of chunk texts, and top-k is one matmul plus
+## argpartition. No external service is needed. Optionally the matrix is also held as
+## compact float16/int8/binary codes (see quantization.py): search then scans the codes
+## and re-ranks the best candidates with the float32 rows, which only need to be paged
+## in for those candidates when the index is memory-mapped from disk. Without rescoring
+## the float32 rows can be dropped altogether, leaving only the codes in memory and on
+## disk. An index can also
+## be projected to fewer dimensions (see projection.py); embeddings added to it and query
+## embeddings searched against it are then projected automatically. A BM25 index over
+## the same chunk texts can ride along for lexical and hybrid search (hybrid_search.py).
+
+# Global variables
+NUMPY_PERSIST_DIR = os.getenv("NUMPY_PERSIST_DIR", "./numpy_index")
+# Embedding model used for this index
+EMBEDDING_MODEL = SENTENCE_TRANSFORMER
+# Name of the manifest tracking which files this index holds
+MANIFEST_NAME = "numpy_index"
+# Indexes with at least this many vectors get an approximate (IVF) index on upload
+ANN_MIN_VECTORS = int(os.getenv("NUMPY_ANN_MIN_VECTORS", "50000"))
+# Codes to search on upload: "none", "float16", "int8" or "binary"
+QUANTIZATION = os.getenv("NUMPY_QUANTIZATION", "none")
+# Reduce stored vectors to fewer dimensions on upload: "none", "pca:<dim>" or "truncate:<dim>"
+PROJECTION = os.getenv("NUMPY_PROJECTION", "none")
+# Keep a BM25 index over the chunk texts for lexical and hybrid search
+LEXICAL_INDEX = os.getenv("NUMPY_BM25", "1") == "1"
+# Re-rank candidates from the codes with exact float32 scores
+QUANTIZED_RESCORE = os.getenv("NUMPY_QUANTIZED_RESCORE", "1") == "1"
+# Keep the float32 rows next to the codes; "0" stores the codes alone (needs rescoring off)
+KEEP_FLOAT32 = os.getenv("NUMPY_KEEP_FLOAT32", "1") == "1"
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so a dot product is the cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(scores, columns) of the k highest scores in each row, best first."""
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1)
+    return np.take_along_axis(candidate_scores, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+
+
+class _MappedTexts:
+    """Read-only chunk texts backed by one memory-mapped UTF-8 blob plus row offsets."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return self.blob[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+
+class NumpyVectorIndex:
+    """Cosine-similarity index over a contiguous float32 matrix.
+
+    Search is exact unless an approximate IVF index has been built with build_ann() or
+    the vectors have been quantized with quantize(). After drop_float32() only the codes
+    are kept, and everything that needs the float32 rows raises a ValueError.
+    """
+
+    def __init__(self, embedding_dim: Optional[int] = None):
+        self.embedding_dim = embedding_dim
+        # Rows beyond self._size are spare capacity so appends are amortized O(1); None
+        # once the index keeps only its codes
+        self._matrix: Optional[np.ndarray] = np.empty((0, embedding_dim or 0), dtype=np.float32)
+        self._size = 0
+        self.ids: List[str] = []
+        self.texts = []
+        self._rows: Dict[str, int] = {}
+        # Whether there are changes that save() has not written yet
+        self.dirty = False
+        # Optional approximate index over the rows of the matrix
+        self.ann: Optional[IVFIndex] = None
+        # Optional BM25 index over the chunk texts, keyed by chunk ID
+        self.lexical: Optional[BM25Index] = None
+        # Optional projection from the embedding model's space to the stored one
+        self.projection = None
+        # Optional quantizer and the codes of every row, scanned instead of the matrix
+        self.quantizer = None
+        self.codes: Optional[np.ndarray] = None
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def has_float32(self) -> bool:
+        return self._matrix is not None
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """The (n, embedding_dim) matrix of normalized embeddings."""
+        if self._matrix is None:
+            raise ValueError("The NumPy index only keeps quantized codes; re-upload it with "
+                             "NUMPY_KEEP_FLOAT32=1 to get the float32 vectors back")
+        return self._matrix[:self._size]
+
+    def _prepare(self, embeddings) -> np.ndarray:
+        # Normalized, projected and normalized again, so stored rows and queries match
+        vectors = normalize_rows(embeddings)
+        if self.projection is not None and len(vectors):
+            vectors = normalize_rows(self.projection.transform(vectors))
+        return vectors
+
+    def _make_writable(self):
+        # Indexes opened with load() are memory-mapped read-only until the first write
+        if self._matrix is not None and not self._matrix.flags.writeable:
+            self._matrix = np.array(self._matrix[:self._size])
+        if isinstance(self.texts, _MappedTexts):
+            self.texts = list(self.texts)
+        if self.codes is not None and not self.codes.flags.writeable:
+            self.codes = np.array(self.codes)
+
+    def _reserve(self, rows: int):
+        if self._matrix is None or rows <= self._matrix.shape[0]:
+            return
+        capacity = max(rows, 2 * self._matrix.shape[0], 1024)
+        matrix = np.empty((capacity, self.embedding_dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+
+    def add(self, embeddings, documents: List[str], ids: List[str]):
+        """Upsert embeddings with their chunk texts under the given IDs."""
+        vectors = self._prepare(embeddings)
+        if len(vectors) == 0:
+            return
+        if self.embedding_dim is None or self._size == 0:
+            self.embedding_dim = vectors.shape[1]
+            self._matrix = np.empty((0, self.embedding_dim), dtype=np.float32)
+        elif vectors.shape[1] != self.embedding_dim:
+            raise ValueError(f"Expected {self.embedding_dim}-d embeddings, got {vectors.shape[1]}-d")
+        self._make_writable()
+        self._reserve(self._size + len(vectors))
+        self.dirty = True
+
+        first_new_row = self._size
+        # Input position of the vector written to each row; a repeated ID keeps its last one
+        written: Dict[int, int] = {}
+        for position, (text, vector_id) in enumerate(zip(documents, ids)):
+            row = self._rows.get(vector_id)
+            if row is None:
+                row = self._size
+                self._size += 1
+                self._rows[vector_id] = row
+                self.ids.append(vector_id)
+                self.texts.append(text)
+            else:
+                self.texts[row] = text
+            written[row] = position
+        rows = np.fromiter(written.keys(), dtype=np.int64, count=len(written))
+        vectors = vectors[np.fromiter(written.values(), dtype=np.int64, count=len(written))]
+        if self._matrix is not None:
+            self._matrix[rows] = vectors
+        # New rows were first seen in row order, so they can be appended as they are
+        new = rows >= first_new_row
+
+        # Keep the lexical index, the codes and the approximate index in step with the matrix
+        if self.lexical is not None:
+            self.lexical.add(documents, ids)
+        if self.quantizer is not None:
+            codes = self.quantizer.encode(vectors)
+            self.codes = np.concatenate([self.codes, codes[new]])
+            self.codes[rows[~new]] = codes[~new]
+        if self.ann is not None:
+            self.ann.add(vectors[new])
+            if not new.all():
+                self.ann.update(rows[~new], vectors[~new])
+
+    def delete(self, ids: List[str]):
+        """Remove chunks by ID, compacting the matrix."""
+        rows = [self._rows[vector_id] for vector_id in ids if vector_id in self._rows]
+        if not rows:
+            return
+        self._make_writable()
+        if self.lexical is not None:
+            self.lexical.delete(ids)
+        self.dirty = True
+        keep = np.ones(self._size, dtype=bool)
+        keep[rows] = False
+        if self._matrix is not None:
+            self._matrix = self._matrix[:self._size][keep]
+        self._size = int(keep.sum())
+        self.ids = [vector_id for vector_id, kept in zip(self.ids, keep) if kept]
+        self.texts = [text for text, kept in zip(self.texts, keep) if kept]
+        self._rows = {vector_id: row for row, vector_id in enumerate(self.ids)}
+        if self.codes is not None:
+            self.codes = self.codes[keep]
+        if self.ann is not None:
+            self.ann.keep(keep)
+
+    def build_ann(self, nlist: Optional[int] = None, nprobe: int = 8, n_iter: int = 20, seed: int = 0) -> IVFIndex:
+        """Build an IVF index with nlist lists (default ~4*sqrt(n)); queries probe nprobe lists."""
+        self.ann = IVFIndex(nlist=nlist or default_nlist(self._size), nprobe=nprobe, n_iter=n_iter, seed=seed)
+        start = time.perf_counter()
+        self.ann.build(self.embeddings)
+        print(f"Built IVF index with {self.ann.nlist} lists over {self._size} vectors "
+              f"in {time.perf_counter() - start:.2f}s")
+        self.dirty = True
+        return self.ann
+
+    def build_lexical(self) -> BM25Index:
+        """Index the stored chunk texts with BM25; it is kept up to date on later writes."""
+        start = time.perf_counter()
+        self.lexical = BM25Index()
+        self.lexical.add(self.texts, self.ids)
+        print(f"Built BM25 index over {self._size} chunks in {time.perf_counter() - start:.2f}s "
+              f"({self.lexical.memory_bytes() / (1024 * 1024):.1f} MB of postings)")
+        self.dirty = True
+        return self.lexical
+
+    def rows_of(self, ids: List[str]) -> np.ndarray:
+        """Matrix rows of the given chunk IDs."""
+        return np.array([self._rows[vector_id] for vector_id in ids], dtype=np.int64)
+
+    def similarities(self, query_embedding, rows: np.ndarray) -> np.ndarray:
+        """Cosine similarity of one query embedding to the given rows (approximate without float32 rows)."""
+        query = self._prepare(query_embedding)
+        if self._matrix is None:
+            return self.quantizer.scores(query, self.codes[rows])[0]
+        return self.embeddings[rows] @ query[0]
+
+    def project(self, method: str, output_dim: int):
+        """Fit a projection on the stored vectors and keep them in the reduced space from now on.
+
+        The full-dimensional vectors are not kept, so a different projection needs a
+        re-upload. An ANN index or codes built before are dropped and must be rebuilt.
+        """
+        if self.projection is not None:
+            raise ValueError(f"Index is already projected ({describe_projection(self.projection)}); "
+                             f"clear and re-upload it to change the projection")
+        projection = make_projection(method, output_dim)
+        start = time.perf_counter()
+        projection.fit(self.embeddings)
+        original_dim = self.embedding_dim
+        self._matrix = normalize_rows(projection.transform(self.embeddings))
+        self.embedding_dim = output_dim
+        self.projection = projection
+        self.ann = None
+        self.quantizer = None
+        self.codes = None
+        self.dirty = True
+        print(f"Projected {self._size} vectors from {original_dim} to {output_dim} dimensions "
+              f"with {method} in {time.perf_counter() - start:.2f}s")
+        return projection
+
+    def quantize(self, method: str):
+        """Calibrate a quantizer on the current vectors and encode them; search then scans the codes.
+
+        Vectors added later are encoded with the same calibration.
+        """
+        quantizer = make_quantizer(method)
+        start = time.perf_counter()
+        quantizer.fit(self.embeddings)
+        self.codes = quantizer.encode(self.embeddings)
+        self.quantizer = quantizer
+        usage = self.memory_usage()
+        print(f"Quantized {self._size} vectors to {method} in {time.perf_counter() - start:.2f}s: searches scan "
+              f"{usage['scanned_mb']:.1f} MB instead of {usage['float32_mb']:.1f} MB "
+              f"({usage['scan_reduction']:.1f}x less), {usage['stored_mb']:.1f} MB stored with the float32 rows")
+        self.dirty = True
+        return quantizer
+
+    def dequantize(self):
+        """Drop the codes and go back to scanning the float32 matrix."""
+        if self._matrix is None:
+            raise ValueError("The NumPy index only keeps quantized codes; re-upload it to dequantize")
+        self.quantizer = None
+        self.codes = None
+        self.dirty = True
+
+    def drop_float32(self):
+        """Keep only the codes, so memory and disk hold nothing else; searches can no longer rescore.
+
+        Exact search, build_ann(), project(), quantize() and dequantize() need the float32
+        rows and fail from now on; new vectors are stored as codes only.
+        """
+        if self.quantizer is None:
+            raise ValueError("Quantize the index before dropping its float32 vectors")
+        before = self.memory_usage()["stored_mb"]
+        self._matrix = None
+        self.dirty = True
+        print(f"Dropped the float32 rows: {before:.1f} MB -> {self.memory_usage()['stored_mb']:.1f} MB stored")
+
+    def memory_usage(self) -> Dict[str, float]:
+        """Vector memory in MB: at float32, as stored (float32 rows and codes) and as scanned per search."""
+        float32_bytes = self._size * (self.embedding_dim or 0) * 4
+        code_bytes = self.codes.nbytes if self.codes is not None else 0
+        stored_bytes = (float32_bytes if self._matrix is not None else 0) + code_bytes
+        scanned_bytes = code_bytes if self.codes is not None else float32_bytes
+        return {
+            "float32_mb": float32_bytes / (1024 * 1024),
+            "codes_mb": code_bytes / (1024 * 1024),
+            "stored_mb": stored_bytes / (1024 * 1024),
+            "scanned_mb": scanned_bytes / (1024 * 1024),
+            "scan_reduction": float32_bytes / scanned_bytes if scanned_bytes else 1.0,
+            "storage_reduction": float32_bytes / stored_bytes if stored_bytes else 1.0,
+        }
+
+    def clear(self):
+        self.__init__(self.embedding_dim)
+        self.dirty = True
+
+    def search(
+        self,
+        query_embeddings,
+        top_k: int = 1,
+        exact: bool = False,
+        nprobe: Optional[int] = None,
+        rescore: bool = QUANTIZED_RESCORE,
+        rescore_factor: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (scores, rows), both shaped (num_queries, k), best match first.
+
+        query_embeddings may be a single vector or a (num_queries, dim) matrix; exact
+        search scores all queries with one matrix multiply. If an ANN index is built and
+        exact is False, only the nprobe closest lists are scored, and rows that could not
+        be filled are -1. If the index is quantized and exact is False, the codes are scored
+        instead of the float32 rows (within the probed lists when there is an ANN index)
+        and, with rescore, the best k * rescore_factor candidates (default depends on the
+        quantizer) are re-ranked with their float32 vectors. An index without float32 rows
+        never rescores.
+        """
+        queries = self._prepare(query_embeddings)
+        k = min(top_k, self._size)
+        if k == 0:
+            return np.empty((len(queries), 0), dtype=np.float32), np.empty((len(queries), 0), dtype=np.int64)
+        quantized = self.quantizer is not None and not exact
+        rescore = rescore and quantized and self._matrix is not None
+        fetch = min(self._size, k * (rescore_factor or self.quantizer.rescore_factor)) if rescore else k
+        if self.ann is not None and not exact:
+            if not quantized:
+                return self.ann.search(self.embeddings, queries, k, nprobe)
+            scores, candidates = self.ann.search(None, queries, fetch, nprobe, score_rows=self._code_scores)
+        elif quantized:
+            scores, candidates = _top_k(self.quantizer.scores(queries, self.codes), fetch)
+        else:
+            return _top_k(queries @ self.embeddings.T, k)
+        if not rescore:
+            return scores, candidates
+
+        # Only the candidates' rows of the (possibly memory-mapped) matrix are read
+        exact_scores = np.einsum("qd,qcd->qc", queries, self.embeddings[np.maximum(candidates, 0)])
+        # Keep the -1 padding of lists that could not fill every candidate slot at the bottom
+        exact_scores[candidates < 0] = -np.inf
+        candidate_scores, order = _top_k(exact_scores, k)
+        return candidate_scores, np.take_along_axis(candidates, order, axis=1)
+
+    def _code_scores(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        return self.quantizer.scores(query[None, :], self.codes[rows])[0]
+
+    def save(self, directory: str = NUMPY_PERSIST_DIR):
+        """Persist the index as .npy files that load() can memory-map.
+
+        Files are written next to the originals and swapped in, since the index being
+        saved may itself be memory-mapped from them.
+        """
+        os.makedirs(directory, exist_ok=True)
+        encoded = [text.encode("utf-8") for text in self.texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(text) for text in encoded])
+
+        def write(name, writer):
+            path = os.path.join(directory, name)
+            with open(path + ".tmp", "wb") as f:
+                writer(f)
+            os.replace(path + ".tmp", path)
+
+        write("text_offsets.npy", lambda f: np.save(f, offsets))
+        write("texts.bin", lambda f: f.writelines(encoded))
+        write("ids.json", lambda f: f.write(json.dumps(self.ids).encode("utf-8")))
+        ann_path = os.path.join(directory, "ivf.npz")
+        if self.ann is not None:
+            write("ivf.npz", self.ann.save)
+        elif os.path.exists(ann_path):
+            os.remove(ann_path)
+        for name, value, writer in (
+            ("embeddings.npy", self._matrix, lambda f: np.save(f, self.embeddings)),
+            ("bm25.npz", self.lexical, lambda f: self.lexical.save(f)),
+            ("projection.npz", self.projection, lambda f: save_projection(self.projection, f)),
+            ("codes.npy", self.codes, lambda f: np.save(f, self.codes)),
+            ("quantizer.npz", self.quantizer, lambda f: save_quantizer(self.quantizer, f)),
+        ):
+            if value is not None:
+                write(name, writer)
+            elif os.path.exists(os.path.join(directory, name)):
+                os.remove(os.path.join(directory, name))
+        self.dirty = False
+
+    @classmethod
+    def load(cls, directory: str = NUMPY_PERSIST_DIR) -> "NumpyVectorIndex":
+        """Open a saved index; the matrix, codes and texts are memory-mapped, not read into RAM."""
+        quantizer = codes = None
+        quantizer_path = os.path.join(directory, "quantizer.npz")
+        if os.path.exists(quantizer_path):
+            quantizer = load_quantizer(quantizer_path)
+            codes = np.load(os.path.join(directory, "codes.npy"), mmap_mode="r")
+        embeddings_path = os.path.join(directory, "embeddings.npy")
+        if os.path.exists(embeddings_path):
+            matrix = np.load(embeddings_path, mmap_mode="r")
+            index = cls(matrix.shape[1])
+            index._matrix = matrix
+            index._size = len(matrix)
+        else:
+            # Saved after drop_float32(): the codes are all there is
+            index = cls(quantizer.embedding_dim(codes))
+            index._matrix = None
+            index._size = len(codes)
+        index.quantizer, index.codes = quantizer, codes
+        with open(os.path.join(directory, "ids.json"), "r", encoding="utf-8") as f:
+            index.ids = json.load(f)
+        index._rows = {vector_id: row for row, vector_id in enumerate(index.ids)}
+        offsets = np.load(os.path.join(directory, "text_offsets.npy"))
+        if offsets[-1] > 0:
+            blob = np.memmap(os.path.join(directory, "texts.bin"), dtype=np.uint8, mode="r")
+        else:
+            blob = np.empty(0, dtype=np.uint8)
+        index.texts = _MappedTexts(blob, offsets)
+        ann_path = os.path.join(directory, "ivf.npz")
+        if os.path.exists(ann_path):
+            index.ann = IVFIndex.load(ann_path)
+        lexical_path = os.path.join(directory, "bm25.npz")
+        if os.path.exists(lexical_path):
+            index.lexical = BM25Index.load(lexical_path)
+        projection_path = os.path.join(directory, "projection.npz")
+        if os.path.exists(projection_path):
+            index.projection = load_projection(projection_path)
+        return index
+
+
+def initialize_numpy_index(persist_dir: str = NUMPY_PERSIST_DIR) -> NumpyVectorIndex:
+    """Open the persisted index, or create an empty one."""
+    if os.path.exists(os.path.join(persist_dir, "ids.json")):
+        index = NumpyVectorIndex.load(persist_dir)
+        print(f"Loaded NumPy index with {len(index)} vectors from {persist_dir}")
+        return index
+    print("Created new NumPy index")
+    return NumpyVectorIndex()
+
+
+def upload_embeddings_to_numpy(
+    index: NumpyVectorIndex,
+    embeddings: List[np.ndarray],
+    documents: List[str],
+    ids: List[str]
+):
+    """Upload embeddings to the in-process index."""
+    print(f"Uploading {len(embeddings)} vectors to the NumPy index...")
+    index.add(embeddings, documents, ids)
+
+
+def delete_from_numpy(index: NumpyVectorIndex, ids: List[str]):
+    """Delete chunks from the in-process index by ID."""
+    index.delete(ids)
+
+
+def clear_numpy_index(index: NumpyVectorIndex, persist_dir: str = NUMPY_PERSIST_DIR):
+    """Empty the index and remove its persisted files."""
+    index.clear()
+    if os.path.isdir(persist_dir):
+        shutil.rmtree(persist_dir)
+    reset_manifest(MANIFEST_NAME)
+    print("NumPy index cleared.")
+
+
+def evaluate_quantization(index: NumpyVectorIndex, query_embeddings: np.ndarray, top_k: int = 5,
+                          methods=QUANTIZERS) -> List[Dict]:
+    """Memory reduction and recall@top_k of each quantization method against exact float32 search.
+
+    Recall is measured with and without rescoring; the index is left as it was.
+    """
+    saved = (index.quantizer, index.codes, index.ann, index.dirty)
+    exact_rows = index.search(query_embeddings, top_k, exact=True)[1]
+    index.ann = None
+    report = []
+    try:
+        for method in methods:
+            index.quantize(method)
+            row = {"method": method, **index.memory_usage()}
+            for rescore, name in ((False, "coarse"), (True, "rescored")):
+                rows = index.search(query_embeddings, top_k, rescore=rescore)[1]
+                recall = float(np.mean([len(set(found) & set(expected)) / len(expected)
+                                        for found, expected in zip(rows, exact_rows)]))
+                row[f"recall_{name}"] = recall
+                # The unquantized index scans the same float32 rows, so its recall is 1
+                row[f"recall_delta_{name}"] = recall - 1.0
+            report.append(row)
+    finally:
+        index.quantizer, index.codes, index.ann, index.dirty = saved
+    return report
+
+
+def evaluate_projection(index: NumpyVectorIndex, query_embeddings: np.ndarray, dims: List[int],
+                        top_k: int = 5, method: str = "pca", repeat: int = 5) -> List[Dict]:
+    """Search latency, index size and recall@top_k at each target dimension.
+
+    Each dimension gets a projected copy of the index; recall is against exact search
+    of the index as it is. The first row is that unprojected baseline. If the index is
+    already projected, the copies reduce its stored rows further, so they are searched
+    with queries already in the index's projected space.
+    """
+    queries = np.asarray(query_embeddings, dtype=np.float32)
+    index_queries = index._prepare(queries) if index.projection is not None else queries
+
+    def measure(target: NumpyVectorIndex, queries: np.ndarray) -> Tuple[float, np.ndarray]:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = target.search(queries, top_k, exact=True)[1]
+            timings.append(time.perf_counter() - start)
+        return float(np.median(timings)) * 1000 / len(queries), rows
+
+    baseline_ms, exact_rows = measure(index, queries)
+    report = [{"method": "none", "dim": index.embedding_dim, "index_mb": index.embeddings.nbytes / (1024 * 1024),
+               "search_ms_per_query": baseline_ms, "recall": 1.0}]
+    for output_dim in dims:
+        reduced = NumpyVectorIndex()
+        reduced.projection = make_projection(method, output_dim)
+        reduced.projection.fit(index.embeddings)
+        # Rows are re-added through the projection; texts are not needed to measure search
+        reduced.add(index.embeddings, index.ids, index.ids)
+        search_ms, rows = measure(reduced, index_queries)
+        recall = float(np.mean([len(set(found) & set(expected)) / len(expected)
+                                for found, expected in zip(rows, exact_rows)]))
+        report.append({"method": method, "dim": output_dim, "index_mb": reduced.embeddings.nbytes / (1024 * 1024),
+                       "search_ms_per_query": search_ms, "recall": recall})
+    return report
+
+
+def search_numpy_many(index: NumpyVectorIndex, query_embeddings: np.ndarray, top_k: int = 1) -> List[List[Dict]]:
+    """Search many already embedded queries with one matmul; one hit list per query, in order."""
+    scores, rows = index.search(query_embeddings, top_k)
+    return [
+        [
+            {"id": index.ids[row], "text": index.texts[row], "score": float(score)}
+            for score, row in zip(query_scores, query_rows) if row >= 0
+        ]
+        for query_scores, query_rows in zip(scores, rows)
+    ]
+
+
+def search_numpy(index: NumpyVectorIndex, query_embedding: np.ndarray, top_k: int = 1) -> List[Dict]:
+    """Search with an already embedded query; returns [{"id", "text", "score"}], best first."""
+    return search_numpy_many(index, np.asarray(query_embedding).reshape(1, -1), top_k)[0]
+
+
+def query_numpy(index: NumpyVectorIndex, query_text: str, top_k: int = 1):
+    """Query the in-process index and return the most relevant context."""
+    # Embed the user query
+    embedder = get_embedder(EMBEDDING_MODEL)
+    query_embedding = embedder.embed_query(query_text)
+
+    hits = search_numpy(index, query_embedding, top_k)
+    return "\n\n".join(hit["text"] for hit in hits)
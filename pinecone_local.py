@@ -0,0 +1,128 @@
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+## In-process stand-in for a Pinecone index. It implements the subset of the Index API
+## this project uses (upsert, query, delete, describe_index_stats) and can simulate
+## request latency, request-size limits and throttling, so upload throughput can be
+## benchmarked and tested without network access or an API key.
+
+
+class LocalThrottleError(Exception):
+    """Raised like a Pinecone 429 when the stand-in is over its concurrency limit."""
+
+    status = 429
+
+
+class LocalPineconeIndex:
+    def __init__(
+        self,
+        dimension: int,
+        latency_ms: float = 0.0,
+        per_vector_latency_ms: float = 0.0,
+        max_vectors_per_request: int = 1000,
+        max_concurrent_requests: Optional[int] = None,
+        throttle_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+        self.per_vector_latency_ms = per_vector_latency_ms
+        self.max_vectors_per_request = max_vectors_per_request
+        self.max_concurrent_requests = max_concurrent_requests
+        self.throttle_rate = throttle_rate
+        self.vectors: Dict[str, np.ndarray] = {}
+        self.metadata: Dict[str, Dict[str, Any]] = {}
+        # Request counters, useful for asserting on batching behaviour
+        self.upsert_requests = 0
+        self.throttled_requests = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        # Matrix used by query, rebuilt lazily after writes
+        self._matrix = None
+        self._matrix_ids: List[str] = []
+
+    def _enter_request(self, num_vectors: int = 0):
+        with self._lock:
+            throttled = (
+                (self.max_concurrent_requests is not None and self._in_flight >= self.max_concurrent_requests)
+                or self._random.random() < self.throttle_rate
+            )
+            if throttled:
+                self.throttled_requests += 1
+                raise LocalThrottleError("Too Many Requests")
+            self._in_flight += 1
+        # Simulated network and server time, outside the lock so requests overlap
+        delay = self.latency_ms + self.per_vector_latency_ms * num_vectors
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _exit_request(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def upsert(self, vectors, namespace: Optional[str] = None):
+        if len(vectors) > self.max_vectors_per_request:
+            raise ValueError(f"Upsert of {len(vectors)} vectors exceeds the limit of {self.max_vectors_per_request}")
+        self._enter_request(len(vectors))
+        try:
+            with self._lock:
+                for vector in vectors:
+                    if isinstance(vector, dict):
+                        vector_id, values, metadata = vector["id"], vector["values"], vector.get("metadata", {})
+                    else:
+                        vector_id, values, metadata = (tuple(vector) + ({},))[:3]
+                    if len(values) != self.dimension:
+                        raise ValueError(f"Vector dimension {len(values)} does not match index dimension {self.dimension}")
+                    self.vectors[vector_id] = np.asarray(values, dtype=np.float32)
+                    self.metadata[vector_id] = metadata
+                self.upsert_requests += 1
+                self._matrix = None
+            return {"upserted_count": len(vectors)}
+        finally:
+            self._exit_request()
+
+    def query(self, vector, top_k: int = 10, include_metadata: bool = False, **kwargs):
+        self._enter_request()
+        try:
+            with self._lock:
+                if self._matrix is None:
+                    self._matrix_ids = list(self.vectors)
+                    matrix = np.array([self.vectors[i] for i in self._matrix_ids], dtype=np.float32).reshape(-1, self.dimension)
+                    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                    norms[norms == 0] = 1.0
+                    self._matrix = matrix / norms
+                # Scored under the lock too, so concurrent upserts and deletes can't change
+                # the metadata (or drop the IDs) of the matrix being searched
+                matrix, ids = self._matrix, self._matrix_ids
+                query = np.asarray(vector, dtype=np.float32)
+                query = query / (np.linalg.norm(query) or 1.0)
+                scores = matrix @ query
+                best = np.argsort(-scores)[:top_k]
+                matches = []
+                for row in best:
+                    match = {"id": ids[row], "score": float(scores[row])}
+                    if include_metadata:
+                        match["metadata"] = self.metadata[ids[row]]
+                    matches.append(match)
+            return {"matches": matches}
+        finally:
+            self._exit_request()
+
+    def delete(self, ids: Optional[List[str]] = None, delete_all: bool = False, **kwargs):
+        with self._lock:
+            if delete_all:
+                self.vectors.clear()
+                self.metadata.clear()
+            else:
+                for vector_id in ids or []:
+                    self.vectors.pop(vector_id, None)
+                    self.metadata.pop(vector_id, None)
+            self._matrix = None
+
+    def describe_index_stats(self):
+        with self._lock:
+            return {"total_vector_count": len(self.vectors), "dimension": self.dimension}
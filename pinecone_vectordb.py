@@ -1,10 +1,15 @@
 import os
+import random
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
-from embed import SentenceTransformerEmbedder
-from pinecone import Pinecone
+from embed import SENTENCE_TRANSFORMER, get_embedder, get_embedding_dimension
+from pinecone import Pinecone, ServerlessSpec
+from pinecone_local import LocalPineconeIndex
+from index_manifest import reset_manifest
 
 ## Embedding pipeline to emebd all documents using MPNetEmbedder and Pinecone's Vector DB
 
@@ -15,45 +20,107 @@ load_dotenv()
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT", "us-east-1")
 INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "ds4300")
+# Embedding model used for this index
+EMBEDDING_MODEL = SENTENCE_TRANSFORMER
+# Name of the manifest tracking which files this index holds
+MANIFEST_NAME = f"pinecone_{INDEX_NAME}"
 
-# Initialize Pinecone client
-client = Pinecone(api_key=PINECONE_API_KEY)
+# Upserts are split into batches of this many vectors (Pinecone caps requests at 1000
+# vectors / 2 MB) and up to PINECONE_UPLOAD_WORKERS batches are sent in parallel
+PINECONE_BATCH_SIZE = 100
+PINECONE_UPLOAD_WORKERS = 4
+# Queries in flight at once when searching for many questions
+PINECONE_QUERY_WORKERS = 8
+# Retries for throttled (429) or unavailable (5xx) requests, with exponential backoff
+PINECONE_MAX_RETRIES = 5
+PINECONE_BACKOFF_SECONDS = 0.5
+# Set PINECONE_LOCAL=1 to use the in-process stand-in instead of the Pinecone service
+PINECONE_LOCAL = os.getenv("PINECONE_LOCAL") == "1"
 
-def initialize_pinecone():
-    """Initialize Pinecone index."""
-    existing_indexes = [index_info['name'] for index_info in client.list_indexes()]
+# Pinecone client, created on first use so importing this module needs no API key
+client = None
+_local_index = None
+
+def _get_client():
+    global client
+    if client is None:
+        client = Pinecone(api_key=PINECONE_API_KEY)
+    return client
+
+def initialize_pinecone(dimension: Optional[int] = None):
+    """Initialize Pinecone index sized for the embedding model."""
+    global _local_index
+    if dimension is None:
+        dimension = get_embedding_dimension(EMBEDDING_MODEL)
+    
+    if PINECONE_LOCAL:
+        if _local_index is None:
+            _local_index = LocalPineconeIndex(dimension)
+        return _local_index
+    
+    pinecone_client = _get_client()
+    existing_indexes = [index_info['name'] for index_info in pinecone_client.list_indexes()]
     
     if INDEX_NAME not in existing_indexes:
-        print(f"Creating index {INDEX_NAME}...")
-        client.create_index(
+        print(f"Creating index {INDEX_NAME} with dimension {dimension}...")
+        pinecone_client.create_index(
             name=INDEX_NAME,
-            dimension=1536,  # Adjust this based on your embedding model
-            metric="cosine"
+            dimension=dimension,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region=PINECONE_ENVIRONMENT)
         )
         time.sleep(2)  # Wait for index to be initialized
+    else:
+        existing_dimension = pinecone_client.describe_index(INDEX_NAME).dimension
+        if existing_dimension != dimension:
+            print(f"Warning: index {INDEX_NAME} has dimension {existing_dimension} "
+                  f"but {EMBEDDING_MODEL} produces {dimension}-d vectors. Delete and recreate the index.")
 
-    return client.Index('ds4300')
+    return pinecone_client.Index(INDEX_NAME)
+
+def _is_retryable(error: Exception) -> bool:
+    """Throttling (429) and server-side (5xx) errors are worth retrying."""
+    status = getattr(error, "status", None)
+    if status is not None:
+        return status == 429 or 500 <= int(status) < 600
+    return "429" in str(error) or "Too Many Requests" in str(error)
+
+def _upsert_with_retry(index, vectors, max_retries: int = PINECONE_MAX_RETRIES):
+    for attempt in range(max_retries + 1):
+        try:
+            return index.upsert(vectors=vectors)
+        except Exception as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+            # Exponential backoff with jitter so parallel workers do not retry in lockstep
+            time.sleep(PINECONE_BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random()))
 
 def upload_embeddings_to_pinecone(
     index,
     embeddings: List[np.ndarray], 
-    documents: List[Dict[str, Any]]
+    documents: List[Dict[str, Any]],
+    ids: Optional[List[str]] = None,
+    batch_size: int = PINECONE_BATCH_SIZE,
+    max_workers: int = PINECONE_UPLOAD_WORKERS,
 ):
     
-    #Upload embeddings to Pinecone index.
+    #Upload embeddings to Pinecone index in batches, several batches in flight at once.
     total_vectors = len(embeddings)
     print(f"Uploading {total_vectors} vectors to Pinecone...")
     
     # Prepare vectors in Pinecone format
     vectors = []
     for i in range(total_vectors):
-        vector_id = f"doc_{i}"
+        vector_id = ids[i] if ids is not None else f"doc_{i}"
         vector_embedding = embeddings[i].tolist()
         vector_metadata = documents[i]
         vectors.append((vector_id, vector_embedding, vector_metadata))
     
     # Upsert to Pinecone
-    index.upsert(vectors=vectors)
+    batches = [vectors[start:start + batch_size] for start in range(0, total_vectors, batch_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in [executor.submit(_upsert_with_retry, index, batch) for batch in batches]:
+            future.result()
     
     print(f"Successfully uploaded {total_vectors} vectors to Pinecone.")
     
@@ -69,36 +136,94 @@ def clear_pinecone_index(index):
         print(f"Index {INDEX_NAME} cleared successfully.")
     else:
         print(f"Index {INDEX_NAME} is already empty. No need to clear.")
+    reset_manifest(MANIFEST_NAME)
+
+def delete_from_pinecone(index, ids: List[str], batch_size: int = 1000):
+    """Delete chunks from the Pinecone index by ID."""
+    for start in range(0, len(ids), batch_size):
+        index.delete(ids=ids[start:start + batch_size])
+
+def search_pinecone(index, query_embedding: np.ndarray, top_k: int = 1) -> List[Dict[str, Any]]:
+    """Search with an already embedded query; returns [{"id", "text", "score"}], best first."""
+    search_results = index.query(
+        vector=np.asarray(query_embedding).tolist(),
+        top_k=top_k,
+        include_metadata=True
+    )
+    
+    hits = []
+    for match in search_results['matches']:
+        if 'metadata' in match and 'text' in match['metadata']:
+            hits.append({"id": match['id'], "text": match['metadata']['text'], "score": match['score']})
+    return hits
+
+def search_pinecone_many(index, query_embeddings: np.ndarray, top_k: int = 1,
+                         max_workers: int = PINECONE_QUERY_WORKERS) -> List[List[Dict[str, Any]]]:
+    """Search many already embedded queries concurrently; one hit list per query, in order.
+    
+    Pinecone takes one vector per query request, so requests are overlapped instead.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(query_embeddings)))) as executor:
+        return list(executor.map(lambda query_embedding: search_pinecone(index, query_embedding, top_k), query_embeddings))
 
 # Query the Pinecone index and return the most relevant context
 def query_pinecone(index, query: str, top_k=1):
         # Embed the user query
-        embedder = SentenceTransformerEmbedder()
-        query_embedding = embedder.embed_chunks([query])[0].tolist()
-        # print(f"Query embedding: {query_embedding}")
+        embedder = get_embedder(EMBEDDING_MODEL)
+        query_embedding = embedder.embed_query(query)
         
         # Search Pinecone for relevant context
-        search_results = index.query(
-            vector=query_embedding,
-            top_k=top_k,
-            include_metadata=True
-        )
-        
-        # Extract and format the context from search results
-        contexts = []
-        for match in search_results['matches']:
-            if 'metadata' in match and 'text' in match['metadata']:
-                contexts.append(match['metadata']['text'])
+        hits = search_pinecone(index, query_embedding, top_k)
         
         # Create a prompt that includes both the context and the original query
-        context_str = "\n\n".join(contexts)
+        context_str = "\n\n".join(hit["text"] for hit in hits)
         
         return context_str
     
+def benchmark_pinecone_upload(
+    num_vectors: int = 5000,
+    dimension: int = 768,
+    batch_sizes=(50, 100, 200),
+    worker_counts=(1, 4, 8),
+    latency_ms: float = 30.0,
+    per_vector_latency_ms: float = 0.05,
+    max_concurrent_requests: int = 8,
+) -> List[Dict[str, Any]]:
+    """Measure upsert throughput for each batch size / worker count against the local stand-in.
+    
+    latency_ms and per_vector_latency_ms simulate the round-trip and server cost of a
+    request; requests above max_concurrent_requests are throttled and retried.
+    """
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(num_vectors, dimension)).astype(np.float32)
+    documents = [{"text": f"benchmark document {i}"} for i in range(num_vectors)]
+    ids = [f"doc_{i}" for i in range(num_vectors)]
+    
+    results = []
+    for batch_size in batch_sizes:
+        for max_workers in worker_counts:
+            index = LocalPineconeIndex(dimension, latency_ms=latency_ms,
+                                       per_vector_latency_ms=per_vector_latency_ms,
+                                       max_concurrent_requests=max_concurrent_requests)
+            start = time.perf_counter()
+            upload_embeddings_to_pinecone(index, embeddings, documents, ids,
+                                          batch_size=batch_size, max_workers=max_workers)
+            elapsed = time.perf_counter() - start
+            assert index.describe_index_stats()["total_vector_count"] == num_vectors
+            results.append({
+                "batch_size": batch_size,
+                "max_workers": max_workers,
+                "vectors_per_sec": num_vectors / elapsed,
+                "requests": index.upsert_requests,
+                "throttled": index.throttled_requests,
+            })
+            print(results[-1])
+    return results
+
 def main():
     """Main function to upload embeddings to Pinecone. (testing and is not actually used in indexing script)"""
     # Initialize Pinecone
-    index = initialize_pinecone()
+    index = initialize_pinecone(dimension=768)
     
     
     sample_embeddings = [np.random.rand(768) for _ in range(5)]  
@@ -122,4 +247,8 @@ def main():
     print("\nQuery results:", query_results)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # python pinecone_vectordb.py benchmark measures upload throughput with no network
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        benchmark_pinecone_upload()
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,109 @@
+from typing import Dict, Optional
+import numpy as np
+
+## Dimensionality reduction for stored embeddings. A projection is fitted on the corpus
+## embeddings when an index is built, stored vectors are kept in the reduced space, and
+## every query embedding goes through the same projection before it is searched.
+##
+##   pca:<dim>       top right-singular vectors of the (uncentered) corpus matrix, so
+##                   at full dimension it is a rotation and cosine scores are unchanged
+##   truncate:<dim>  keep the first dims; only meaningful for Matryoshka-trained models
+
+# Corpus rows the PCA is fitted on; the SVD of a sample is enough for the top directions
+PCA_FIT_SAMPLES = 20000
+
+
+class PCAProjection:
+    """Projection onto the top output_dim principal directions of the corpus embeddings."""
+
+    method = "pca"
+
+    def __init__(self, output_dim: int, seed: int = 0):
+        self.output_dim = output_dim
+        self.seed = seed
+        self.components: Optional[np.ndarray] = None
+        # Share of the corpus's squared norm kept by the components, for reporting
+        self.explained_variance: float = 0.0
+
+    def fit(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.output_dim > vectors.shape[1]:
+            raise ValueError(f"Cannot project {vectors.shape[1]}-d embeddings up to {self.output_dim} dimensions")
+        if len(vectors) > PCA_FIT_SAMPLES:
+            rng = np.random.default_rng(self.seed)
+            vectors = vectors[rng.choice(len(vectors), PCA_FIT_SAMPLES, replace=False)]
+        # Eigenvectors of the dim x dim Gram matrix are the right-singular vectors, and much
+        # cheaper to get than an SVD of the whole sample
+        gram = vectors.T.astype(np.float64) @ vectors.astype(np.float64)
+        energy, eigenvectors = np.linalg.eigh(gram)
+        order = np.argsort(energy)[::-1]
+        energy = np.clip(energy[order], 0.0, None)
+        self.components = np.ascontiguousarray(eigenvectors[:, order[:self.output_dim]].T, dtype=np.float32)
+        self.explained_variance = float(energy[:self.output_dim].sum() / energy.sum()) if energy.sum() else 1.0
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float32) @ self.components.T
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"components": self.components, "explained_variance": np.array(self.explained_variance)}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.components = state["components"]
+        self.explained_variance = float(state["explained_variance"])
+
+
+class TruncateProjection:
+    """Prefix truncation for Matryoshka embeddings, whose leading dims carry the most signal."""
+
+    method = "truncate"
+
+    def __init__(self, output_dim: int):
+        self.output_dim = output_dim
+
+    def fit(self, vectors: np.ndarray):
+        if self.output_dim > np.shape(vectors)[1]:
+            raise ValueError(f"Cannot truncate {np.shape(vectors)[1]}-d embeddings to {self.output_dim} dimensions")
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float32)[:, :self.output_dim]
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        pass
+
+
+PROJECTIONS = {projection.method: projection for projection in (PCAProjection, TruncateProjection)}
+
+
+def make_projection(method: str, output_dim: int):
+    if method not in PROJECTIONS:
+        raise ValueError(f"Unknown projection method: {method} (expected one of {', '.join(PROJECTIONS)})")
+    return PROJECTIONS[method](output_dim)
+
+
+def parse_projection(spec: str):
+    """Projection for a "<method>:<dim>" spec such as "pca:256", or None for "none"."""
+    if not spec or spec == "none":
+        return None
+    method, _, output_dim = spec.partition(":")
+    if not output_dim.isdigit():
+        raise ValueError(f"Invalid projection spec: {spec} (expected <method>:<dim>, e.g. pca:256)")
+    return make_projection(method, int(output_dim))
+
+
+def describe_projection(projection) -> str:
+    return f"{projection.method}:{projection.output_dim}"
+
+
+def save_projection(projection, file):
+    np.savez(file, method=np.array(projection.method), output_dim=np.array(projection.output_dim),
+             **projection.state())
+
+
+def load_projection(path: str):
+    with np.load(path) as data:
+        projection = make_projection(str(data["method"]), int(data["output_dim"]))
+        projection.load_state({name: data[name] for name in data.files if name not in ("method", "output_dim")})
+    return projection
@@ -0,0 +1,166 @@
+from typing import Dict, Optional
+import numpy as np
+
+## Compact vector codes for the NumPy backend. A quantizer turns L2-normalized float32
+## vectors into float16 (2 bytes/dim), int8 (1 byte/dim, per-dimension calibrated range)
+## or binary (1 bit/dim) codes and scores queries against the codes directly. Scores are
+## approximate, so the index re-ranks the best candidates with the float32 vectors.
+
+# Rows of codes decoded per block while scoring, bounding the float32 temporaries
+SCORE_BLOCK_SIZE = 16384
+
+# Set bits in every byte value, for Hamming distances over packed bits
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+class Float16Quantizer:
+    """Half-precision copy of each vector; nearly lossless at half the memory."""
+
+    method = "float16"
+    # Candidates per requested result that get rescored with float32 vectors
+    rescore_factor = 2
+
+    def fit(self, vectors: np.ndarray):
+        pass
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float16)
+
+    def code_width(self, embedding_dim: int) -> int:
+        return embedding_dim
+
+    def embedding_dim(self, codes: np.ndarray) -> int:
+        return codes.shape[1]
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_SIZE):
+            block = codes[start:start + SCORE_BLOCK_SIZE]
+            scores[:, start:start + len(block)] = queries @ block.astype(np.float32).T
+        return scores
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        pass
+
+
+class Int8Quantizer:
+    """Scalar quantization: each dimension's [min, max] seen at fit time maps onto 256 levels.
+
+    A vector is reconstructed as low + scale * (code + 128), so a dot product with a
+    float32 query is query @ (low + 128 * scale) + (query * scale) @ code.
+    """
+
+    method = "int8"
+    rescore_factor = 4
+
+    def __init__(self):
+        self.low: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+
+    def fit(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.low = vectors.min(axis=0)
+        high = vectors.max(axis=0)
+        self.scale = (high - self.low) / 255.0
+        # Constant dimensions would divide by zero; any scale reconstructs them exactly
+        self.scale[self.scale == 0] = 1.0
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        # Vectors added after calibration are clipped to the calibrated range
+        levels = np.rint((np.asarray(vectors, dtype=np.float32) - self.low) / self.scale)
+        return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+    def code_width(self, embedding_dim: int) -> int:
+        return embedding_dim
+
+    def embedding_dim(self, codes: np.ndarray) -> int:
+        return codes.shape[1]
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        offsets = queries @ (self.low + 128 * self.scale)
+        weighted = queries * self.scale
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_SIZE):
+            block = codes[start:start + SCORE_BLOCK_SIZE]
+            scores[:, start:start + len(block)] = weighted @ block.astype(np.float32).T
+        scores += offsets[:, None]
+        return scores
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"low": self.low, "scale": self.scale}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.low = state["low"]
+        self.scale = state["scale"]
+
+
+class BinaryQuantizer:
+    """One bit per dimension: whether the value lies above that dimension's mean.
+
+    Queries are binarized the same way and compared by Hamming distance, which is very
+    cheap but coarse, so results should be rescored.
+    """
+
+    method = "binary"
+    rescore_factor = 10
+
+    def __init__(self):
+        self.mean: Optional[np.ndarray] = None
+
+    def fit(self, vectors: np.ndarray):
+        # Centering first keeps the bits balanced even when embeddings share an offset
+        self.mean = np.asarray(vectors, dtype=np.float32).mean(axis=0)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.packbits(np.asarray(vectors, dtype=np.float32) > self.mean, axis=1)
+
+    def code_width(self, embedding_dim: int) -> int:
+        return (embedding_dim + 7) // 8
+
+    def embedding_dim(self, codes: np.ndarray) -> int:
+        # Packed rows are padded to whole bytes
+        return len(self.mean)
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # 1 - 2 * hamming / dim: +1 for identical bits, -1 for opposite ones
+        embedding_dim = len(self.mean)
+        query_codes = self.encode(queries)
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_SIZE):
+            block = codes[start:start + SCORE_BLOCK_SIZE]
+            for row, query_code in enumerate(query_codes):
+                distances = _POPCOUNT[np.bitwise_xor(block, query_code)].sum(axis=1, dtype=np.int32)
+                scores[row, start:start + len(block)] = 1.0 - 2.0 * distances / embedding_dim
+        return scores
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"mean": self.mean}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.mean = state["mean"]
+
+
+QUANTIZERS = {
+    quantizer.method: quantizer
+    for quantizer in (Float16Quantizer, Int8Quantizer, BinaryQuantizer)
+}
+
+
+def make_quantizer(method: str):
+    if method not in QUANTIZERS:
+        raise ValueError(f"Unknown quantization method: {method} (expected one of {', '.join(QUANTIZERS)})")
+    return QUANTIZERS[method]()
+
+
+def save_quantizer(quantizer, file):
+    np.savez(file, method=np.array(quantizer.method), **quantizer.state())
+
+
+def load_quantizer(path: str):
+    with np.load(path) as data:
+        quantizer = make_quantizer(str(data["method"]))
+        quantizer.load_state({name: data[name] for name in data.files if name != "method"})
+    return quantizer
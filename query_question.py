@@ -1,29 +1,87 @@
-from llm_models.llama import LLM
-from chroma_vectordb import query_chroma
-from pinecone_vectordb import query_pinecone
-from redis_vectordb import query_redis
+import time
+from typing import Any, Dict, List, Optional
+from llm_models.llama import LLM, GENERATION_ERROR_PREFIX
+from embed import get_embedder
+from index_manifest import index_version
+from response_cache import SemanticResponseCache
+from tracing import span
+import chroma_vectordb
+import pinecone_vectordb
+import redis_vectordb
+import numpy_vectordb
+import hybrid_search
 
-def query_question(indexName, index, query, llm, prompt):
+# Search function, embedding model and manifest of every backend
+backend_map = {
+    "chroma": (chroma_vectordb.search_chroma, chroma_vectordb.EMBEDDING_MODEL, chroma_vectordb.MANIFEST_NAME),
+    "redis": (redis_vectordb.search_redis, redis_vectordb.EMBEDDING_MODEL, redis_vectordb.MANIFEST_NAME),
+    "pinecone": (pinecone_vectordb.search_pinecone, pinecone_vectordb.EMBEDDING_MODEL, pinecone_vectordb.MANIFEST_NAME),
+    "numpy": (numpy_vectordb.search_numpy, numpy_vectordb.EMBEDDING_MODEL, numpy_vectordb.MANIFEST_NAME),
+    # BM25 + vectors over the NumPy index (HYBRID_MODE picks rrf, rerank or bm25)
+    "hybrid": (hybrid_search.search_hybrid, hybrid_search.EMBEDDING_MODEL, hybrid_search.MANIFEST_NAME),
+}
+
+# Multi-query search function of every backend
+batch_search_map = {
+    "chroma": chroma_vectordb.search_chroma_many,
+    "redis": redis_vectordb.search_redis_many,
+    "pinecone": pinecone_vectordb.search_pinecone_many,
+    "numpy": numpy_vectordb.search_numpy_many,
+    "hybrid": hybrid_search.search_hybrid_many,
+}
+
+# Backends whose search also takes the query text, not just its embedding
+lexical_backends = {"hybrid"}
+
+def retrieve_many(indexName, index, queries: List[str], top_k=1) -> List[List[Dict[str, Any]]]:
+    """Embed all queries in one batched encoder call and search them together.
     
-    query_function_map = {
-        "chroma": query_chroma,
-        "redis": query_redis,
-        "pinecone": query_pinecone,
-    }
+    Returns one list of {"id", "text", "score"} hits per query, in the order of queries.
+    """
+    if not queries:
+        return []
+    _, embedding_model, _ = backend_map[indexName]
+    query_embeddings = get_embedder(embedding_model).embed_queries(queries)
+    if indexName in lexical_backends:
+        return batch_search_map[indexName](index, query_embeddings, top_k, query_texts=list(queries))
+    return batch_search_map[indexName](index, query_embeddings, top_k)
+
+def query_questions(indexName, index, queries: List[str], llm, prompt, top_k=1) -> List[str]:
+    """Answer many questions, retrieving context for all of them in one batch first."""
+    responses = []
+    for query, hits in zip(queries, retrieve_many(indexName, index, queries, top_k)):
+        chunk = "\n\n".join(hit["text"] for hit in hits)
+        responses.append(llm.generate_response(prompt.format(user_query=query, retrieved_passage=chunk)))
+    return responses
+
+def query_question(indexName, index, query, llm, prompt, cache: Optional[SemanticResponseCache] = None, top_k=1):
+    search, embedding_model, manifest_name = backend_map[indexName]
     
     # Get the chunk based on the index name
-    chunk = query_function_map[indexName](index, query)
+    with span("retrieve"):
+        query_embedding = get_embedder(embedding_model).embed_query(query)
+        if indexName in lexical_backends:
+            hits = search(index, query_embedding, top_k, query_text=query)
+        else:
+            hits = search(index, query_embedding, top_k)
+    chunk = "\n\n".join(hit["text"] for hit in hits)
+    chunk_ids = [hit["id"] for hit in hits]
+    
+    # Reuse the answer to an equivalent question over the same chunks, if there is one
+    version = index_version(manifest_name)
+    if cache is not None:
+        response = cache.lookup(query_embedding, chunk_ids, llm.model_name, prompt, version)
+        if response is not None:
+            return response
     
     # Format the prompt with the user query and retrieved chunks
-    context = prompt.format(user_query=query, retrieved_passage=chunk)
+    with span("prompt_build"):
+        context = prompt.format(user_query=query, retrieved_passage=chunk)
     
-    response = llm.generate_response(context)
+    start_time = time.perf_counter()
+    with span("generate"):
+        response = llm.generate_response(context)
+    if cache is not None and not response.startswith(GENERATION_ERROR_PREFIX):
+        cache.store(query_embedding, chunk_ids, llm.model_name, prompt, response,
+                    time.perf_counter() - start_time, version)
     return response
-    
-    
-    
-    
-    
-    
-    
-    
\ No newline at end of file
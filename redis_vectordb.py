@@ -1,117 +1,304 @@
 import os
+import sys
 import time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import numpy as np
 import redis
 from redis.commands.search.query import Query
+from redis.commands.search.indexDefinition import IndexDefinition
 from dotenv import load_dotenv
-from embed import NomicEmbedder
+from embed import NOMIC, get_embedder
 import base64
+from index_manifest import reset_manifest
 
 # Load environment variables
 load_dotenv()
 
 # Get Redis configuration from environment variables
 INDEX_NAME = "ds4300"
+# Embedding model used for this index
+EMBEDDING_MODEL = NOMIC
+# Name of the manifest tracking which files this index holds
+MANIFEST_NAME = f"redis_{INDEX_NAME}"
 
 
 
+# Vector index algorithm: FLAT is an exact linear scan, HNSW is an approximate graph index
+REDIS_INDEX_ALGORITHM = os.getenv("REDIS_INDEX_ALGORITHM", "FLAT")
+# HNSW parameters (ignored for FLAT)
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_RUNTIME = 10
+# Element type of stored vectors: FLOAT32, or FLOAT16 to halve vector memory. Set before
+# the index is created; uploads and queries must use the index's type
+REDIS_VECTOR_TYPE = os.getenv("REDIS_VECTOR_TYPE", "FLOAT32").upper()
+_VECTOR_DTYPES = {"FLOAT32": np.float32, "FLOAT16": np.float16}
+# Documents written per pipeline round-trip
+REDIS_PIPELINE_BATCH_SIZE = 500
+
+
+
+def _index_vector_type(info: Dict[str, Any]) -> Optional[str]:
+    """Element type of the embedding field from FT.INFO, or None if the server doesn't report it."""
+    for attribute in info.get("attributes", []):
+        fields = dict(zip(attribute[::2], attribute[1::2]))
+        fields = {str(key).lower(): value for key, value in fields.items()}
+        if fields.get("attribute") == "embedding" or fields.get("identifier") == "embedding":
+            data_type = fields.get("data_type")
+            return str(data_type).upper() if data_type is not None else None
+    return None
+
 # Initialize with the embedding dimension nomic embed text model uses
-def initialize_redis_index(embedding_dimension: int = 768):
-    """Initialize Redis vector index."""
+def initialize_redis_index(
+    embedding_dimension: int = 768,
+    algorithm: str = REDIS_INDEX_ALGORITHM,
+    m: int = HNSW_M,
+    ef_construction: int = HNSW_EF_CONSTRUCTION,
+    ef_runtime: int = HNSW_EF_RUNTIME,
+    index_name: str = INDEX_NAME,
+    key_prefix: Optional[str] = None,
+    vector_type: str = REDIS_VECTOR_TYPE,
+):
+    """Initialize Redis vector index.
+    
+    An existing index is reused as-is; drop it with delete_index to change the
+    algorithm, its parameters or the vector type. Reusing an index created with another
+    vector type raises a ValueError, since its vectors would not match. key_prefix restricts the index to
+    keys starting with it (by default every hash is indexed).
+    """
     
     # Initialize Redis client
     redis_client = redis.Redis(host="localhost", port="6379", decode_responses=True)
 
+    vector_type = vector_type.upper()
     try:
-        redis_client.ft(INDEX_NAME).info()
-        print(f"Index {INDEX_NAME} already exists")
+        info = redis_client.ft(index_name).info()
     except:
+        info = None
+    if info is not None:
+        print(f"Index {index_name} already exists")
+        # Vectors of another element type have the wrong byte length and are silently skipped
+        existing_type = _index_vector_type(info)
+        if existing_type is not None and existing_type != vector_type:
+            raise ValueError(f"Index {index_name} stores {existing_type} vectors, not {vector_type}; set "
+                             f"REDIS_VECTOR_TYPE={existing_type} or drop the index with delete_index first")
+    else:
+        algorithm = algorithm.upper()
+        if vector_type not in _VECTOR_DTYPES:
+            raise ValueError(f"Unsupported Redis vector type: {vector_type}")
+        attributes = {
+            "TYPE": vector_type,
+            "DIM": embedding_dimension,
+            "DISTANCE_METRIC": "COSINE",
+        }
+        if algorithm == "HNSW":
+            attributes.update({
+                "M": m,
+                "EF_CONSTRUCTION": ef_construction,
+                "EF_RUNTIME": ef_runtime,
+            })
+        elif algorithm != "FLAT":
+            raise ValueError(f"Unsupported Redis vector index algorithm: {algorithm}")
+        
         # Create index if it doesn't exist
-        redis_client.ft(INDEX_NAME).create_index(
+        definition = IndexDefinition(prefix=[key_prefix]) if key_prefix else None
+        redis_client.ft(index_name).create_index(
             fields=[
-                redis.commands.search.field.VectorField(
-                    "embedding",
-                    "FLAT",
-                    {
-                        "TYPE": "FLOAT32",
-                        "DIM": embedding_dimension,
-                        "DISTANCE_METRIC": "COSINE",
-                    },
-                ),
+                redis.commands.search.field.VectorField("embedding", algorithm, attributes),
                 redis.commands.search.field.TextField("text"),
-            ]
+            ],
+            definition=definition,
         )
-        print(f"Index {INDEX_NAME} created successfully.")
+        print(f"Index {index_name} created successfully ({algorithm}, {vector_type}, dim={embedding_dimension}).")
     return redis_client
 
 def upload_embeddings_to_redis(
     client,
     embeddings: List[np.ndarray],
-    documents: List[str]
+    documents: List[Dict[str, Any]],
+    ids: Optional[List[str]] = None,
+    batch_size: int = REDIS_PIPELINE_BATCH_SIZE,
+    key_prefix: str = "",
+    vector_type: str = REDIS_VECTOR_TYPE,
 ):
     """Upload embeddings to Redis vector database."""
     total_vectors = len(embeddings)
     print(f"Uploading {total_vectors} vectors to Redis...")
     
+    # Stored in the index's element type, so FLOAT16 hashes hold half the bytes
+    embeddings = np.asarray(embeddings, dtype=_VECTOR_DTYPES[vector_type.upper()])
     
-    # Use a pipeline for faster insertion
-    pipeline = client.pipeline()
+    # Non-transactional pipeline flushed every batch_size documents, so neither the
+    # client nor the server has to buffer the whole corpus in one MULTI/EXEC
+    pipeline = client.pipeline(transaction=False)
     for i in range(total_vectors):
-        vector_id = f"doc_{i}"
-        embedding = np.array(embeddings[i], dtype=np.float32)
+        vector_id = ids[i] if ids is not None else f"doc_{i}"
+        
+        # Store the embedding as bytes and text associated with the embedding in one HSET
+        mapping = {"text": documents[i]['text'], "embedding": embeddings[i].tobytes()}
+        if 'source' in documents[i]:
+            mapping["source"] = documents[i]['source']
+        pipeline.hset(f"{key_prefix}{vector_id}", mapping=mapping)
         
-        # Store the embedding as bytes and text associated with the embedding
-        pipeline.hset(vector_id, "text", documents[i]['text'])
-        pipeline.hset(vector_id, "embedding", embedding.tobytes())
+        if (i + 1) % batch_size == 0:
+            pipeline.execute()
     
     pipeline.execute()
     print(f"Successfully uploaded {total_vectors} vectors to Redis.")
 
-def query_redis(client, query_text: str, top_k: int = 1):
-    """Query the Redis index and return the most relevant context."""
-    # Embed the user query
-    embedder = NomicEmbedder()
-    query_embedding = embedder.embed_chunks([query_text])[0]
-    
-    # Ensure the query embedding is a numpy array of float32
-    if not isinstance(query_embedding, np.ndarray):
-        query_embedding = np.array(query_embedding, dtype=np.float32)
-    else:
-        query_embedding = query_embedding.astype(np.float32)
-    
-    # Convert the query embedding to bytes
-    query_embedding_bytes = query_embedding.tobytes()
+def _knn_query(top_k: int) -> Query:
+    # FT.SEARCH returns 10 results unless told otherwise, whatever K the KNN clause asks for
+    return Query(
+        f"*=>[KNN {top_k} @embedding $query_vector AS score]"
+    ).sort_by("score").paging(0, top_k).return_fields("text", "score").dialect(2)
+
+def _vector_bytes(vector, vector_type: str) -> bytes:
+    return np.asarray(vector, dtype=_VECTOR_DTYPES[vector_type.upper()]).tobytes()
+
+def search_redis(client, query_embedding: np.ndarray, top_k: int = 1, index_name: str = INDEX_NAME,
+                 vector_type: str = REDIS_VECTOR_TYPE) -> List[Dict[str, Any]]:
+    """Run a KNN search for one query embedding; returns [{"id", "text", "score"}], best first."""
+    # Query vectors must use the same element type as the indexed ones
+    query_embedding_bytes = _vector_bytes(query_embedding, vector_type)
     
     # Prepare the query
-    q = Query(
-        f"*=>[KNN {top_k} @embedding $query_vector AS score]"
-    ).sort_by("score").dialect(2)
+    q = _knn_query(top_k)
     
     params = {"query_vector": query_embedding_bytes}
     
     # Execute the query
-    results = client.ft(INDEX_NAME).search(q, query_params=params)
+    results = client.ft(index_name).search(q, query_params=params)
+    
+    # Redis returns cosine distances; report similarities like the other backends
+    return [
+        {"id": doc.id, "text": doc.text, "score": 1.0 - float(doc.score)}
+        for doc in results.docs if hasattr(doc, 'text')
+    ]
+
+def _decode(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+def search_redis_many(client, query_embeddings: np.ndarray, top_k: int = 1, index_name: str = INDEX_NAME,
+                      vector_type: str = REDIS_VECTOR_TYPE) -> List[List[Dict[str, Any]]]:
+    """Run one KNN search per query embedding in a single pipelined round-trip.
+    
+    Returns one hit list per query, in order, shaped like search_redis.
+    """
+    query_args = _knn_query(top_k).get_args()
+    pipeline = client.pipeline(transaction=False)
+    for query_embedding in query_embeddings:
+        pipeline.execute_command(
+            "FT.SEARCH", index_name, *query_args,
+            "PARAMS", 2, "query_vector", _vector_bytes(query_embedding, vector_type),
+        )
+    
+    # Raw replies are [total, key, [field, value, ...], key, [...], ...]
+    results = []
+    for reply in pipeline.execute():
+        hits = []
+        for key, fields in zip(reply[1::2], reply[2::2]):
+            fields = dict(zip(map(_decode, fields[::2]), map(_decode, fields[1::2])))
+            if "text" in fields:
+                hits.append({"id": _decode(key), "text": fields["text"], "score": 1.0 - float(fields["score"])})
+        results.append(hits)
+    return results
+
+def query_redis(client, query_text: str, top_k: int = 1, index_name: str = INDEX_NAME):
+    """Query the Redis index and return the most relevant context."""
+    # Embed the user query
+    embedder = get_embedder(EMBEDDING_MODEL)
+    query_embedding = embedder.embed_query(query_text)
     
     # Extract context from search results
-    contexts = []
-    for doc in results.docs:
-        if hasattr(doc, 'text'):
-            contexts.append(doc.text)
+    hits = search_redis(client, query_embedding, top_k, index_name)
     
     # Join contexts
-    context_str = "\n\n".join(contexts)
+    context_str = "\n\n".join(hit["text"] for hit in hits)
     return context_str
 
-def delete_index(redis_client):
-    """Delete the Redis index."""
-    redis_client.ft(INDEX_NAME).dropindex()
-    print(f"Index {INDEX_NAME} deleted.")
+def delete_index(redis_client, delete_documents: bool = False, index_name: str = INDEX_NAME):
+    """Delete the Redis index, and optionally the hashes it indexed."""
+    redis_client.ft(index_name).dropindex(delete_documents=delete_documents)
+    print(f"Index {index_name} deleted.")
+    if index_name == INDEX_NAME:
+        reset_manifest(MANIFEST_NAME)
+
+def delete_from_redis(redis_client, ids: List[str], batch_size: int = 1000):
+    """Delete chunks from Redis by key."""
+    for start in range(0, len(ids), batch_size):
+        redis_client.delete(*ids[start:start + batch_size])
+
+def benchmark_redis_index_types(
+    num_vectors: int = 10000,
+    embedding_dimension: int = 768,
+    num_queries: int = 200,
+    top_k: int = 5,
+    algorithms=("FLAT", "HNSW"),
+    vector_types=("FLOAT32", "FLOAT16"),
+) -> List[Dict[str, Any]]:
+    """Measure upload throughput, query latency, vector memory and recall per index configuration.
+    
+    Uses random unit vectors under a separate index name and key prefix per
+    configuration, and removes them afterwards, so the real index is untouched. Recall
+    is against exact float32 search, and memory is compared with the FLOAT32 index of
+    the same algorithm.
+    """
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(num_vectors, embedding_dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    documents = [{"text": f"benchmark document {i}"} for i in range(num_vectors)]
+    queries = vectors[rng.choice(num_vectors, num_queries, replace=False)]
+    expected = np.argsort(-(queries @ vectors.T), axis=1)[:, :top_k]
+    
+    results = []
+    for algorithm in algorithms:
+        float32_memory = None
+        for vector_type in vector_types:
+            name = f"{algorithm.lower()}_{vector_type.lower()}"
+            index_name = f"{INDEX_NAME}_bench_{name}"
+            key_prefix = f"bench_{name}:"
+            client = initialize_redis_index(embedding_dimension, algorithm=algorithm, index_name=index_name,
+                                            key_prefix=key_prefix, vector_type=vector_type)
+            try:
+                start = time.perf_counter()
+                upload_embeddings_to_redis(client, vectors, documents, key_prefix=key_prefix,
+                                           vector_type=vector_type)
+                # Wait until the index has caught up with the writes
+                while int(client.ft(index_name).info()["num_docs"]) < num_vectors:
+                    time.sleep(0.05)
+                upload_time = time.perf_counter() - start
+                
+                latencies = []
+                hits = 0
+                for query, query_expected in zip(queries, expected):
+                    query_start = time.perf_counter()
+                    found = search_redis(client, query, top_k, index_name, vector_type=vector_type)
+                    latencies.append((time.perf_counter() - query_start) * 1000)
+                    found_rows = {int(hit["id"][len(key_prefix) + len("doc_"):]) for hit in found}
+                    hits += len(found_rows & set(query_expected.tolist()))
+                
+                memory = float(client.ft(index_name).info().get("vector_index_sz_mb", 0.0))
+                if vector_type == "FLOAT32":
+                    float32_memory = memory
+                results.append({
+                    "algorithm": algorithm,
+                    "vector_type": vector_type,
+                    "upload_vectors_per_sec": num_vectors / upload_time,
+                    "mean_query_ms": float(np.mean(latencies)),
+                    "p95_query_ms": float(np.percentile(latencies, 95)),
+                    "vector_index_mb": memory,
+                    "memory_reduction": float32_memory / memory if float32_memory and memory else None,
+                    "recall_at_k": hits / (num_queries * top_k),
+                })
+                print(results[-1])
+            finally:
+                delete_index(client, delete_documents=True, index_name=index_name)
+    return results
 
 def main():
     """Main function to upload embeddings to Redis (for testing)."""
     # Initialize Redis index
-    embedder = NomicEmbedder()
+    embedder = get_embedder(EMBEDDING_MODEL)
     
     client = initialize_redis_index(embedding_dimension=embedder.get_embedding_dimension())
     
@@ -129,11 +316,15 @@ def main():
     
     
     # Upload embeddings to Redis
-    upload_embeddings_to_redis(client, sample_embeddings, sample_texts)
+    upload_embeddings_to_redis(client, sample_embeddings, [{"text": text} for text in sample_texts])
     
     # Query example
-    result = query(client, "when was redis found?", top_k=1)
+    result = query_redis(client, "when was redis found?", top_k=1)
     print("\nQuery result:", result)
 
 if __name__ == "__main__":
-    main()
+    # python redis_vectordb.py benchmark compares FLAT and HNSW, FLOAT32 and FLOAT16 on synthetic vectors
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        benchmark_redis_index_types()
+    else:
+        main()
@@ -0,0 +1,120 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+## Semantic cache of LLM answers. An answer can be reused when the new question
+## retrieved exactly the same chunks, for the same model, prompt template and index
+## version, and its embedding is within similarity_threshold (cosine) of a cached
+## question. This skips the multi-second generation for repeated questions.
+
+SIMILARITY_THRESHOLD = 0.95
+CACHE_TTL_SECONDS = 3600
+CACHE_MAX_ENTRIES = 1024
+
+
+@dataclass
+class _CacheEntry:
+    key: Tuple
+    embedding: np.ndarray
+    response: str
+    created_at: float
+    # How long the original generation took, i.e. the latency a hit saves
+    generation_time: float
+
+
+def template_id(prompt_template: str) -> str:
+    return hashlib.sha1(prompt_template.encode("utf-8")).hexdigest()[:12]
+
+
+class SemanticResponseCache:
+    def __init__(
+        self,
+        similarity_threshold: float = SIMILARITY_THRESHOLD,
+        ttl_seconds: float = CACHE_TTL_SECONDS,
+        max_entries: int = CACHE_MAX_ENTRIES,
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # Entries in least- to most-recently-used order
+        self._entries: "OrderedDict[int, _CacheEntry]" = OrderedDict()
+        # Exact key -> ids of entries sharing it, so lookups only compare embeddings within a key
+        self._by_key: Dict[Tuple, List[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+    @staticmethod
+    def _key(chunk_ids: List[str], model_name: str, prompt_template: str, index_version: str) -> Tuple:
+        return (model_name, template_id(prompt_template), tuple(chunk_ids), index_version)
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        return embedding / (np.linalg.norm(embedding) or 1.0)
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        siblings = self._by_key[entry.key]
+        siblings.remove(entry_id)
+        if not siblings:
+            del self._by_key[entry.key]
+
+    def lookup(self, query_embedding, chunk_ids: List[str], model_name: str,
+               prompt_template: str, index_version: str = "") -> Optional[str]:
+        """Return a cached answer for a semantically equivalent question, or None."""
+        key = self._key(chunk_ids, model_name, prompt_template, index_version)
+        query = self._normalize(query_embedding)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_score = None, self.similarity_threshold
+            for entry_id in list(self._by_key.get(key, [])):
+                entry = self._entries[entry_id]
+                if now - entry.created_at > self.ttl_seconds:
+                    self._remove(entry_id)
+                    continue
+                score = float(entry.embedding @ query)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+            self.hits += 1
+            self.latency_saved += entry.generation_time
+            return entry.response
+
+    def store(self, query_embedding, chunk_ids: List[str], model_name: str, prompt_template: str,
+              response: str, generation_time: float, index_version: str = ""):
+        key = self._key(chunk_ids, model_name, prompt_template, index_version)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _CacheEntry(key, self._normalize(query_embedding), response,
+                                                  time.monotonic(), generation_time)
+            self._by_key.setdefault(key, []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self):
+        """Drop every cached answer."""
+        with self._lock:
+            self._entries.clear()
+            self._by_key.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "latency_saved": self.latency_saved,
+            "entries": len(self._entries),
+        }
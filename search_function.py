@@ -1,8 +1,13 @@
 from pinecone import Pinecone
+import asyncio
 import os
-from typing import List, Dict, Any
-from llm_models.llama import LLM
-from embed import MPNetEmbedder
+import time
+from typing import List, Dict, Any, Iterator, Optional
+import ollama
+from llm_models.llama import LLM, GENERATION_ERROR_PREFIX
+from embed import SENTENCE_TRANSFORMER, get_embedder
+from index_manifest import index_version
+from response_cache import SemanticResponseCache
 from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
@@ -13,21 +18,64 @@ load_dotenv()
 # Get Pinecone API key and environment from environment variables
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 
+# Extract the chunk texts from a Pinecone query response
+def extract_contexts(search_results) -> List[str]:
+    contexts = []
+    for match in search_results['matches']:
+        if 'metadata' in match and 'text' in match['metadata']:
+            contexts.append(match['metadata']['text'])
+    return contexts
+
+# Identifies the build_rag_prompt template in cache keys; bump it when the template changes
+RAG_PROMPT_ID = "build_rag_prompt-v1"
+
+# Create a prompt that includes both the retrieved context and the original query
+def build_rag_prompt(user_query: str, contexts: List[str]) -> str:
+    context_str = "\n\n".join(contexts)
+    return f"""Use the following information to answer the question.
+
+Context information:
+{context_str}
+
+User question: {user_query}"""
+
 class RAGSearch:
     #Initialize the RAG search with Pinecone and LLM components
-    def __init__(self, index_name: str, llm_model_name: str = "llama3.2"):
+    def __init__(self, index_name: str, llm_model_name: str = "llama3.2", cache: Optional[SemanticResponseCache] = None):
         # Initialize the Pinecone client
         client = Pinecone(api_key=PINECONE_API_KEY)
         
         # Connect to the specified index
         self.index = client.Index(index_name)
         
-        # Initialize the embedder
-        self.embedder = MPNetEmbedder()
+        # Use the shared, already-warm embedder from the registry
+        self.embedder = get_embedder(SENTENCE_TRANSFORMER)
         
         # Initialize the LLM model
         self.llm = LLM(llm_model_name)
         
+        # Optional semantic cache of answers; invalidated when the index's manifest changes
+        self.cache = cache
+        self.manifest_name = f"pinecone_{index_name}"
+        
+    def _retrieve(self, user_query: str, top_k: int):
+        # 1. Embed the user query
+        query_embedding = self.embedder.embed_query(user_query)
+        
+        # 2. Search Pinecone for relevant context
+        search_results = self.index.query(
+            vector=query_embedding.tolist(),
+            top_k=top_k,
+            include_metadata=True
+        )
+        chunk_ids = [match['id'] for match in search_results['matches']]
+        
+        # 3. Extract and format the context from search results
+        contexts = extract_contexts(search_results)
+        
+        # 4. Create a prompt that includes both the context and the original query
+        return query_embedding, chunk_ids, build_rag_prompt(user_query, contexts)
+    
     def search_and_respond(self, user_query: str, top_k: int = 5) -> str:
         """
         Process a user query by embedding it, retrieving relevant context from Pinecone,
@@ -40,44 +88,139 @@ class RAGSearch:
         Returns:
             The LLM's response with context-enhanced knowledge
         """
-        # 1. Embed the user query
-        query_embedding = self.embedder.embed_chunks([user_query])[0].tolist()
-        
-        # 2. Search Pinecone for relevant context
-        search_results = self.index.query(
-            vector=query_embedding,
-            top_k=top_k,
-            include_metadata=True
-        )
-        
-        # 3. Extract and format the context from search results
-        contexts = []
-        for match in search_results['matches']:
-            if 'metadata' in match and 'text' in match['metadata']:
-                contexts.append(match['metadata']['text'])
+        query_embedding, chunk_ids, enhanced_prompt = self._retrieve(user_query, top_k)
         
-        # 4. Create a prompt that includes both the context and the original query
-        context_str = "\n\n".join(contexts)
-        enhanced_prompt = f"""Use the following information to answer the question.
-
-Context information:
-{context_str}
-
-User question: {user_query}"""
+        # Answer from the cache when an equivalent question retrieved the same chunks
+        if self.cache is not None:
+            version = index_version(self.manifest_name)
+            response = self.cache.lookup(query_embedding, chunk_ids, self.llm.model_name, RAG_PROMPT_ID, version)
+            if response is not None:
+                return response
 
         # 5. Send the enhanced prompt to the LLM and get the response
+        start_time = time.perf_counter()
         response = self.llm.generate_response(enhanced_prompt)
+        if self.cache is not None and not response.startswith(GENERATION_ERROR_PREFIX):
+            self.cache.store(query_embedding, chunk_ids, self.llm.model_name, RAG_PROMPT_ID, response,
+                             time.perf_counter() - start_time, version)
         
         return response
+    
+    def stream_search_and_respond(self, user_query: str, top_k: int = 5) -> Iterator[str]:
+        """Same as search_and_respond, but yields the response tokens as they are generated.
+        
+        A cached answer is yielded whole. Otherwise time-to-first-token and tokens/sec are
+        available from self.llm.last_metrics afterwards, and the answer is cached once the
+        stream has finished.
+        """
+        query_embedding, chunk_ids, enhanced_prompt = self._retrieve(user_query, top_k)
+        
+        if self.cache is not None:
+            version = index_version(self.manifest_name)
+            response = self.cache.lookup(query_embedding, chunk_ids, self.llm.model_name, RAG_PROMPT_ID, version)
+            if response is not None:
+                yield response
+                return
+        
+        start_time = time.perf_counter()
+        tokens = []
+        for token in self.llm.stream_response(enhanced_prompt):
+            tokens.append(token)
+            yield token
+        # Only reached when the stream completed, so partial or failed answers aren't cached
+        if self.cache is not None:
+            self.cache.store(query_embedding, chunk_ids, self.llm.model_name, RAG_PROMPT_ID, "".join(tokens),
+                             time.perf_counter() - start_time, version)
+
+# Maximum number of generations sent to the local Ollama server at once
+OLLAMA_MAX_CONCURRENCY = 2
+
+class AsyncRAGSearch:
+    """asyncio counterpart of RAGSearch for serving many users from one process.
+    
+    Every question runs as its own task: embedding and the Pinecone query run in worker
+    threads, and generation uses Ollama's async client behind a semaphore so the local
+    server is never asked for more than max_concurrent_generations answers at once.
+    Prompts are built exactly like RAGSearch.search_and_respond. Generation errors are
+    raised rather than returned as answers.
+    """
+    def __init__(
+        self,
+        index_name: str,
+        llm_model_name: str = "llama3.2",
+        max_concurrent_generations: int = OLLAMA_MAX_CONCURRENCY,
+    ):
+        client = Pinecone(api_key=PINECONE_API_KEY)
+        self.index = client.Index(index_name)
+        self.embedder = get_embedder(SENTENCE_TRANSFORMER)
+        self.llm_model_name = llm_model_name
+        self.max_concurrent_generations = max_concurrent_generations
+        # The async client and the limiter belong to the event loop they were created in,
+        # so they are made on first use in each loop (e.g. every asyncio.run call)
+        self._loop = None
+        self.ollama_client = None
+        self._ollama_limiter = None
+    
+    def _bind_to_running_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self.ollama_client = ollama.AsyncClient()
+            self._ollama_limiter = asyncio.Semaphore(self.max_concurrent_generations)
+            self._loop = loop
+    
+    async def _retrieve(self, user_query: str, top_k: int) -> List[str]:
+        query_embedding = (await asyncio.to_thread(self.embedder.embed_query, user_query)).tolist()
+        search_results = await asyncio.to_thread(
+            self.index.query, vector=query_embedding, top_k=top_k, include_metadata=True
+        )
+        return extract_contexts(search_results)
+    
+    async def _generate(self, prompt: str) -> str:
+        self._bind_to_running_loop()
+        async with self._ollama_limiter:
+            response = await self.ollama_client.chat(
+                model=self.llm_model_name, messages=[{"role": "user", "content": prompt}]
+            )
+            return response["message"]["content"]
+    
+    async def search_and_respond(self, user_query: str, top_k: int = 5, timeout: Optional[float] = None) -> str:
+        """Answer one question; raises asyncio.TimeoutError if it takes longer than timeout
+        seconds, and whatever retrieval or generation raised if it fails.
+        
+        Cancelling the calling task (or hitting the timeout) also releases its slot in
+        the Ollama limiter.
+        """
+        async def respond():
+            contexts = await self._retrieve(user_query, top_k)
+            return await self._generate(build_rag_prompt(user_query, contexts))
+        
+        return await asyncio.wait_for(respond(), timeout)
+    
+    async def answer_many(self, user_queries: List[str], top_k: int = 5, timeout: Optional[float] = None) -> List[Any]:
+        """Answer questions concurrently, in order; failed or timed-out entries hold their exception."""
+        return await asyncio.gather(
+            *(self.search_and_respond(query, top_k, timeout) for query in user_queries),
+            return_exceptions=True,
+        )
 
 def main():
     index_name = os.getenv("PINECONE_INDEX_NAME", "ds4300")
     model_name = "mistral"  
     
-    rag_search = RAGSearch(index_name, model_name)
+    # Repeated or rephrased questions over the same chunks are answered without the LLM
+    cache = SemanticResponseCache()
+    rag_search = RAGSearch(index_name, model_name, cache=cache)
     
     print("Welcome to RAG Search! Type 'exit' to quit.")
     
+    try:
+        ask_questions(rag_search)
+    finally:
+        stats = cache.stats()
+        print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%} hit rate), {stats['latency_saved']:.1f}s of generation saved")
+
+def ask_questions(rag_search: RAGSearch):
     while True:
         user_query = input("\nEnter your question: ")
         """
@@ -130,10 +273,23 @@ def main():
         if user_query.lower() == 'exit':
             print("Thank you for using RAG Search. Goodbye!")
             break
-        response = rag_search.search_and_respond(user_query)
-        
+        # Print tokens as they arrive instead of waiting for the whole answer
         print("\nResponse:")
-        print(response)
+        hits_before = rag_search.cache.hits
+        try:
+            for token in rag_search.stream_search_and_respond(user_query):
+                print(token, end="", flush=True)
+            print()
+        except Exception as e:
+            print(f"Error generating response: {e}")
+            continue
+        
+        if rag_search.cache.hits > hits_before:
+            print("\n(answered from the response cache)")
+            continue
+        metrics = rag_search.llm.last_metrics
+        if metrics is not None and metrics.time_to_first_token is not None:
+            print(f"\n(first token after {metrics.time_to_first_token:.2f}s, {metrics.tokens_per_sec:.1f} tokens/sec)")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,48 @@
+from bm25_index import BM25Index, reciprocal_rank_fusion
+
+## BM25 ranking, upserts/deletes and persistence
+
+TEXTS = {
+    "redis": "Redis keeps vectors in memory and answers KNN queries",
+    "chroma": "Chroma stores embeddings on disk with an HNSW graph",
+    "btree": "A B-tree keeps keys sorted so range queries are fast",
+    "avl": "An AVL tree rebalances with rotations after every insert",
+}
+
+
+def _index():
+    index = BM25Index()
+    index.add(TEXTS.values(), TEXTS.keys())
+    return index
+
+
+def test_search_ranks_matching_documents():
+    results = _index().search("AVL tree rotations", top_k=2)
+    assert [doc_id for doc_id, _ in results] == ["avl", "btree"]
+
+
+def test_upsert_and_delete():
+    index = _index()
+    index.add(["hash indexes answer point lookups"], ["btree"])
+    index.delete(["avl"])
+
+    assert len(index) == 3
+    assert index.search("tree rotations") == []
+    assert [doc_id for doc_id, _ in index.search("point lookups")] == ["btree"]
+
+
+def test_save_and_load(tmp_path):
+    index = _index()
+    index.delete(["chroma"])
+    path = str(tmp_path / "bm25.npz")
+    index.save(path)
+
+    loaded = BM25Index.load(path)
+    assert len(loaded) == len(index)
+    for query in ("KNN queries", "tree", "HNSW graph"):
+        assert loaded.search(query) == index.search(query)
+
+
+def test_reciprocal_rank_fusion_prefers_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "a", "d"], ["b", "c"]])
+    assert fused[0][0] == "b"
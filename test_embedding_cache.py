@@ -0,0 +1,73 @@
+import numpy as np
+import embedding_cache
+from embedding_cache import EmbeddingCache
+
+## Embedding cache persistence: log replay after a crash and stores shared by processes.
+## Two EmbeddingCache objects on one directory behave like two processes.
+
+DIM = 8
+
+
+def _vectors(count, seed):
+    return np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+
+
+def _assert_cached(cache, chunks, expected):
+    embeddings, missing = cache.lookup("model", chunks, DIM)
+    assert missing == []
+    np.testing.assert_array_equal(embeddings, expected)
+
+
+def test_log_is_replayed_without_a_flush(tmp_path):
+    chunks = [f"chunk {i}" for i in range(50)]
+    vectors = _vectors(len(chunks), 0)
+    # Never flushed, as if the process had been killed before exiting
+    EmbeddingCache(str(tmp_path)).store("model", chunks, vectors)
+
+    _assert_cached(EmbeddingCache(str(tmp_path)), chunks, vectors)
+
+
+def test_torn_log_line_is_ignored(tmp_path):
+    chunks = [f"chunk {i}" for i in range(5)]
+    vectors = _vectors(len(chunks), 1)
+    EmbeddingCache(str(tmp_path)).store("model", chunks, vectors)
+    with open(tmp_path / "model" / "index.log", "a", encoding="utf-8") as f:
+        f.write("0123456789abcdef 4")
+
+    cache = EmbeddingCache(str(tmp_path))
+    _assert_cached(cache, chunks, vectors)
+    # Entries appended after the torn line are still found
+    cache.store("model", ["later"], _vectors(1, 2))
+    _assert_cached(EmbeddingCache(str(tmp_path)), chunks + ["later"], np.vstack([vectors, _vectors(1, 2)]))
+
+
+def test_compaction_keeps_every_row(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "MIN_LOG_ENTRIES", 10)
+    cache = EmbeddingCache(str(tmp_path))
+    chunks = [f"chunk {i}" for i in range(40)]
+    vectors = _vectors(len(chunks), 3)
+    for start in range(0, len(chunks), 4):
+        cache.store("model", chunks[start:start + 4], vectors[start:start + 4])
+
+    _assert_cached(EmbeddingCache(str(tmp_path)), chunks, vectors)
+
+
+def test_two_writers_do_not_overwrite_each_other(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "MIN_LOG_ENTRIES", 16)
+    first, second = EmbeddingCache(str(tmp_path)), EmbeddingCache(str(tmp_path))
+    chunks = {cache: [] for cache in (first, second)}
+    vectors = {cache: [] for cache in (first, second)}
+    # Interleaved stores, enough to grow the vector file and compact the index
+    for step in range(40):
+        cache = first if step % 2 else second
+        batch = [f"{id(cache)} chunk {step} {i}" for i in range(60)]
+        embeddings = _vectors(len(batch), step)
+        cache.store("model", batch, embeddings)
+        chunks[cache] += batch
+        vectors[cache].append(embeddings)
+
+    reader = EmbeddingCache(str(tmp_path))
+    for cache in (first, second):
+        expected = np.vstack(vectors[cache])
+        _assert_cached(cache, chunks[cache], expected)
+        _assert_cached(reader, chunks[cache], expected)
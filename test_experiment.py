@@ -0,0 +1,40 @@
+import os
+from experiment import PipelineRun, RESULT_FIELDS, ResultLog, load_completed_keys, run_key
+from llm_models.llama import GENERATION_ERROR_PREFIX
+
+## Resuming a sweep from the results it already wrote
+
+
+def _run(question, answer="An answer"):
+    return PipelineRun(embedding_model="nomic-embed-text", database="redis", llm_model="llama3.2",
+                       chunk_size=200, overlap=50, question=question, prompt_id="prompt-1", answer=answer)
+
+
+def test_finished_runs_are_skipped_and_failed_runs_repeated(tmp_path):
+    path = str(tmp_path / "results.csv")
+    log = ResultLog(path)
+    log.append(_run("What is Redis?"))
+    log.append(_run("What is an AVL tree?", answer=f"{GENERATION_ERROR_PREFIX}: connection refused"))
+
+    assert load_completed_keys(path) == {run_key("redis", "llama3.2", 200, 50, "prompt-1", "What is Redis?")}
+
+
+def test_row_cut_short_by_a_crash_is_repeated(tmp_path):
+    path = str(tmp_path / "results.csv")
+    ResultLog(path).append(_run("What is Redis?"))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("nomic-embed-text,redis,llama3.2,two hundred")
+
+    assert load_completed_keys(path) == {run_key("redis", "llama3.2", 200, 50, "prompt-1", "What is Redis?")}
+
+
+def test_results_with_other_columns_are_moved_aside(tmp_path):
+    path = str(tmp_path / "results.csv")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("database,answer\nredis,old\n")
+
+    ResultLog(path).append(_run("What is Redis?"))
+
+    with open(path, encoding="utf-8") as f:
+        assert f.readline().strip() == ",".join(RESULT_FIELDS)
+    assert len(os.listdir(tmp_path)) == 2
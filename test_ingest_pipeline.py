@@ -0,0 +1,89 @@
+import numpy as np
+from index_manifest import IndexManifest
+from ingest_pipeline import run_incremental_ingestion
+
+## Incremental ingestion with deduplication, run on text pages instead of PDFs
+
+SHARED = "shared recap slide about gradient descent and learning rates today"
+
+
+class _FakeEmbedder:
+    model_name = "fake"
+
+    def embed_chunks(self, chunks, **kwargs):
+        return np.ones((len(chunks), 4), dtype=np.float32)
+
+
+class _Store:
+    def __init__(self):
+        self.texts = {}
+
+    def upload_batch(self, embeddings, documents, ids):
+        for document, document_id in zip(documents, ids):
+            self.texts[document_id] = document["text"]
+
+    def delete_ids(self, ids):
+        for document_id in ids:
+            self.texts.pop(document_id, None)
+
+
+def _ingest(directory, files, store, manifest):
+    # Only the manifest's file hashes read the directory; the text comes from pages
+    for filename, text in files.items():
+        (directory / filename).write_text(text)
+    pages = [(filename, text) for filename, text in sorted(files.items())]
+    return run_incremental_ingestion(
+        str(directory), _FakeEmbedder(), store.upload_batch, store.delete_ids, manifest,
+        chunk_size=10, overlap=0, pages=pages, chunk_unit="words", dedup=True,
+    )
+
+
+def test_duplicates_are_stored_once(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    store = _Store()
+    manifest = IndexManifest("test", str(tmp_path / "manifests"))
+    files = {"a.pdf": f"{SHARED} alpha beta gamma delta epsilon zeta eta theta iota kappa",
+             "b.pdf": f"{SHARED} one two three four five six seven eight nine ten"}
+    statistics = _ingest(docs, files, store, manifest)
+
+    assert list(store.texts.values()).count(SHARED) == 1
+    assert statistics["dedup"]["exact_duplicates"] == 1
+    assert set(manifest.chunk_ids("a.pdf")) & set(manifest.chunk_ids("b.pdf"))
+
+
+def test_editing_a_file_keeps_duplicates_of_other_files(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    store = _Store()
+    manifest = IndexManifest("test", str(tmp_path / "manifests"))
+    files = {"a.pdf": f"{SHARED} alpha beta gamma delta epsilon zeta eta theta iota kappa",
+             "b.pdf": f"{SHARED} one two three four five six seven eight nine ten"}
+    _ingest(docs, files, store, manifest)
+
+    # a.pdf drops the shared passage; b.pdf is untouched but relied on a.pdf's copy
+    files["a.pdf"] = "completely new opening words for the first file of this small corpus"
+    statistics = _ingest(docs, files, store, manifest)
+
+    assert statistics["files_changed"] == 2
+    assert SHARED in store.texts.values()
+    for filename in files:
+        for document_id in manifest.chunk_ids(filename):
+            assert document_id in store.texts
+    assert len(store.texts) == manifest.chunk_count()
+
+
+def test_unchanged_files_are_skipped(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    store = _Store()
+    manifest = IndexManifest("test", str(tmp_path / "manifests"))
+    files = {"a.pdf": "alpha beta gamma", "b.pdf": "one two three"}
+    _ingest(docs, files, store, manifest)
+
+    files["a.pdf"] = "alpha beta gamma delta"
+    statistics = _ingest(docs, files, store, manifest)
+
+    assert statistics["files_changed"] == 1
+    assert statistics["files_unchanged"] == 1
+    assert sorted(store.texts.values()) == ["alpha beta gamma delta", "one two three"]
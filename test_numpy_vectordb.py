@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from numpy_vectordb import NumpyVectorIndex, evaluate_projection
+
+## Recall of the approximate NumPy search paths against exact search
+
+
+def _clustered(count, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((32, dim))
+    vectors = centers[rng.integers(0, len(centers), count)] + 0.3 * rng.standard_normal((count, dim))
+    return vectors.astype(np.float32)
+
+
+def _index(count=3000, dim=32):
+    vectors = _clustered(count, dim)
+    ids = [f"doc_{row}" for row in range(count)]
+    index = NumpyVectorIndex()
+    index.add(vectors, ids, ids)
+    return index
+
+
+def _recall(found, expected):
+    return float(np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, expected)]))
+
+
+@pytest.fixture(scope="module")
+def queries():
+    return _clustered(100, 32, seed=1)
+
+
+def test_ivf_recall(queries):
+    index = _index()
+    exact = index.search(queries, 10, exact=True)[1]
+    index.build_ann(nprobe=16)
+    assert _recall(index.search(queries, 10)[1], exact) >= 0.9
+
+
+@pytest.mark.parametrize("method, min_recall", [("float16", 0.99), ("int8", 0.9)])
+def test_quantized_recall_with_rescoring(queries, method, min_recall):
+    index = _index()
+    exact = index.search(queries, 10, exact=True)[1]
+    index.quantize(method)
+    assert _recall(index.search(queries, 10, rescore=True)[1], exact) >= min_recall
+
+
+def test_binary_rescoring_improves_recall(queries):
+    # One bit per dimension is too coarse for a fixed bar; rescoring must still help
+    index = _index()
+    exact = index.search(queries, 10, exact=True)[1]
+    index.quantize("binary")
+    coarse = _recall(index.search(queries, 10, rescore=False)[1], exact)
+    assert _recall(index.search(queries, 10, rescore=True)[1], exact) > coarse
+
+
+def test_quantized_ivf_uses_codes(queries):
+    index = _index()
+    exact = index.search(queries, 10, exact=True)[1]
+    index.quantize("int8")
+    index.build_ann(nprobe=16)
+    index.drop_float32()
+    assert _recall(index.search(queries, 10)[1], exact) >= 0.8
+
+
+def test_save_and_load_codes_only(tmp_path, queries):
+    index = _index()
+    index.quantize("int8")
+    index.drop_float32()
+    expected = index.search(queries, 5)
+    index.save(str(tmp_path))
+
+    loaded = NumpyVectorIndex.load(str(tmp_path))
+    assert not loaded.has_float32
+    np.testing.assert_array_equal(loaded.search(queries, 5)[1], expected[1])
+
+
+def test_evaluate_projection_on_a_projected_index(queries):
+    index = _index()
+    index.project("pca", 16)
+    report = evaluate_projection(index, queries, [8, 16], top_k=5, repeat=1)
+    assert [row["dim"] for row in report] == [16, 8, 16]
+    assert report[-1]["recall"] > 0.99
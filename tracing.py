@@ -0,0 +1,204 @@
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import psutil
+
+## Lightweight tracing for the experiment pipeline. Stages are wrapped in named spans
+## (load, extract, chunk, embed, upload, retrieve, prompt_build, generate) timed with the
+## monotonic clock, while a background thread samples the process RSS so each span gets
+## the true peak it reached, including short spikes inside embedding. Spans of the same
+## name are aggregated, so per-page or per-batch spans stay cheap. Spans nest per thread,
+## and a span's time excludes the spans opened inside it, so stage times add up.
+##
+##   with Tracer() as tracer:
+##       ...code calling span("embed") etc...
+##   tracer.summary()
+
+# Seconds between RSS samples taken by the background sampler
+RSS_SAMPLE_INTERVAL = 0.005
+# Allocation sites reported per span when tracemalloc attribution is on
+TOP_ALLOCATIONS = 5
+
+_MB = 1024 * 1024
+
+
+@dataclass
+class SpanStats:
+    """Aggregate of every span with one name"""
+    name: str
+    count: int = 0
+    # Time inside the span excluding nested spans, and including them
+    total_time: float = 0.0
+    inclusive_time: float = 0.0
+    max_time: float = 0.0
+    # Highest process RSS seen while any span of this name was open, and RSS when the first one began
+    peak_rss_mb: float = 0.0
+    start_rss_mb: Optional[float] = None
+    # Largest tracemalloc growth within one span, with the sites that allocated most
+    alloc_peak_mb: float = 0.0
+    top_allocations: List[str] = field(default_factory=list)
+
+
+class Tracer:
+    """Collects spans from every thread of one run and samples peak RSS while active."""
+
+    def __init__(self, sample_interval: float = RSS_SAMPLE_INTERVAL, trace_allocations: bool = False):
+        # trace_allocations snapshots tracemalloc around every span: precise attribution, but
+        # it slows the run down a lot, so it is meant for one-off investigations
+        self.sample_interval = sample_interval
+        self.trace_allocations = trace_allocations
+        self.stats: Dict[str, SpanStats] = {}
+        self.peak_rss_mb = 0.0
+        self._process = psutil.Process()
+        self._lock = threading.Lock()
+        # Names of the spans currently open, with how many of each (spans can overlap across threads)
+        self._open: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._started_tracemalloc = False
+        self._token = None
+        # Per-thread stack of [elapsed time of nested spans] for the spans open on that thread
+        self._stacks = threading.local()
+
+    def _rss_mb(self) -> float:
+        return self._process.memory_info().rss / _MB
+
+    def _sample(self):
+        rss = self._rss_mb()
+        with self._lock:
+            self.peak_rss_mb = max(self.peak_rss_mb, rss)
+            for name in self._open:
+                stats = self.stats[name]
+                stats.peak_rss_mb = max(stats.peak_rss_mb, rss)
+
+    def _run_sampler(self):
+        while not self._stop.wait(self.sample_interval):
+            self._sample()
+
+    def start(self) -> "Tracer":
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._run_sampler, name="tracer-rss", daemon=True)
+        self._sampler.start()
+        self._token = _activate(self)
+        return self
+
+    def stop(self):
+        _deactivate(self._token)
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self._sample()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def __enter__(self) -> "Tracer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @contextmanager
+    def span(self, name: str):
+        rss = self._rss_mb()
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = SpanStats(name)
+            if stats.start_rss_mb is None:
+                stats.start_rss_mb = rss
+            stats.peak_rss_mb = max(stats.peak_rss_mb, rss)
+            self._open[name] = self._open.get(name, 0) + 1
+        snapshot = tracemalloc.take_snapshot() if self.trace_allocations and tracemalloc.is_tracing() else None
+        stack = self._stacks.__dict__.setdefault("stack", [])
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            elapsed = time.perf_counter() - start
+            children_time = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            allocations = None
+            if snapshot is not None:
+                allocations = tracemalloc.take_snapshot().compare_to(snapshot, "lineno")
+            rss = self._rss_mb()
+            with self._lock:
+                stats.count += 1
+                stats.total_time += elapsed - children_time
+                stats.inclusive_time += elapsed
+                stats.max_time = max(stats.max_time, elapsed)
+                stats.peak_rss_mb = max(stats.peak_rss_mb, rss)
+                self.peak_rss_mb = max(self.peak_rss_mb, rss)
+                self._open[name] -= 1
+                if self._open[name] == 0:
+                    del self._open[name]
+                if allocations is not None:
+                    growth = sum(max(0, diff.size_diff) for diff in allocations) / _MB
+                    if growth >= stats.alloc_peak_mb:
+                        stats.alloc_peak_mb = growth
+                        stats.top_allocations = [str(diff) for diff in allocations[:TOP_ALLOCATIONS]]
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """{span name: {"count", "time", "inclusive_time", "max_time", "peak_rss_mb", "rss_growth_mb", ...}}"""
+        with self._lock:
+            summary = {}
+            for name, stats in self.stats.items():
+                summary[name] = {
+                    "count": stats.count,
+                    "time": stats.total_time,
+                    "inclusive_time": stats.inclusive_time,
+                    "max_time": stats.max_time,
+                    "peak_rss_mb": stats.peak_rss_mb,
+                    # How far RSS rose above where it stood when the stage began
+                    "rss_growth_mb": stats.peak_rss_mb - (stats.start_rss_mb or stats.peak_rss_mb),
+                }
+                if self.trace_allocations:
+                    summary[name]["alloc_peak_mb"] = stats.alloc_peak_mb
+                    summary[name]["top_allocations"] = stats.top_allocations
+            return summary
+
+    def stage_time(self, name: str) -> float:
+        stats = self.stats.get(name)
+        return stats.total_time if stats else 0.0
+
+
+class _NullTracer:
+    """Stand-in used when no Tracer is active, so instrumented code costs ~nothing."""
+
+    @contextmanager
+    def span(self, name: str):
+        yield None
+
+
+NULL_TRACER = _NullTracer()
+
+# Tracer of the run the calling thread belongs to. Worker threads don't inherit it, so
+# code that starts threads should grab current_tracer() first and hand it over.
+_local = threading.local()
+
+
+def _activate(tracer: Tracer):
+    previous = getattr(_local, "tracer", None)
+    _local.tracer = tracer
+    return previous
+
+
+def _deactivate(previous):
+    _local.tracer = previous
+
+
+def current_tracer():
+    return getattr(_local, "tracer", None) or NULL_TRACER
+
+
+def span(name: str):
+    """Span on the calling thread's active tracer (a no-op without one)."""
+    return current_tracer().span(name)
@@ -0,0 +1,64 @@
+import os
+import sys
+from typing import List, Optional
+from ingest_pipeline import run_multi_incremental_ingestion
+from upload_to_chroma import chroma_target
+from upload_to_redis import redis_target
+from upload_to_pinecone import pinecone_target
+from upload_to_numpy import numpy_target, finish_numpy_upload
+
+## Populate several vector stores from one pass over the PDFs: every file is loaded and
+## chunked once, chunks are embedded once per embedding model (pinecone and numpy share
+## one) and the stores are uploaded to concurrently.
+
+target_factories = {
+    "chroma": chroma_target,
+    "redis": redis_target,
+    "pinecone": pinecone_target,
+    "numpy": numpy_target,
+}
+
+# Work a store needs once all of its chunks are in
+finish_upload = {
+    "numpy": finish_numpy_upload,
+}
+
+def perform_upload_all(path: str, chunk_size: int, overlap: int, backends: Optional[List[str]] = None):
+    backends = backends or list(target_factories)
+    unknown = [backend for backend in backends if backend not in target_factories]
+    if unknown:
+        raise ValueError(f"Unknown backends: {', '.join(unknown)}")
+    print(f"Processing documents from {path} for {', '.join(backends)}")
+
+    targets = [target_factories[backend]() for backend in backends]
+    result = run_multi_incremental_ingestion(path, targets, chunk_size, overlap)
+
+    for target in targets:
+        statistics = result["targets"][target.name]
+        if target.name in finish_upload and statistics["indexed_chunks"]:
+            finish_upload[target.name](target.index)
+        print(f"{target.name}: {statistics['chunk_count']} chunks uploaded in {statistics['upload_time']:.2f}s "
+              f"(done after {statistics['upload_done_time']:.2f}s), {statistics['indexed_chunks']} indexed")
+    for model_name, embed_time in result["embed_time_by_model"].items():
+        print(f"Embedding with {model_name}: {embed_time:.2f}s")
+    print(f"Total wall-clock time: {result['wall_time']:.2f}s")
+
+    return {target.name: target.index for target in targets}, result
+
+def main():
+    if len(sys.argv) < 2:
+        print("Please provide a directory path containing PDF documents")
+        print(f"Usage: python upload_to_all.py <directory_path> [{'|'.join(target_factories)} ...]")
+        return
+
+    directory_path = sys.argv[1]
+
+    if not os.path.isdir(directory_path):
+        print(f"Error: {directory_path} is not a valid directory")
+        return
+
+    # Only new or changed PDFs are re-embedded; stale chunks are removed from each store
+    return perform_upload_all(directory_path, chunk_size=500, overlap=100, backends=sys.argv[2:] or None)
+
+if __name__ == "__main__":
+    main()
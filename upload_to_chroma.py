@@ -1,78 +1,40 @@
 import os
 import sys
-from typing import List, Dict, Any
-import numpy as np
-from document_loader import load_documents
-from embed import MxbaiEmbedder
-from chroma_vectordb import initialize_chroma, upload_embeddings_to_chroma
-from chunking import chunk_text
-import time
+from embed import get_embedder
+from chroma_vectordb import EMBEDDING_MODEL, initialize_chroma, upload_embeddings_to_chroma, MANIFEST_NAME, delete_from_chroma
+from ingest_pipeline import IngestTarget, run_incremental_ingestion
+from index_manifest import IndexManifest
 
-def process_documents(directory_path: str, chunk_size: int = 500, overlap: int = 100) -> tuple:
-    """Process documents from a directory, create chunks, and embed them."""
-    # Load documents
-    documents = load_documents(directory_path)
-    
-    if not documents:
-        print("No documents found.")
-        return [], []
-    
-    # Initialize embedder
-    embedder = MxbaiEmbedder()
-    
-    all_chunks = []
-    
-    # Process each document
-    embed_start_time = time.time()
-    for filename, pages in documents.items():
-        # print(f"Processing {filename}...")
-        
-        # Combine all pages into a single text
-        complete_text = ""
-        for page in pages:
-            complete_text += page.page_content + " "
-        
-        # Create chunks from the document
-        chunks = chunk_text(complete_text, chunk_size, overlap)
-        # print(f"Created {len(chunks)} chunks from {filename}")
-        
-        
-        
-        # Add to master lists
-        all_chunks.extend(chunks)
+def chroma_target() -> IngestTarget:
+    """Open the Chroma collection and describe how ingestion writes to it."""
+    index = initialize_chroma()
+
+    def upload_batch(embeddings, documents, ids):
+        upload_embeddings_to_chroma(index, embeddings, [document["text"] for document in documents], ids)
     
-    # Embed all chunks
-    print(f"Embedding {len(all_chunks)} chunks...")
-    embeddings = embedder.embed_chunks(all_chunks)
-    embed_time = time.time() - embed_start_time
-    print(f"Successfully embedded {len(embeddings)} chunks")
+    # An empty index (e.g. wiped outside of this script) cannot trust the manifest
+    manifest = IndexManifest(MANIFEST_NAME)
+    if index.count() == 0:
+        manifest.reset()
     
-    return embeddings, all_chunks, embed_time
+    return IngestTarget("chroma", get_embedder(EMBEDDING_MODEL), upload_batch,
+                        lambda ids: delete_from_chroma(index, ids), manifest, index)
 
 def perform_upload_chroma(path: str, chunk_size: int, overlap: int):
-    
     print(f"Processing documents from {path}")
     
-    # Process documents (load, chunk, embed)
-    embeddings, metadata, embed_time = process_documents(path, chunk_size, overlap)
+    # Stream new or changed documents through load -> chunk -> embed -> upload
+    target = chroma_target()
+    statistics = run_incremental_ingestion(
+        path, target.embedder, target.upload_batch, target.delete_ids, target.manifest, chunk_size, overlap
+    )
     
-    if len(embeddings) == 0:
+    if statistics["indexed_chunks"] == 0:
         print("No embeddings were generated. Exiting...")
         return
-    
-    # Upload to Redis
-    upload_start_time = time.time()
-    index = initialize_chroma()
-    upload_embeddings_to_chroma(index, embeddings, metadata)
-    upload_time = time.time() - upload_start_time
     print("Process completed successfully!")
     
-    statistics = {
-        "embed_time": embed_time,
-        "upload_time": upload_time,
-        "chunk_count": len(embeddings),
-     }
-    return index, statistics
+    return target.index, statistics
 
 def main():
     if len(sys.argv) < 2:
@@ -86,21 +48,8 @@ def main():
         print(f"Error: {directory_path} is not a valid directory")
         return
     
-    print(f"Processing documents from {directory_path}")
-    
-    # Process documents (load, chunk, embed)
-    embeddings, metadata, embed_time = process_documents(directory_path)
-    
-    if len(embeddings) == 0:
-        print("No embeddings were generated. Exiting...")
-        return
-    
-    # Upload to Redis
-    index = initialize_chroma()
-    print("metadata[0]:", metadata[0])
-    upload_embeddings_to_chroma(index, embeddings, metadata)
-    print("Process completed successfully!")
-    return index
+    # Only new or changed PDFs are re-embedded; stale chunks are removed
+    return perform_upload_chroma(directory_path, chunk_size=500, overlap=100)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,113 @@
+import os
+import sys
+from embed import MATRYOSHKA_MODELS, get_embedder
+from numpy_vectordb import (
+    ANN_MIN_VECTORS, EMBEDDING_MODEL, KEEP_FLOAT32, LEXICAL_INDEX, MANIFEST_NAME, NUMPY_PERSIST_DIR, PROJECTION,
+    QUANTIZATION, QUANTIZED_RESCORE,
+    delete_from_numpy, initialize_numpy_index, upload_embeddings_to_numpy,
+)
+from ingest_pipeline import IngestTarget, run_incremental_ingestion
+from index_manifest import IndexManifest
+from projection import describe_projection, parse_projection
+
+def numpy_target() -> IngestTarget:
+    """Open the NumPy index and describe how ingestion writes to it."""
+    index = initialize_numpy_index()
+
+    def upload_batch(embeddings, documents, ids):
+        upload_embeddings_to_numpy(index, embeddings, [document["text"] for document in documents], ids)
+
+    # An empty index (e.g. wiped outside of this script) cannot trust the manifest
+    manifest = IndexManifest(MANIFEST_NAME)
+    if len(index) == 0:
+        manifest.reset()
+
+    return IngestTarget("numpy", get_embedder(EMBEDDING_MODEL), upload_batch,
+                        lambda ids: delete_from_numpy(index, ids), manifest, index)
+
+def _finish_lexical(index):
+    # BM25 over the same chunks for lexical and hybrid search; kept up to date on later writes
+    if LEXICAL_INDEX and index.lexical is None:
+        index.build_lexical()
+    elif not LEXICAL_INDEX and index.lexical is not None:
+        index.lexical = None
+        index.dirty = True
+
+def finish_numpy_upload(index):
+    # A codes-only index can't be projected, clustered or re-quantized; only BM25 and saving apply
+    if not index.has_float32:
+        print(f"NumPy index keeps only {index.quantizer.method} codes; projection, ANN and quantization "
+              f"settings are left as they are until it is re-uploaded with NUMPY_KEEP_FLOAT32=1")
+        _finish_lexical(index)
+        if index.dirty:
+            index.save(NUMPY_PERSIST_DIR)
+        return
+
+    # Fit the projection on the corpus once; later uploads are projected on the way in
+    projection = parse_projection(PROJECTION)
+    if projection is not None and index.projection is None:
+        if projection.method == "truncate" and EMBEDDING_MODEL not in MATRYOSHKA_MODELS:
+            print(f"Warning: {EMBEDDING_MODEL} is not Matryoshka-trained; truncation will cost recall, consider pca")
+        index.project(projection.method, projection.output_dim)
+    elif index.projection is not None and PROJECTION != describe_projection(index.projection):
+        print(f"Index is projected with {describe_projection(index.projection)}, not {PROJECTION}; "
+              f"clear it and re-upload to change the projection")
+
+    _finish_lexical(index)
+
+    # Large corpora get an approximate index; it is kept up to date on later inserts
+    if index.ann is None and len(index) >= ANN_MIN_VECTORS:
+        index.build_ann()
+
+    # Search over compact codes, calibrated once on the whole corpus (later inserts reuse it)
+    if QUANTIZATION != "none" and (index.quantizer is None or index.quantizer.method != QUANTIZATION):
+        index.quantize(QUANTIZATION)
+    elif QUANTIZATION == "none" and index.quantizer is not None:
+        index.dequantize()
+
+    # Codes-only storage, so memory and disk shrink by the full quantization factor
+    if index.quantizer is not None and not KEEP_FLOAT32:
+        if QUANTIZED_RESCORE:
+            print("NUMPY_KEEP_FLOAT32=0 needs NUMPY_QUANTIZED_RESCORE=0; keeping the float32 rows for rescoring")
+        else:
+            index.drop_float32()
+
+    # Persist so the next process can memory-map the index instead of rebuilding it
+    if index.dirty:
+        index.save(NUMPY_PERSIST_DIR)
+
+def perform_upload_numpy(path: str, chunk_size: int, overlap: int):
+    print(f"Processing documents from {path}")
+
+    # Stream new or changed documents through load -> chunk -> embed -> upload
+    target = numpy_target()
+    statistics = run_incremental_ingestion(
+        path, target.embedder, target.upload_batch, target.delete_ids, target.manifest, chunk_size, overlap
+    )
+
+    if statistics["indexed_chunks"] == 0:
+        print("No embeddings were generated. Exiting...")
+        return
+
+    finish_numpy_upload(target.index)
+    print("Process completed successfully!")
+
+    return target.index, statistics
+
+def main():
+    if len(sys.argv) < 2:
+        print("Please provide a directory path containing PDF documents")
+        print("Usage: python upload_to_numpy.py <directory_path>")
+        return
+
+    directory_path = sys.argv[1]
+
+    if not os.path.isdir(directory_path):
+        print(f"Error: {directory_path} is not a valid directory")
+        return
+
+    # Only new or changed PDFs are re-embedded; stale chunks are removed
+    return perform_upload_numpy(directory_path, chunk_size=500, overlap=100)
+
+if __name__ == "__main__":
+    main()